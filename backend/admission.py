@@ -0,0 +1,241 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    Caps the number of upstream connections, globally (max_connections) and
+    per user (max_per_user, counted per account; the default of 2 lets a
+    replacement overlap the connection it replaces), with a bounded FIFO
+    wait queue for requests over the limit.
+
+    request(session_id, admit, user_id) calls admit() right away if there is
+    room and returns 0; otherwise the request is queued and its 1-based
+    position is returned, or None if the queue is full (a rejection). A
+    request without a user_id counts against its session's own cap. Every
+    admitted request holds a slot until release(session_id); releasing
+    admits the oldest waiter whose user is under their own cap, so one user
+    at their cap never blocks the others. on_position(session_id, position)
+    is called when a request is queued and whenever a waiter moves up the
+    queue.
+
+    Connections opened ahead of demand (the warm pool) hold slots too, taken
+    with reserve() and given back with unreserve(). Sessions come first:
+    reserve() fails while anyone waits, and when the global cap would make a
+    request wait, reclaim() is called to close an idle reserved connection.
+    If it returns True, that connection's slot passes straight to the
+    request (the owner does not unreserve it); False means none is idle.
+
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, max_connections=0, max_per_user=2, max_queue=1000, on_position=None, reclaim=None):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.on_position = on_position
+        self.reclaim = reclaim
+        self._lock = threading.Lock()
+        self._active = 0
+        self._reserved = 0
+        self._per_session = collections.Counter()
+        self._per_user = collections.Counter()
+        self._users = {}  # session_id -> user_id its slots count against
+        self._waiting = collections.deque()  # (session_id, user_id, admit, enqueued_at)
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.reclaimed = 0
+        self._waited = 0  # Queued requests admitted so far
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _full(self):
+        # Caller holds self._lock
+        return bool(self.max_connections) and self._active >= self.max_connections
+
+    def _has_room(self, user_id):
+        # Caller holds self._lock
+        if self._full():
+            return False
+        return not self.max_per_user or self._per_user[user_id] < self.max_per_user
+
+    def _take(self, session_id, user_id):
+        # Caller holds self._lock
+        self._active += 1
+        self._per_session[session_id] += 1
+        self._per_user[user_id] += 1
+        self._users[session_id] = user_id
+        self.admitted += 1
+
+    def _reclaimable(self, user_id):
+        # Caller holds self._lock. Only worth it if the global cap is all that is in the way
+        if self.reclaim is None or not self._reserved or not self._full():
+            return False
+        return not self.max_per_user or self._per_user[user_id] < self.max_per_user
+
+    def _try_reclaim(self):
+        """Ask the owner of reserved slots to give one back. Returns True if it did"""
+        try:
+            reclaimed = self.reclaim()
+        except Exception as e:
+            logger.error("Error reclaiming a reserved connection slot: %s", e, exc_info=True)
+            return False
+        if reclaimed:
+            self.reclaimed += 1
+        return reclaimed
+
+    def request(self, session_id, admit, user_id=None):
+        """Ask for a connection slot, see the class docstring"""
+        user_id = user_id or session_id
+        can_reclaim = True
+        reclaimed = False
+        while True:
+            with self._lock:
+                if reclaimed:
+                    # Free the reclaimed slot in the same critical section that retakes it
+                    self._reserved -= 1
+                    self._active -= 1
+                    reclaimed = False
+                if not self._waiting and self._has_room(user_id):
+                    self._take(session_id, user_id)
+                    item = None
+                    break
+                if not (can_reclaim and self._reclaimable(user_id)):
+                    if self.max_queue and len(self._waiting) >= self.max_queue:
+                        self.rejected += 1
+                        logger.warning("Session %s: Connection queue full (%s waiting), rejecting", session_id, len(self._waiting))
+                        return None
+                    item = (session_id, user_id, admit, time.monotonic())
+                    self._waiting.append(item)
+                    self.queued += 1
+                    break
+            can_reclaim = reclaimed = self._try_reclaim()
+        if item is None:
+            admit()
+            return 0
+        # Waiters ahead of us may be held back only by their own cap
+        self._dispatch()
+        with self._lock:
+            position = self._waiting.index(item) + 1 if item in self._waiting else 0
+        if position:
+            logger.info("Session %s: Upstream connections at capacity, queued at position %s", session_id, position)
+            self._report(session_id, position)
+        return position
+
+    def reserve(self):
+        """Take a slot for a connection opened ahead of demand. Returns False if there is no room"""
+        with self._lock:
+            if self._waiting or self._full():
+                return False
+            self._active += 1
+            self._reserved += 1
+            return True
+
+    def unreserve(self):
+        """Give back a slot taken with reserve()"""
+        with self._lock:
+            if self._reserved <= 0:
+                return
+            self._reserved -= 1
+            self._active -= 1
+        self._dispatch()
+
+    def waiting(self):
+        """Number of queued requests"""
+        return len(self._waiting)
+
+    def cancel(self, session_id):
+        """Withdraw the session's queued requests. Returns True if any were queued"""
+        with self._lock:
+            before = len(self._waiting)
+            self._waiting = collections.deque(item for item in self._waiting if item[0] != session_id)
+            cancelled = len(self._waiting) < before
+            moved = list(self._waiting) if cancelled else []
+        self._notify_positions(moved)
+        return cancelled
+
+    def release(self, session_id):
+        """Give back a slot held by the session and admit waiters that now fit"""
+        with self._lock:
+            if self._per_session[session_id] <= 0:
+                return
+            user_id = self._users[session_id]
+            self._per_session[session_id] -= 1
+            if not self._per_session[session_id]:
+                del self._per_session[session_id]
+                del self._users[session_id]
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+            self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        admitted = []
+        with self._lock:
+            now = time.monotonic()
+            for item in list(self._waiting):
+                session_id, user_id, admit, enqueued_at = item
+                if self._full():
+                    break
+                if not self._has_room(user_id):
+                    continue
+                self._waiting.remove(item)
+                self._take(session_id, user_id)
+                waited = now - enqueued_at
+                self._waited += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                admitted.append(admit)
+            moved = list(self._waiting) if admitted else []
+        for admit in admitted:
+            try:
+                admit()
+            except Exception as e:
+                logger.error("Error admitting queued connection request: %s", e, exc_info=True)
+        self._notify_positions(moved)
+
+    def _notify_positions(self, waiting):
+        for position, (session_id, _, _, _) in enumerate(waiting, start=1):
+            self._report(session_id, position)
+
+    def _report(self, session_id, position):
+        if self.on_position is None:
+            return
+        try:
+            self.on_position(session_id, position)
+        except Exception as e:
+            logger.error("Session %s: Error reporting queue position: %s", session_id, e)
+
+    def stats(self):
+        waited = self._waited
+        return {
+            'active': self._active,
+            'reserved': self._reserved,
+            'waiting': len(self._waiting),
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'reclaimed': self.reclaimed,
+            'wait_ms_avg': self._wait_total / waited * 1000 if waited else 0.0,
+            'wait_ms_max': self._wait_max * 1000,
+        }
+
+
+def create_admission_from_env(on_position=None):
+    """
+    Build an AdmissionController from MAX_UPSTREAM_CONNECTIONS,
+    MAX_CONNECTIONS_PER_USER and UPSTREAM_QUEUE_SIZE
+    """
+    return AdmissionController(
+        max_connections=int(os.getenv("MAX_UPSTREAM_CONNECTIONS", 0)),
+        max_per_user=int(os.getenv("MAX_CONNECTIONS_PER_USER", 2)),
+        max_queue=int(os.getenv("UPSTREAM_QUEUE_SIZE", 1000)),
+        on_position=on_position
+    )
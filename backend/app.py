@@ -1,25 +1,53 @@
 import logging
 import os
-import sys
 import datetime
 
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_cors import CORS
 import db  # Import our MongoDB module
+from bson_json import json_response
+from structured_logging import configure_logging
 
-# Configure logging (similar to app_socketio.py)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('app.log')
-    ]
-)
+# Before anything reads settings, LOG_* included
+load_dotenv()
+
+# Configure logging (same setup as app_socketio.py, see structured_logging.py)
+configure_logging('app.log')
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+def setup_indexes():
+    """
+    Apply db.INDEXES and check the hot queries use them, per DB_INDEXES:
+    'apply' (default) logs failures, 'strict' raises them, 'off' skips
+    """
+    mode = os.getenv('DB_INDEXES', 'apply')
+    if mode == 'off' or db.db is None:
+        return
+    try:
+        db.ensure_indexes()
+        db.verify_indexes()
+    except db.IndexCheckError as e:
+        if mode == 'strict':
+            raise
+        logger.error("Index setup failed: %s", e)
+
+def conditional_response(version, build):
+    """
+    304 Not Modified if the request's If-None-Match holds *version*,
+    otherwise build() with *version* as its ETag. Responses are marked
+    no-cache, so browsers revalidate with If-None-Match on every fetch.
+    """
+    if version is not None and request.if_none_match.contains_weak(version):
+        response = Response(status=304)
+    else:
+        response = build()
+        if not isinstance(response, Response) or response.status_code != 200:
+            return response
+    if version is not None:
+        response.set_etag(version, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 def create_app():
     """Application factory function"""
@@ -35,6 +63,8 @@ def create_app():
         "http://*"
     ]}})
     
+    setup_indexes()
+    
     @app.route('/')
     def index():
         return render_template('index.html')
@@ -45,7 +75,7 @@ def create_app():
         email = data.get('email')
         password = data.get('password')
         
-        logger.info(f"Login attempt for email: {email}")
+        logger.info("Login attempt for email: %s", email)
         
         # MongoDB authentication
         user = db.authenticate_user(email, password)
@@ -81,7 +111,7 @@ def create_app():
         if not all([user_data['firstName'], user_data['email'], user_data['password']]):
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
         
-        logger.info(f"Registration attempt for email: {user_data['email']}")
+        logger.info("Registration attempt for email: %s", user_data['email'])
         
         # Create user in MongoDB
         result = db.create_user(user_data)
@@ -107,7 +137,7 @@ def create_app():
     def get_users():
         """Get all users (for testing only)"""
         users = db.get_all_users()
-        return jsonify({
+        return json_response({
             'success': True,
             'users': users
         })
@@ -120,7 +150,7 @@ def create_app():
             # Don't return the password
             if 'password' in user:
                 del user['password']
-            return jsonify({
+            return json_response({
                 'success': True,
                 'user': user
             })
@@ -151,7 +181,7 @@ def create_app():
             data['curSummary'] = ''
         
         # Log the request
-        logger.info(f"Saving notebook for user: {data.get('userId')}")
+        logger.info("Saving notebook for user: %s", data.get('userId'))
         
         # Save to MongoDB notebooks collection
         result = db.insert_or_update_note(data, 'notebooks')
@@ -164,22 +194,74 @@ def create_app():
 
     @app.route('/notebooks/<user_id>', methods=['GET'])
     def get_user_notebooks(user_id):
-        """Get user notebooks by user ID"""
-        logger.info(f"Retrieving notebooks for user: {user_id}")
-        
-        # Get from MongoDB notebooks collection
-        result = db.get_userdata(user_id, 'notebooks')
-        
-        if result and result.get('success'):
-            return jsonify(result)
-        else:
-            error_message = result.get('message', 'Failed to retrieve notebooks') if result else 'Database error'
-            return jsonify({'success': False, 'message': error_message}), 500
+        """
+        Get user notebooks by user ID.
+        With ?view=list, returns one page of list fields only (title,
+        timestamps, preview), sized by ?limit=, and a nextCursor to pass back
+        as ?cursor= for the next page. Otherwise every full notebook.
+        Answers 304 if nothing changed since the If-None-Match ETag.
+        """
+        if request.args.get('view') == 'list':
+            try:
+                limit = int(request.args.get('limit', 50))
+            except ValueError:
+                return jsonify({'success': False, 'message': 'Invalid limit'}), 400
+
+        def build():
+            if request.args.get('view') == 'list':
+                logger.info("Listing notebooks for user: %s", user_id)
+                result = db.list_notes(user_id, limit, request.args.get('cursor'), 'notebooks')
+            else:
+                logger.info("Retrieving notebooks for user: %s", user_id)
+                # Get from MongoDB notebooks collection
+                result = db.get_userdata(user_id, 'notebooks')
+
+            if result and result.get('success'):
+                return json_response(result)
+            elif result and result.get('invalid'):
+                return jsonify({'success': False, 'message': result['message']}), 400
+            else:
+                error_message = result.get('message', 'Failed to retrieve notebooks') if result else 'Database error'
+                return jsonify({'success': False, 'message': error_message}), 500
+
+        # The version is taken before the read, so an ETag never labels older data
+        return conditional_response(db.notes_version(user_id, 'notebooks'), build)
+
+    @app.route('/notebooks/<user_id>/<notebook_id>', methods=['GET'])
+    def get_user_notebook(user_id, notebook_id):
+        """
+        Get one notebook with its full note, transcript and summary.
+        Answers 304 if nothing changed since the If-None-Match ETag.
+        """
+        def build():
+            logger.info("Retrieving notebook %s for user: %s", notebook_id, user_id)
+
+            result = db.get_note(user_id, notebook_id, 'notebooks')
+
+            if result and result.get('success'):
+                return json_response(result)
+            elif result and result.get('invalid'):
+                return jsonify({'success': False, 'message': result['message']}), 400
+            elif result and result.get('notFound'):
+                return jsonify({'success': False, 'message': result['message']}), 404
+            else:
+                error_message = result.get('message', 'Failed to retrieve notebook') if result else 'Database error'
+                return jsonify({'success': False, 'message': error_message}), 500
+
+        # Any change to the user's notebooks changes the version of each of them
+        return conditional_response(db.notes_version(user_id, 'notebooks'), build)
+
+    @app.route('/cache/stats', methods=['GET'])
+    def get_cache_stats():
+        """Hit, miss and eviction counts of the notebook cache"""
+        if db.notebook_cache is None:
+            return jsonify({'success': True, 'enabled': False})
+        return jsonify({'success': True, 'enabled': True, 'stats': db.notebook_cache.stats()})
 
     @app.route('/notebooks/<notebook_id>', methods=['DELETE'])
     def delete_notebook(notebook_id):
         """Delete a specific notebook by ID"""
-        logger.info(f"Deleting notebook with ID: {notebook_id}")
+        logger.info("Deleting notebook with ID: %s", notebook_id)
         
         # Delete from MongoDB notebooks collection
         result = db.delete_note(notebook_id, 'notebooks')
@@ -217,7 +299,7 @@ def create_app():
         collection = data.pop('collection', 'userdata')
         
         # Log the request
-        logger.info(f"Saving user data for user: {data.get('userId')} to collection: {collection}")
+        logger.info("Saving user data for user: %s to collection: %s", data.get('userId'), collection)
         
         # Save to MongoDB
         result = db.insert_or_update_note(data, collection)
@@ -231,13 +313,13 @@ def create_app():
     @app.route('/userdata/<user_id>', methods=['GET'])
     def get_user_notes(user_id):
         """Get user data by user ID"""
-        logger.info(f"Retrieving user data for user: {user_id}")
+        logger.info("Retrieving user data for user: %s", user_id)
         
         # Get from MongoDB
         result = db.get_userdata(user_id)
         
         if result and result.get('success'):
-            return jsonify(result)
+            return json_response(result)
         else:
             error_message = result.get('message', 'Failed to retrieve user data') if result else 'Database error'
             return jsonify({'success': False, 'message': error_message}), 500
@@ -254,7 +336,7 @@ def create_app():
             return jsonify({'success': False, 'message': 'Missing required fields'}), 400
         
         # Log the request
-        logger.info(f"Saving transcript for user: {data.get('userId')}")
+        logger.info("Saving transcript for user: %s", data.get('userId'))
         
         # Save to MongoDB
         result = db.save_transcript(data)
@@ -269,13 +351,13 @@ def create_app():
     @app.route('/transcripts/<user_id>', methods=['GET'])
     def get_user_transcripts(user_id):
         """Get all transcripts for a specific user"""
-        logger.info(f"Retrieving transcripts for user: {user_id}")
+        logger.info("Retrieving transcripts for user: %s", user_id)
         
         # Get from MongoDB
         result = db.get_user_transcripts(user_id)
         
         if result and result.get('success'):
-            return jsonify(result)
+            return json_response(result)
         else:
             error_message = result.get('message', 'Failed to retrieve transcripts') if result else 'Database error'
             return jsonify({'success': False, 'message': error_message}), 500
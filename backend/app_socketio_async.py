@@ -0,0 +1,163 @@
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import signal
+import sys
+from urllib.parse import parse_qs
+
+import socketio
+import uvicorn
+from dotenv import load_dotenv
+from message_queue import create_async_client_manager
+from relay import CORS_ORIGINS, TranscriptionRelay, admin_authorized
+from structured_logging import configure_logging
+from transcription_backends import LoopBackend, create_backend
+
+# Asyncio server mode of the transcription relay, for many concurrent
+# sessions per process: python-socketio's AsyncServer on uvicorn serves every
+# client socket from one event loop instead of a thread each, and Deepgram
+# connections use the SDK's async websocket client on the same loop (see
+# LoopBackend). Start it through relay_server.py with
+# SOCKETIO_ASYNC_MODE=asyncio. The relay itself is the one app_socketio.py
+# runs (relay.py), so both modes have the same features and settings.
+
+# Before anything reads settings, LOG_* included
+load_dotenv()
+
+# Same JSON logging as the threading server, see structured_logging.py
+configure_logging('socketio_app.log')
+logger = logging.getLogger(__name__)
+
+# Multi-worker mode (see run_workers.py): workers share emits and rooms through
+# SOCKETIO_MESSAGE_QUEUE (ipc://, redis:// or amqp://, see message_queue.py)
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins=CORS_ORIGINS,
+    ping_timeout=60,
+    ping_interval=25,
+    max_http_buffer_size=5*1024*1024,  # 5MB buffer for binary data
+    # One event at a time per client, so its audio is relayed in order
+    async_handlers=False,
+    client_manager=create_async_client_manager(SOCKETIO_MESSAGE_QUEUE)
+)
+
+# The event loop is set on startup, before the first connection is opened
+backend = LoopBackend(create_backend())
+
+
+def _log_emit_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Error emitting: %s", future.exception())
+
+
+def emit(event, data, room):
+    """Emit from the event loop or from any of the relay's threads, without waiting"""
+    future = asyncio.run_coroutine_threadsafe(sio.emit(event, data, room=room), backend.loop)
+    future.add_done_callback(_log_emit_error)
+
+
+relay = TranscriptionRelay(
+    emit=emit,
+    enter_room=lambda socket_id, room: sio.manager.basic_enter_room(socket_id, '/', room),
+    leave_room=lambda socket_id, room: sio.manager.basic_leave_room(socket_id, '/', room),
+    backend=backend
+)
+
+# Query parameters of each connected socket
+socket_args = {}
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    socket_args[sid] = {key: values[0] for key, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+    relay.connect(sid, socket_args[sid])
+
+
+@sio.event
+async def disconnect(sid, *args):
+    relay.disconnect(sid)
+    socket_args.pop(sid, None)
+
+
+@sio.on('audio_stream')
+async def handle_audio_stream(sid, data):
+    if relay.audio_may_block:
+        # Waiting for room in a full send queue holds up this client only
+        await asyncio.to_thread(relay.audio_stream, sid, data, socket_args.get(sid, {}))
+    else:
+        relay.audio_stream(sid, data, socket_args.get(sid, {}))
+
+
+@sio.on('toggle_transcription')
+async def handle_toggle_transcription(sid, data):
+    relay.toggle_transcription(sid, data, socket_args.get(sid, {}))
+
+
+async def respond(send, status, body, content_type='application/json', origin=None):
+    headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+    if origin and any(fnmatch.fnmatch(origin, allowed) for allowed in CORS_ORIGINS):
+        headers += [(b'access-control-allow-origin', origin.encode()), (b'vary', b'Origin')]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def http_routes(scope, receive, send):
+    """/affinity, /admin/drain and /metrics, as served by the threading server"""
+    if scope['type'] != 'http':
+        return
+    query = {key: values[0] for key, values in parse_qs(scope['query_string'].decode()).items()}
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    origin = headers.get('origin')
+    path, method = scope['path'], scope['method']
+
+    if path == '/metrics':
+        await respond(send, 200, relay.metrics.render().encode(), 'text/plain; version=0.0.4; charset=utf-8', origin)
+        return
+    if path == '/affinity':
+        session_id = query.get('userId')
+        if not session_id:
+            status, payload = 400, {'error': 'userId is required'}
+        else:
+            status, payload = 200, relay.affinity(session_id)
+    elif path == '/admin/drain' and method in ('GET', 'POST'):
+        client = scope.get('client')
+        if not admin_authorized(headers.get('authorization'), client[0] if client else None):
+            status, payload = 403, {'error': 'Forbidden'}
+        else:
+            if method == 'POST':
+                relay.drain.start('admin endpoint')
+            status, payload = 200, relay.drain.status()
+    else:
+        status, payload = 404, {'error': 'Not found'}
+    await respond(send, status, json.dumps(payload).encode(), origin=origin)
+
+
+async def on_startup():
+    backend.loop = asyncio.get_running_loop()
+    relay.start()
+    # Deploys stop the relay with SIGTERM: drain instead of dropping recordings.
+    # This replaces uvicorn's handler, which is installed by now.
+    signal.signal(signal.SIGTERM, lambda signum, frame: relay.drain.start('SIGTERM'))
+
+
+asgi_app = socketio.ASGIApp(sio, other_asgi_app=http_routes, on_startup=on_startup)
+
+
+def main():
+    try:
+        logger.info("Starting asyncio SocketIO server.")
+        # Get port from environment variable (for cloud deployment) or use default
+        port = int(os.environ.get("PORT", 5001))
+        uvicorn.run(asgi_app, host='0.0.0.0', port=port, log_level='warning')
+    except Exception as e:
+        # Leave restarts to the process supervisor, which gets a clean exit code
+        logger.error("Error starting SocketIO server: %s", e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import collections
+import os
+import threading
+import time
+
+# Policies for a full buffer
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class PreconnectBuffer:
+    """
+    Bounded FIFO of audio packets that arrive while a session's upstream
+    connection is being set up or re-established.
+
+    The buffer is limited both in bytes (max_bytes) and in age (max_seconds).
+    When a limit is hit, packets are discarded according to policy: drop_oldest
+    (default) keeps the most recent audio, drop_newest keeps what was buffered
+    first. The first packet of a stream carries the container header for
+    webm/ogg audio, so with pin_first it is never dropped.
+
+    Counters: buffered_bytes (ever buffered), dropped_bytes, flushed_bytes.
+    """
+
+    def __init__(self, max_bytes=512 * 1024, max_seconds=10.0, policy=DROP_OLDEST, pin_first=True):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown buffer policy: {policy}")
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.policy = policy
+        self.pin_first = pin_first
+        # Held while flushing so live sends cannot overtake buffered audio
+        self.lock = threading.RLock()
+        self._packets = collections.deque()
+        self._size = 0
+        self._pinned = None
+        self._seen_first = False
+        self.buffered_bytes = 0
+        self.dropped_bytes = 0
+        self.flushed_bytes = 0
+
+    def __len__(self):
+        return len(self._packets) + (1 if self._pinned is not None else 0)
+
+    @property
+    def size(self):
+        """Bytes currently held"""
+        return self._size + (len(self._pinned) if self._pinned is not None else 0)
+
+    def append(self, data, now=None):
+        """Buffer a packet. Returns False if the packet itself was dropped"""
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            if self.pin_first and not self._seen_first:
+                self._seen_first = True
+                self._pinned = data
+                self.buffered_bytes += len(data)
+                return True
+            self._seen_first = True
+
+            self._expire(now)
+            if len(data) > self.max_bytes or (self.policy == DROP_NEWEST and self._size + len(data) > self.max_bytes):
+                self.dropped_bytes += len(data)
+                return False
+
+            self._packets.append((now, data))
+            self._size += len(data)
+            self.buffered_bytes += len(data)
+            while self._size > self.max_bytes:
+                self._drop_oldest()
+            return True
+
+    def _drop_oldest(self):
+        _, data = self._packets.popleft()
+        self._size -= len(data)
+        self.dropped_bytes += len(data)
+
+    def _expire(self, now):
+        while self._packets and now - self._packets[0][0] > self.max_seconds:
+            self._drop_oldest()
+
+    def drain(self, now=None):
+        """Remove and return the buffered packets in arrival order"""
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            self._expire(now)
+            packets = [data for _, data in self._packets]
+            if self._pinned is not None:
+                packets.insert(0, self._pinned)
+                self._pinned = None
+            self._packets.clear()
+            self._size = 0
+            self.flushed_bytes += sum(len(data) for data in packets)
+            return packets
+
+    def clear(self):
+        """Discard buffered audio (counted as dropped) and start a new stream"""
+        with self.lock:
+            self.dropped_bytes += self.size
+            self._packets.clear()
+            self._size = 0
+            self._pinned = None
+            self._seen_first = False
+
+    def stats(self):
+        return {
+            'pending_bytes': self.size,
+            'buffered_bytes': self.buffered_bytes,
+            'dropped_bytes': self.dropped_bytes,
+            'flushed_bytes': self.flushed_bytes,
+        }
+
+
+def create_buffer_from_env():
+    """
+    Build a PreconnectBuffer from AUDIO_BUFFER_MAX_BYTES, AUDIO_BUFFER_MAX_SECONDS
+    and AUDIO_BUFFER_POLICY
+    """
+    return PreconnectBuffer(
+        max_bytes=int(os.getenv("AUDIO_BUFFER_MAX_BYTES", 512 * 1024)),
+        max_seconds=float(os.getenv("AUDIO_BUFFER_MAX_SECONDS", 10)),
+        policy=os.getenv("AUDIO_BUFFER_POLICY", DROP_OLDEST)
+    )
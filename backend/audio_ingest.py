@@ -0,0 +1,48 @@
+import base64
+
+# Raw PCM encoding clients can opt into with encoding=linear16&sampleRate=<hz>
+# (16-bit little-endian, mono). Other clients send containerized audio
+# (webm/ogg from MediaRecorder) that the provider detects by itself.
+LINEAR16 = 'linear16'
+
+
+class UnsupportedAudioFormat(ValueError):
+    """Raised for an audio_stream payload that carries no usable audio"""
+
+
+def negotiate_encoding(encoding, sample_rate):
+    """
+    Upstream options for a socket's audio encoding (its encoding and
+    sampleRate query parameters), or None for containerized audio
+    """
+    if encoding != LINEAR16:
+        return None
+    return {'encoding': LINEAR16, 'sample_rate': int(sample_rate or 16000), 'channels': 1}
+
+
+def decode_audio(data):
+    """
+    Extract the audio from an audio_stream payload in any supported shape:
+    bytes (binary attachments, passed through as received), base64 string or
+    file-like object, bare or under 'audio'. Raises UnsupportedAudioFormat
+    for anything else, and for base64 strings that cannot be decoded.
+    """
+    if isinstance(data, dict) and 'audio' in data:
+        audio_data = data['audio']
+    else:
+        # If not in expected format, use the data directly
+        audio_data = data
+
+    if isinstance(audio_data, str):
+        # String data (likely base64)
+        try:
+            return base64.b64decode(audio_data)
+        except Exception as e:
+            raise UnsupportedAudioFormat(f"Error converting string to binary: {e}") from e
+    if isinstance(audio_data, (bytes, bytearray)):
+        # Already binary data
+        return audio_data
+    if hasattr(audio_data, 'read'):
+        # File-like object
+        return audio_data.read()
+    raise UnsupportedAudioFormat(f"Unsupported data format: {type(audio_data)}")
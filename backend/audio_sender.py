@@ -0,0 +1,274 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Backpressure policies for a full send queue
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+SIGNAL = 'signal'
+
+# Queued in place of audio to have the sender call keep_alive() on the connection
+KEEPALIVE = object()
+
+
+class SessionSender:
+    """
+    Bounded outbound queue of audio packets for one session, drained by a
+    sender thread so Socket.IO handlers never wait on the upstream send.
+
+    Packets are queued together with the connection they are meant for, so a
+    connection swap never reorders audio. When the queue holds max_packets,
+    policy decides what happens to a new packet:
+      block        the caller waits up to block_timeout for room, then the
+                   packet is dropped
+      drop_oldest  the oldest queued packet is dropped
+      signal       the new packet is dropped and on_congested(session_id, True)
+                   is called so the client can slow down; on_congested(
+                   session_id, False) follows once the queue is half empty
+
+    With batch_bytes set, consecutive packets for the same connection are
+    coalesced into one send of up to batch_bytes, waiting at most batch_window
+    seconds after the first packet of a frame. wait_empty() sends a partial
+    frame immediately. batching_ratio in stats() is packets per send.
+
+    on_sent(nbytes, send_seconds, wait_seconds), if given, is called by the
+    sender thread after every successful upstream send (metrics hook).
+
+    The sender thread exits after idle_timeout seconds without audio and is
+    restarted by the next put().
+    """
+
+    def __init__(self, session_id, max_packets=256, policy=DROP_OLDEST, block_timeout=1.0,
+                 idle_timeout=30.0, on_congested=None, batch_bytes=0, batch_window=0.1,
+                 on_sent=None):
+        if policy not in (BLOCK, DROP_OLDEST, SIGNAL):
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.session_id = session_id
+        self.max_packets = max_packets
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.idle_timeout = idle_timeout
+        self.on_congested = on_congested
+        self.on_sent = on_sent
+        self.batch_bytes = batch_bytes
+        self.batch_window = batch_window
+
+        self._queue = collections.deque()  # (enqueued_at, connection, data)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._sending = False
+        self._congested = False
+        self._flush_requested = False
+
+        self.sent_packets = 0
+        self.sent_bytes = 0
+        self.sent_frames = 0
+        self.keepalives = 0
+        self.dropped_packets = 0
+        self.failed_packets = 0
+        self.max_depth = 0
+        self._send_total = 0.0
+        self._send_max = 0.0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, connection, data):
+        """Queue a packet for connection. Returns False if a packet had to be dropped"""
+        congested = None
+        with self._cond:
+            accepted = True
+            if len(self._queue) >= self.max_packets:
+                if self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped_packets += 1
+                    accepted = False
+                elif self.policy == BLOCK:
+                    if not self._cond.wait_for(lambda: len(self._queue) < self.max_packets, self.block_timeout):
+                        self.dropped_packets += 1
+                        return False
+                else:
+                    self.dropped_packets += 1
+                    if not self._congested:
+                        self._congested = congested = True
+                    accepted = None
+            if accepted is not None:
+                self._queue.append((time.monotonic(), connection, data))
+                self.max_depth = max(self.max_depth, len(self._queue))
+                self._cond.notify_all()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f'sender-{self.session_id}', daemon=True)
+                    self._thread.start()
+        if congested is not None:
+            self._notify_congested(congested)
+        return bool(accepted)
+
+    def keep_alive(self, connection):
+        """Queue a keepalive for connection, in order with the audio"""
+        return self.put(connection, KEEPALIVE)
+
+    def wait_empty(self, timeout=None):
+        """Wait until every queued packet has been sent. Returns False on timeout"""
+        with self._cond:
+            # Don't hold back a partial batch
+            self._flush_requested = True
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: not self._queue and not self._sending, timeout)
+            finally:
+                self._flush_requested = False
+
+    def clear(self):
+        """Discard queued packets (counted as dropped)"""
+        with self._cond:
+            self.dropped_packets += len(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def discard(self, connection):
+        """
+        Remove the packets queued for a connection that has gone away. Returns
+        how many were removed; they are not counted as dropped, since the
+        caller is expected to replay them.
+        """
+        with self._cond:
+            kept = collections.deque(item for item in self._queue if item[1] is not connection)
+            removed = len(self._queue) - len(kept)
+            self._queue = kept
+            self._cond.notify_all()
+        return removed
+
+    def stats(self):
+        frames = self.sent_frames
+        return {
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'sent_packets': self.sent_packets,
+            'sent_bytes': self.sent_bytes,
+            'sent_frames': frames,
+            'keepalives': self.keepalives,
+            'batching_ratio': self.sent_packets / frames if frames else 0.0,
+            'dropped_packets': self.dropped_packets,
+            'failed_packets': self.failed_packets,
+            'send_ms_avg': self._send_total / frames * 1000 if frames else 0.0,
+            'send_ms_max': self._send_max * 1000,
+            'wait_ms_avg': self._wait_total / frames * 1000 if frames else 0.0,
+            'wait_ms_max': self._wait_max * 1000,
+        }
+
+    def _notify_congested(self, congested):
+        if congested:
+            logger.warning("Session %s: Send queue full (%s packets), asking client to slow down", self.session_id, self.max_packets)
+        else:
+            logger.info("Session %s: Send queue drained, client may resume", self.session_id)
+        if self.on_congested is not None:
+            try:
+                self.on_congested(self.session_id, congested)
+            except Exception as e:
+                logger.error("Session %s: Error in congestion callback: %s", self.session_id, e)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._queue, self.idle_timeout):
+                    self._thread = None
+                    return
+                enqueued_at, connection, data = self._queue.popleft()
+                self._sending = True
+                # Wake a put() blocked on a full queue
+                self._cond.notify_all()
+                packets = 1
+                if data is KEEPALIVE:
+                    packets = 0
+                elif self.batch_bytes:
+                    data, packets = self._coalesce(enqueued_at, connection, data)
+                resumed = self._congested and len(self._queue) <= self.max_packets // 2
+                if resumed:
+                    self._congested = False
+            if resumed:
+                self._notify_congested(False)
+
+            if data is KEEPALIVE:
+                try:
+                    connection.keep_alive()
+                except Exception as e:
+                    logger.error("Session %s: Error sending keepalive upstream: %s", self.session_id, e)
+                with self._cond:
+                    self._sending = False
+                    self.keepalives += 1
+                    self._cond.notify_all()
+                continue
+
+            started = time.monotonic()
+            try:
+                connection.send(data)
+                ok = True
+            except Exception as e:
+                logger.error("Session %s: Error sending audio upstream: %s", self.session_id, e)
+                ok = False
+            finished = time.monotonic()
+
+            with self._cond:
+                self._sending = False
+                if ok:
+                    self.sent_packets += packets
+                    self.sent_frames += 1
+                    self.sent_bytes += len(data)
+                    self._send_total += finished - started
+                    self._send_max = max(self._send_max, finished - started)
+                    self._wait_total += started - enqueued_at
+                    self._wait_max = max(self._wait_max, started - enqueued_at)
+                else:
+                    self.failed_packets += packets
+                self._cond.notify_all()
+            if ok and self.on_sent is not None:
+                try:
+                    self.on_sent(len(data), finished - started, started - enqueued_at)
+                except Exception as e:
+                    logger.error("Session %s: Error in send callback: %s", self.session_id, e)
+
+    def _coalesce(self, enqueued_at, connection, data):
+        # Caller holds self._cond. Gather the packets following data into one
+        # frame until it is full or the window closes; on a flush, only take
+        # what is already queued.
+        frame = [data]
+        size = len(data)
+        deadline = enqueued_at + self.batch_window
+        while size < self.batch_bytes:
+            if self._queue:
+                if self._queue[0][1] is not connection or self._queue[0][2] is KEEPALIVE:
+                    break
+                data = self._queue.popleft()[2]
+                frame.append(data)
+                size += len(data)
+                self._cond.notify_all()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._flush_requested:
+                break
+            self._cond.wait(remaining)
+        return (frame[0] if len(frame) == 1 else b''.join(frame)), len(frame)
+
+
+def create_sender_from_env(session_id, on_congested=None, on_sent=None):
+    """
+    Build a SessionSender from AUDIO_SEND_QUEUE_SIZE, AUDIO_SEND_BACKPRESSURE,
+    AUDIO_SEND_BLOCK_TIMEOUT and the batching settings AUDIO_BATCH_BYTES (0
+    disables batching) and AUDIO_BATCH_MS
+    """
+    return SessionSender(
+        session_id,
+        max_packets=int(os.getenv("AUDIO_SEND_QUEUE_SIZE", 256)),
+        policy=os.getenv("AUDIO_SEND_BACKPRESSURE", DROP_OLDEST),
+        block_timeout=float(os.getenv("AUDIO_SEND_BLOCK_TIMEOUT", 1.0)),
+        batch_bytes=int(os.getenv("AUDIO_BATCH_BYTES", 0)),
+        batch_window=float(os.getenv("AUDIO_BATCH_MS", 100)) / 1000,
+        on_congested=on_congested,
+        on_sent=on_sent
+    )
@@ -0,0 +1,37 @@
+import base64
+
+import orjson
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from bson.timestamp import Timestamp
+from flask import Response
+
+# Serializes MongoDB documents straight to JSON response bytes. orjson handles
+# dicts, lists, strings, numbers and datetimes (as ISO 8601, like isoformat())
+# natively; the BSON types it does not know are converted by _default:
+#   ObjectId    hex string
+#   Decimal128  decimal string
+#   Timestamp   ISO 8601 string of its time
+#   bytes       base64 string (also bson Binary)
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value)
+    if isinstance(value, Timestamp):
+        return value.as_datetime().isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value):
+    """JSON bytes for a value that may contain BSON types"""
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(value, status=200):
+    """Flask JSON response with the body serialized by dumps()"""
+    return Response(dumps(value), status=status, mimetype='application/json')
@@ -0,0 +1,220 @@
+import collections
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmConnectionPool:
+    """
+    Pool of idle, already-started transcription connections for the default
+    options, so a session start skips the TLS/websocket handshake.
+
+    A background thread keeps `size` connections open, sends keepalives to
+    idle ones every keepalive_interval seconds and retires connections older
+    than max_age. acquire() hands out an open connection (a hit) or None (a
+    miss, the caller opens one itself); the caller rebinds the connection's
+    callbacks to its session with bind().
+
+    With an admission controller (see admission.py), every pooled connection
+    holds a reserved slot against the global connection cap while it is
+    being opened or idle. A connection handed out gives its slot back, the
+    session that takes it holds its own; reclaim() closes an idle one when a
+    session needs the slot, and its slot passes to that session.
+    """
+
+    def __init__(self, backend, size, options, keepalive_interval=5.0, max_age=300.0, max_parallel_opens=8,
+                 admission=None):
+        self.backend = backend
+        self.admission = admission
+        self.size = size
+        self.max_parallel_opens = max_parallel_opens
+        self.options = options
+        self.keepalive_interval = keepalive_interval
+        self.max_age = max_age
+
+        self._idle = collections.deque()  # (opened_at, connection)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._ids = itertools.count()
+        self._last_keepalive = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.failed = 0
+        self.expired = 0
+        self.reclaimed = 0
+
+    def start(self):
+        """Start the background thread that fills and maintains the pool"""
+        if self._thread is None and self.size > 0:
+            self._thread = threading.Thread(target=self._run, name='warm-pool', daemon=True)
+            self._thread.start()
+
+    def acquire(self):
+        """Take an open connection out of the pool, or None if it is empty"""
+        with self._lock:
+            connection = self._idle.popleft()[1] if self._idle else None
+            if connection is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if connection is not None:
+            self._unreserve()
+        # Replenish in the background
+        self._wakeup.set()
+        return connection
+
+    def close(self):
+        """Stop maintaining the pool and finish every idle connection"""
+        self._stopped.set()
+        self._wakeup.set()
+        with self._lock:
+            idle = [connection for _, connection in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            self._unreserve()
+            self._finish(connection)
+
+    def reclaim(self):
+        """
+        Close the oldest idle connection so its admission slot can go to a
+        session. The caller takes over the slot (see AdmissionController).
+        Returns False if no connection is idle.
+        """
+        with self._lock:
+            if not self._idle:
+                return False
+            connection = self._idle.popleft()[1]
+            self.reclaimed += 1
+        logger.info("Warm pool: closing an idle connection to make room for a session")
+        # Finishing can wait on the network, don't hold up the caller
+        threading.Thread(target=self._finish, args=(connection,), name='warm-pool-reclaim', daemon=True).start()
+        return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'created': self.created,
+            'failed': self.failed,
+            'expired': self.expired,
+            'reclaimed': self.reclaimed,
+        }
+
+    def _unreserve(self):
+        if self.admission is not None:
+            self.admission.unreserve()
+
+    def _open_one(self):
+        pool_id = f"warm-{next(self._ids)}"
+        connection = self.backend.create_connection(pool_id)
+        # While idle, the only event we care about is the stream going away
+        connection.bind(
+            on_close=lambda: self._discard(connection),
+            on_error=lambda error: logger.warning("Warm pool connection %s error: %s", pool_id, error)
+        )
+        try:
+            started = connection.start(self.options)
+        except Exception as e:
+            logger.error("Warm pool: error opening connection: %s", e)
+            started = False
+        if not started:
+            self.failed += 1
+            self._unreserve()
+            return None
+        self.created += 1
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            for entry in self._idle:
+                if entry[1] is connection:
+                    self._idle.remove(entry)
+                    logger.info("Warm pool: idle connection closed upstream, removed from pool")
+                    break
+            else:
+                return
+        self._unreserve()
+
+    def _finish(self, connection):
+        try:
+            connection.finish()
+        except Exception as e:
+            logger.error("Warm pool: error closing connection: %s", e)
+
+    def _maintain(self):
+        now = time.monotonic()
+
+        # Retire connections that have been idle for too long
+        with self._lock:
+            expired = [entry for entry in self._idle if now - entry[0] > self.max_age]
+            for entry in expired:
+                self._idle.remove(entry)
+            idle = [connection for _, connection in self._idle]
+        for _, connection in expired:
+            self.expired += 1
+            self._unreserve()
+            self._finish(connection)
+
+        # Keep the remaining idle connections alive
+        if now - self._last_keepalive < self.keepalive_interval:
+            idle = []
+        else:
+            self._last_keepalive = now
+        for connection in idle:
+            try:
+                if not connection.keep_alive():
+                    self._discard(connection)
+            except Exception as e:
+                logger.warning("Warm pool: keepalive failed: %s", e)
+                self._discard(connection)
+
+        # Sessions waiting for a slot come before idle connections
+        while self.admission is not None and self.admission.waiting() and self.reclaim():
+            self._unreserve()
+
+        # Fill up to the target size, opening the missing connections in parallel
+        missing = self.size - len(self._idle)
+        if missing <= 0 or self._stopped.is_set():
+            return
+        if self.admission is not None:
+            # Only as many as there are free slots under the global cap
+            reserved = 0
+            while reserved < missing and self.admission.reserve():
+                reserved += 1
+            if not reserved:
+                return
+            missing = reserved
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(missing, self.max_parallel_opens)) as executor:
+            for connection in executor.map(lambda _: self._open_one(), range(missing)):
+                if connection is None:
+                    continue
+                # close() may have run while the connection was opening
+                with self._lock:
+                    stopped = self._stopped.is_set()
+                    if not stopped:
+                        self._idle.append((time.monotonic(), connection))
+                if stopped:
+                    self._unreserve()
+                    self._finish(connection)
+
+    def _run(self):
+        logger.info("Warm pool started with target size %s", self.size)
+        while not self._stopped.is_set():
+            try:
+                self._maintain()
+            except Exception as e:
+                logger.error("Error maintaining warm pool: %s", e, exc_info=True)
+            self._wakeup.wait(self.keepalive_interval)
+            self._wakeup.clear()
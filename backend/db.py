@@ -1,10 +1,14 @@
+import base64
 import os
 import logging
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
 import datetime
 
+from notebook_cache import create_cache_from_env
+
 # Load environment variables
 load_dotenv()
 
@@ -33,7 +37,7 @@ try:
     client.admin.command('ping')
     logger.info("Successfully connected to MongoDB")
 except Exception as e:
-    logger.error(f"Error connecting to MongoDB: {e}", exc_info=True)
+    logger.error("Error connecting to MongoDB: %s", e, exc_info=True)
     # Still create the client, but it will fail when used
     client = None
     db = None
@@ -42,6 +46,153 @@ except Exception as e:
     notebooks_collection = None
     transcriptions_collection = None
 
+# Read-through cache of notebook reads, invalidated per user by writes
+# (NOTEBOOK_CACHE_* settings in notebook_cache.py; None when disabled)
+notebook_cache = create_cache_from_env()
+
+def cached_read(collection_name, user_id, kind, load):
+    """load() through notebook_cache, if it is enabled"""
+    if notebook_cache is None:
+        return load()
+    return notebook_cache.read(collection_name, str(user_id), kind, load)
+
+def invalidate_notes(collection_name, user_id):
+    """Drop the cached reads of a user whose notes changed"""
+    if notebook_cache is not None and user_id is not None:
+        notebook_cache.invalidate(collection_name, str(user_id))
+
+def notes_version(user_id, collection_name='notebooks'):
+    """
+    Validator for a user's notes that changes whenever one of them is saved
+    or deleted, on every worker, without reading the notes: the user's
+    notebook_cache generation if the cache is shared, otherwise the count and
+    latest updatedAt (both answered from the userId_updatedAt index). None if
+    it can't be had.
+    """
+    try:
+        object_id = ObjectId(user_id)
+    except Exception:
+        return None
+    try:
+        if notebook_cache is not None and notebook_cache.backend.shared:
+            return notebook_cache.generation(collection_name, str(object_id))
+        target_collection = notebooks_collection if collection_name == 'notebooks' else userdata_collection
+        if target_collection is None:
+            return None
+        latest = target_collection.find_one({'userId': object_id}, {'_id': 0, 'updatedAt': 1},
+                                            sort=[('updatedAt', -1)])
+        count = target_collection.count_documents({'userId': object_id})
+        updated_at = latest['updatedAt'].isoformat() if latest and latest.get('updatedAt') else ''
+        return f"{count}-{updated_at}"
+    except Exception as e:
+        logger.error("Error getting notes version: %s", e)
+        return None
+
+# Indexes each collection should have. Notes are listed newest first per user
+# (get_userdata, and list_notes with _id as the tie-breaker), legacy
+# transcripts likewise by createdAt, and users are looked up by email, which
+# the unique index also keeps from being registered twice.
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'notebooks': [
+        IndexModel([('userId', ASCENDING), ('updatedAt', DESCENDING), ('_id', DESCENDING)], name='userId_updatedAt'),
+    ],
+    'userdata': [
+        IndexModel([('userId', ASCENDING), ('updatedAt', DESCENDING), ('_id', DESCENDING)], name='userId_updatedAt'),
+    ],
+    'transcriptions': [
+        IndexModel([('userId', ASCENDING), ('createdAt', DESCENDING)], name='userId_createdAt'),
+    ],
+}
+
+# The queries on the request path, as (collection, filter, sort), checked by
+# verify_indexes(). Values only need the right type for the planner.
+_SAMPLE_ID = ObjectId('000000000000000000000000')
+HOT_QUERIES = [
+    ('users', {'email': 'check@firmament', 'password': ''}, None),
+    ('notebooks', {'userId': _SAMPLE_ID}, [('updatedAt', DESCENDING)]),
+    ('notebooks', {'userId': _SAMPLE_ID}, [('updatedAt', DESCENDING), ('_id', DESCENDING)]),
+    ('userdata', {'userId': _SAMPLE_ID}, [('updatedAt', DESCENDING)]),
+    ('transcriptions', {'userId': _SAMPLE_ID}, [('createdAt', DESCENDING)]),
+]
+
+class IndexCheckError(RuntimeError):
+    """An index could not be applied, or a hot query is not served by an index"""
+
+def ensure_indexes(database=None):
+    """
+    Create the indexes in INDEXES that don't exist yet. Safe to run on every
+    start: existing indexes with the same keys and options are left alone.
+    Raises IndexCheckError if an index conflicts with an existing one or
+    can't be built (e.g. duplicate emails for the unique index).
+    """
+    database = database if database is not None else db
+    if database is None:
+        raise IndexCheckError('MongoDB connection not available')
+
+    created = []
+    for collection_name, models in INDEXES.items():
+        collection = database[collection_name]
+        try:
+            existing = collection.index_information()
+            missing = []
+            for model in models:
+                spec = model.document
+                current = existing.get(spec['name'])
+                if current is None:
+                    missing.append(model)
+                elif current['key'] != list(spec['key'].items()) or current.get('unique', False) != spec.get('unique', False):
+                    raise IndexCheckError(f"Index {collection_name}.{spec['name']} exists with a different definition: {current}")
+            if missing:
+                created += [f"{collection_name}.{name}" for name in collection.create_indexes(missing)]
+        except PyMongoError as e:
+            raise IndexCheckError(f"Could not create indexes on {collection_name}: {e}") from e
+
+    if created:
+        logger.info("Created indexes: %s", ', '.join(created))
+    return created
+
+def _plan_stages(plan):
+    """Every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages += _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages += _plan_stages(value)
+    return stages
+
+def verify_indexes(database=None):
+    """
+    explain() each query in HOT_QUERIES and raise IndexCheckError listing the
+    ones the planner would answer with a collection scan or an in-memory sort
+    """
+    database = database if database is not None else db
+    if database is None:
+        raise IndexCheckError('MongoDB connection not available')
+
+    problems = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = database[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        except PyMongoError as e:
+            raise IndexCheckError(f"Could not explain {collection_name}.find({query}): {e}") from e
+        stages = _plan_stages(plan)
+        for stage in ('COLLSCAN', 'SORT'):
+            if stage in stages:
+                problems.append(f"{collection_name}.find({query}).sort({sort}) uses {stage}")
+    if problems:
+        raise IndexCheckError('Queries not served by an index: ' + '; '.join(problems))
+    logger.info("Index check passed for %s queries", len(HOT_QUERIES))
+
 def authenticate_user(email, password):
     """
     Authenticate a user by email and password
@@ -64,7 +215,7 @@ def authenticate_user(email, password):
             return user
         return None
     except Exception as e:
-        logger.error(f"Error authenticating user: {e}")
+        logger.error("Error authenticating user: %s", e)
         return None
 
 def get_user_by_id(user_id):
@@ -86,7 +237,7 @@ def get_user_by_id(user_id):
             return user
         return None
     except Exception as e:
-        logger.error(f"Error getting user by ID: {e}")
+        logger.error("Error getting user by ID: %s", e)
         return None
 
 def get_all_users():
@@ -104,7 +255,7 @@ def get_all_users():
             user['_id'] = str(user['_id'])
         return users
     except Exception as e:
-        logger.error(f"Error getting all users: {e}")
+        logger.error("Error getting all users: %s", e)
         return []
 
 def create_user(user_data):
@@ -121,8 +272,12 @@ def create_user(user_data):
         if existing_user:
             return {'success': False, 'message': 'Email already registered'}
         
-        # Insert the new user
-        result = users_collection.insert_one(user_data)
+        # Insert the new user. The unique email index catches a concurrent
+        # registration the check above missed.
+        try:
+            result = users_collection.insert_one(user_data)
+        except DuplicateKeyError:
+            return {'success': False, 'message': 'Email already registered'}
         
         if result.inserted_id:
             # Get the newly created user
@@ -134,7 +289,7 @@ def create_user(user_data):
         
         return {'success': False, 'message': 'Failed to create user'}
     except Exception as e:
-        logger.error(f"Error creating user: {e}")
+        logger.error("Error creating user: %s", e)
         return {'success': False, 'message': f'Database error: {str(e)}'}
     
 def insert_or_update_note(data, collection_name='notebooks'):
@@ -162,7 +317,7 @@ def insert_or_update_note(data, collection_name='notebooks'):
         target_collection = userdata_collection
     
     if target_collection is None:
-        logger.error(f"MongoDB connection not available for collection {collection_name}")
+        logger.error("MongoDB connection not available for collection %s", collection_name)
         return {'success': False, 'message': 'Database not available'}
     
     try:
@@ -178,7 +333,7 @@ def insert_or_update_note(data, collection_name='notebooks'):
             try:
                 data_to_save['userId'] = ObjectId(data_to_save['userId'])
             except Exception as e:
-                logger.warning(f"Invalid userId format: {e}")
+                logger.warning("Invalid userId format: %s", e)
                 # Keep as string if conversion fails
 
         # Decide whether the note is a new one
@@ -188,14 +343,19 @@ def insert_or_update_note(data, collection_name='notebooks'):
             try:
                 note_object_id = ObjectId(note_id)
             except Exception as e:
-                logger.warning(f"Invalid noteId format: {e}")
+                logger.warning("Invalid noteId format: %s", e)
                 return {'success': False, 'message': 'Invalid noteId'}
             
-            result = target_collection.update_one(
+            # Get the note's previous owner back to invalidate their cached reads
+            previous = target_collection.find_one_and_update(
                 {'_id': note_object_id},
-                {'$set': data_to_save}
+                {'$set': data_to_save},
+                projection={'userId': 1}
             )
-            if result.matched_count > 0:
+            if previous is not None:
+                invalidate_notes(collection_name, previous.get('userId'))
+                if previous.get('userId') != data_to_save.get('userId'):
+                    invalidate_notes(collection_name, data_to_save.get('userId'))
                 return {
                     'success': True, 
                     'noteId': note_id,
@@ -210,6 +370,7 @@ def insert_or_update_note(data, collection_name='notebooks'):
 
         result = target_collection.insert_one(data_to_save)
         if result.inserted_id:
+            invalidate_notes(collection_name, data_to_save.get('userId'))
             # Return success with the ID (converted to string for JSON serialization)
             return {
                 'success': True, 
@@ -220,7 +381,7 @@ def insert_or_update_note(data, collection_name='notebooks'):
             return {'success': False, 'message': 'Failed to insert note'}
         
     except Exception as e:
-        logger.error(f"Error saving note: {e}")
+        logger.error("Error saving note: %s", e)
         return {'success': False, 'message': f'Database error: {str(e)}'}
     
 def get_userdata(user_id, collection_name='notebooks'):
@@ -237,45 +398,151 @@ def get_userdata(user_id, collection_name='notebooks'):
         target_collection = userdata_collection
 
     if target_collection is None:
-        logger.error(f"MongoDB connection not available for collection {collection_name}")
+        logger.error("MongoDB connection not available for collection %s", collection_name)
         return {'success': False, 'message': 'Database not available'}
     
     try:
         # Convert string ID to ObjectId
         object_id = ObjectId(user_id)
         
-        # Find all notes for this user, sorted by date (newest first)
-        notes = list(target_collection.find(
+        # Find all notes for this user, sorted by date (newest first). The
+        # documents are returned as stored, bson_json serializes them.
+        notes = cached_read(collection_name, object_id, 'all', lambda: list(target_collection.find(
             {'userId': object_id}
-        ).sort('updatedAt', -1))
-        
-        # Convert ObjectId to string for each note
-        for note in notes:
-            # Convert _id to string
-            if '_id' in note:
-                note['_id'] = str(note['_id'])
-            
-            # Convert userId to string if it's an ObjectId
-            if 'userId' in note and isinstance(note['userId'], ObjectId):
-                note['userId'] = str(note['userId'])
-                
-            # Convert createdAt and updatedAt to ISO strings
-            if 'createdAt' in note and note['createdAt']:
-                note['createdAt'] = note['createdAt'].isoformat()
-            if 'updatedAt' in note and note['updatedAt']:
-                note['updatedAt'] = note['updatedAt'].isoformat()
-            
-            # Ensure any other potential ObjectId fields are converted to strings
-            for key, value in note.items():
-                if isinstance(value, ObjectId):
-                    note[key] = str(value)
+        ).sort('updatedAt', -1)))
         
         return {'success': True, 'notes': notes}
     
     except Exception as e:
-        logger.error(f"Error getting user notes: {e}")
+        logger.error("Error getting user notes: %s", e)
         return {'success': False, 'message': f'Database error: {str(e)}'}
-    
+
+# Characters of noteText sent as the preview in notebook lists
+NOTE_PREVIEW_LENGTH = 100
+
+# Fields of a note needed to draw NotebookList. The note bodies stay on the
+# server; the preview and hasTranscript flag are computed by MongoDB.
+NOTE_LIST_PROJECTION = {
+    'title': 1,
+    'userId': 1,
+    'createdAt': 1,
+    'updatedAt': 1,
+    'date': 1,
+    'duration': 1,
+    'preview': {'$substrCP': [{'$ifNull': ['$noteText', '']}, 0, NOTE_PREVIEW_LENGTH]},
+    'hasTranscript': {'$gt': [{'$strLenCP': {'$ifNull': ['$curTranscript', '']}}, 0]},
+}
+
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(note):
+    """
+    Opaque list cursor pointing just past *note*, keyed on (updatedAt, _id).
+    Notes saved without an updatedAt get an empty one.
+    """
+    updated_at = note.get('updatedAt')
+    key = f"{updated_at.isoformat() if updated_at else ''}|{note['_id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    (updatedAt, _id) from a cursor made by encode_cursor, updatedAt None for
+    a note without one. Raises ValueError if it is malformed.
+    """
+    try:
+        updated_at, _, note_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition('|')
+        return datetime.datetime.fromisoformat(updated_at) if updated_at else None, ObjectId(note_id)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+def after_cursor(updated_at, note_id):
+    """
+    Filter for the notes listed after (updatedAt, _id) in newest first
+    order. Ties on updatedAt are broken by _id, so no note is skipped or
+    repeated; notes without an updatedAt sort last.
+    """
+    if updated_at is None:
+        return {'updatedAt': None, '_id': {'$lt': note_id}}
+    return {'$or': [
+        {'updatedAt': {'$lt': updated_at}},
+        {'updatedAt': updated_at, '_id': {'$lt': note_id}},
+        {'updatedAt': None},
+    ]}
+
+def list_notes(user_id, limit=50, cursor=None, collection_name='notebooks'):
+    """
+    One page of a user's notes, newest first, with only the list fields
+    (NOTE_LIST_PROJECTION). Pass the returned nextCursor back to get the
+    following page; it is None on the last page. Notes are returned as
+    stored (ObjectId, datetime), to be serialized by bson_json.
+    """
+
+    # Get the appropriate collection
+    if collection_name == 'notebooks':
+        target_collection = notebooks_collection
+    else:
+        target_collection = userdata_collection
+
+    if target_collection is None:
+        logger.error("MongoDB connection not available for collection %s", collection_name)
+        return {'success': False, 'message': 'Database not available'}
+
+    try:
+        query = {'userId': ObjectId(user_id)}
+        if cursor:
+            query.update(after_cursor(*decode_cursor(cursor)))
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        def load_page():
+            # Fetch one extra note to know whether there is a next page
+            notes = list(target_collection.find(query, NOTE_LIST_PROJECTION)
+                         .sort([('updatedAt', -1), ('_id', -1)])
+                         .limit(limit + 1))
+            next_cursor = encode_cursor(notes[limit - 1]) if len(notes) > limit else None
+            return {'notes': notes[:limit], 'nextCursor': next_cursor}
+
+        page = cached_read(collection_name, query['userId'], f'list:{limit}:{cursor or ""}', load_page)
+        return {'success': True, 'notes': page['notes'], 'nextCursor': page['nextCursor']}
+
+    except ValueError as e:
+        return {'success': False, 'message': str(e), 'invalid': True}
+    except Exception as e:
+        logger.error("Error listing user notes: %s", e)
+        return {'success': False, 'message': f'Database error: {str(e)}'}
+
+def get_note(user_id, note_id, collection_name='notebooks'):
+    """
+    Get one of a user's notes, with its full noteText, curTranscript and
+    curSummary, as stored (serialize with bson_json)
+    """
+
+    # Get the appropriate collection
+    if collection_name == 'notebooks':
+        target_collection = notebooks_collection
+    else:
+        target_collection = userdata_collection
+
+    if target_collection is None:
+        logger.error("MongoDB connection not available for collection %s", collection_name)
+        return {'success': False, 'message': 'Database not available'}
+
+    try:
+        try:
+            query = {'_id': ObjectId(note_id), 'userId': ObjectId(user_id)}
+        except Exception as e:
+            logger.warning("Invalid note_id or user_id format: %s", e)
+            return {'success': False, 'message': 'Invalid note ID format', 'invalid': True}
+
+        note = cached_read(collection_name, query['userId'], f"note:{query['_id']}", lambda: target_collection.find_one(query))
+        if note is None:
+            return {'success': False, 'message': 'Note not found', 'notFound': True}
+
+        return {'success': True, 'note': note}
+
+    except Exception as e:
+        logger.error("Error getting note: %s", e)
+        return {'success': False, 'message': f'Database error: {str(e)}'}
+
 
 # LEGACY
 def save_transcript(transcript_data):
@@ -309,7 +576,7 @@ def save_transcript(transcript_data):
             try:
                 data_to_save['userId'] = ObjectId(data_to_save['userId'])
             except Exception as e:
-                logger.warning(f"Invalid userId format: {e}")
+                logger.warning("Invalid userId format: %s", e)
                 # Keep as string if conversion fails
         
         # Insert the transcript
@@ -325,7 +592,7 @@ def save_transcript(transcript_data):
         else:
             return {'success': False, 'message': 'Failed to save transcript'}
     except Exception as e:
-        logger.error(f"Error saving transcript: {e}")
+        logger.error("Error saving transcript: %s", e)
         return {'success': False, 'message': f'Database error: {str(e)}'}
 
 def get_user_transcripts(user_id):
@@ -340,35 +607,15 @@ def get_user_transcripts(user_id):
         # Convert string ID to ObjectId
         object_id = ObjectId(user_id)
         
-        # Find all transcripts for this user, sorted by date (newest first)
+        # Find all transcripts for this user, sorted by date (newest first).
+        # The documents are returned as stored, bson_json serializes them.
         transcripts = list(transcriptions_collection.find(
             {'userId': object_id}
         ).sort('createdAt', -1))
         
-        # Convert ObjectId to string for each transcript
-        for transcript in transcripts:
-            # Convert _id to string
-            if '_id' in transcript:
-                transcript['_id'] = str(transcript['_id'])
-            
-            # Convert userId to string if it's an ObjectId
-            if 'userId' in transcript and isinstance(transcript['userId'], ObjectId):
-                transcript['userId'] = str(transcript['userId'])
-                
-            # Convert createdAt and updatedAt to ISO strings
-            if 'createdAt' in transcript and transcript['createdAt']:
-                transcript['createdAt'] = transcript['createdAt'].isoformat()
-            if 'updatedAt' in transcript and transcript['updatedAt']:
-                transcript['updatedAt'] = transcript['updatedAt'].isoformat()
-            
-            # Ensure any other potential ObjectId fields are converted to strings
-            for key, value in transcript.items():
-                if isinstance(value, ObjectId):
-                    transcript[key] = str(value)
-        
         return {'success': True, 'transcripts': transcripts}
     except Exception as e:
-        logger.error(f"Error getting user transcripts: {e}")
+        logger.error("Error getting user transcripts: %s", e)
         return {'success': False, 'message': f'Database error: {str(e)}'}
 
 def delete_note(note_id, collection_name='notebooks'):
@@ -384,7 +631,7 @@ def delete_note(note_id, collection_name='notebooks'):
         target_collection = userdata_collection
 
     if target_collection is None:
-        logger.error(f"MongoDB connection not available for collection {collection_name}")
+        logger.error("MongoDB connection not available for collection %s", collection_name)
         return {'success': False, 'message': 'Database not available'}
     
     try:
@@ -392,13 +639,14 @@ def delete_note(note_id, collection_name='notebooks'):
         try:
             note_object_id = ObjectId(note_id)
         except Exception as e:
-            logger.warning(f"Invalid note_id format: {e}")
+            logger.warning("Invalid note_id format: %s", e)
             return {'success': False, 'message': 'Invalid note ID format'}
         
-        # Delete the note
-        result = target_collection.delete_one({'_id': note_object_id})
+        # Delete the note, getting its owner back to invalidate their cached reads
+        deleted = target_collection.find_one_and_delete({'_id': note_object_id}, projection={'userId': 1})
         
-        if result.deleted_count > 0:
+        if deleted is not None:
+            invalidate_notes(collection_name, deleted.get('userId'))
             return {
                 'success': True, 
                 'message': 'Note deleted successfully'
@@ -407,5 +655,5 @@ def delete_note(note_id, collection_name='notebooks'):
             return {'success': False, 'message': 'Note not found'}
         
     except Exception as e:
-        logger.error(f"Error deleting note: {e}")
+        logger.error("Error deleting note: %s", e)
         return {'success': False, 'message': f'Database error: {str(e)}'} 
\ No newline at end of file
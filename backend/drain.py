@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+from session_registry import CONNECTING, DRAINING, OPEN
+
+logger = logging.getLogger(__name__)
+
+
+class DrainController:
+    """
+    Graceful shutdown for rolling restarts.
+
+    start() puts the relay in drain mode: accepting() turns False so new
+    recordings are refused, and sessions already recording get up to
+    `timeout` seconds to finish on their own (sessions nobody is attached to
+    any more are stopped right away). Sessions still open at the
+    deadline are stopped through the lifecycle, which flushes their send
+    queue, finishes their upstream connection and waits for it to close so
+    the last transcripts are delivered, for at most `grace` more seconds.
+    exit() is called `flush` seconds after the last session closed, so
+    messages still queued for clients go out first. notify(session_id) is
+    called for each session stopped at the deadline.
+
+    status() reports progress for deploy tooling that waits on the drain.
+    """
+
+    def __init__(self, registry, lifecycle, exit, notify=None, timeout=30.0, grace=10.0, flush=1.0, poll=0.5):
+        self.registry = registry
+        self.lifecycle = lifecycle
+        self.exit = exit
+        self.notify = notify
+        self.timeout = timeout
+        self.grace = grace
+        self.flush = flush
+        self.poll = poll
+        self._lock = threading.Lock()
+        self.reason = None
+        self.started_at = None
+        self.phase = 'serving'  # serving -> waiting -> stopping -> done
+        self.forced_stops = 0
+
+    @property
+    def draining(self):
+        return self.started_at is not None
+
+    def accepting(self):
+        """Whether new recordings may start"""
+        return self.started_at is None
+
+    def start(self, reason='requested'):
+        """Enter drain mode (once). Returns False if a drain was already running"""
+        with self._lock:
+            if self.started_at is not None:
+                return False
+            self.reason = reason
+            self.started_at = time.time()
+            self.phase = 'waiting'
+        logger.warning("Draining (%s): refusing new recordings, waiting up to %ss for %s active sessions",
+                       reason, self.timeout, len(self._active()))
+        threading.Thread(target=self._run, name='drain', daemon=True).start()
+        return True
+
+    def _active(self):
+        return self.registry.sessions_in_state(CONNECTING, OPEN, DRAINING)
+
+    def _wait(self, deadline):
+        while time.time() < deadline:
+            self._stop_abandoned()
+            if not self._active():
+                return True
+            time.sleep(self.poll)
+        return not self._active()
+
+    def _stop_abandoned(self):
+        # Left open for a reconnect that will not come before the restart
+        for session_id in self.registry.sessions_in_state(CONNECTING, OPEN):
+            if not self.registry.sockets_for_session(session_id):
+                logger.info("Drain: stopping session %s, no sockets attached", session_id)
+                self.lifecycle.stop(session_id)
+
+    def _run(self):
+        try:
+            if not self._wait(self.started_at + self.timeout):
+                self.phase = 'stopping'
+                remaining = self.registry.sessions_in_state(CONNECTING, OPEN)
+                logger.warning("Drain deadline reached, stopping %s sessions", len(remaining))
+                for session_id in remaining:
+                    if self.notify is not None:
+                        self.notify(session_id)
+                    self.lifecycle.stop(session_id)
+                    self.forced_stops += 1
+                if not self._wait(time.time() + self.grace):
+                    logger.error("%s sessions did not finish before the drain grace period", len(self._active()))
+            # Emits of the last transcripts may still be on their way to clients
+            time.sleep(self.flush)
+            self.phase = 'done'
+            logger.warning("Drain complete after %.1fs, exiting", time.time() - self.started_at)
+        except Exception as e:
+            logger.error("Error while draining: %s", e, exc_info=True)
+        finally:
+            self.exit()
+
+    def status(self):
+        active = self._active()
+        return {
+            'draining': self.draining,
+            'phase': self.phase,
+            'reason': self.reason,
+            'started_at': self.started_at,
+            'deadline': self.started_at + self.timeout if self.started_at is not None else None,
+            'active_sessions': len(active),
+            'forced_stops': self.forced_stops,
+        }
@@ -0,0 +1,136 @@
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IdleReaper:
+    """
+    Finds sessions that have been idle for longer than timeout seconds
+    without scanning every session.
+
+    Tracked sessions sit in a heap ordered by the earliest time they could
+    expire. Activity updates never touch the heap (they only set the
+    session's last activity time, read back through last_activity(session_id)),
+    so they stay O(1). A tick pops the deadlines that are due: a session that
+    saw activity meanwhile is pushed back with its new deadline, one that no
+    longer tracks activity is forgotten, and the rest are handed to
+    on_idle(session_id, idle_seconds). on_idle returns True once the session
+    has been reaped, or False to check it again a timeout later (e.g. while
+    sockets are still attached).
+
+    A single daemon thread ticks every `tick` seconds; errors in a tick are
+    logged and the loop carries on. Counters: ticks, reaped, last_reaped,
+    max_reaped (per tick), also exported as RelayMetrics gauges by gauges().
+    """
+
+    def __init__(self, last_activity, on_idle, timeout=60.0, tick=1.0):
+        self.last_activity = last_activity
+        self.on_idle = on_idle
+        self.timeout = timeout
+        self.tick = tick
+        self._lock = threading.Lock()
+        self._heap = []         # (deadline, session_id)
+        self._tracked = set()   # Sessions with an entry in the heap
+        self._thread = None
+        self.ticks = 0
+        self.reaped = 0
+        self.last_reaped = 0
+        self.max_reaped = 0
+
+    def track(self, session_id, now=None):
+        """Start watching a session whose last activity time is being kept"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            if session_id in self._tracked:
+                return
+            self._tracked.add(session_id)
+            heapq.heappush(self._heap, (now + self.timeout, session_id))
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def reap(self, now=None):
+        """Run one tick. Returns the number of sessions reaped"""
+        now = now if now is not None else time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+
+        reaped = 0
+        later = []
+        for session_id in due:
+            last_activity = self.last_activity(session_id)
+            if last_activity is None:
+                # No longer tracking activity (stopped or closed)
+                later.append((session_id, None))
+                continue
+            idle_seconds = now - last_activity
+            if idle_seconds <= self.timeout:
+                later.append((session_id, last_activity + self.timeout))
+                continue
+            try:
+                done = self.on_idle(session_id, idle_seconds)
+            except Exception as e:
+                logger.error("Error reaping idle session %s: %s", session_id, e, exc_info=True)
+                done = False
+            if done:
+                reaped += 1
+                later.append((session_id, None))
+            else:
+                later.append((session_id, now + self.timeout))
+
+        with self._lock:
+            for session_id, deadline in later:
+                if deadline is None:
+                    # Unless the session was restarted meanwhile (track() saw it still tracked)
+                    last_activity = self.last_activity(session_id)
+                    if last_activity is None:
+                        self._tracked.discard(session_id)
+                        continue
+                    deadline = last_activity + self.timeout
+                heapq.heappush(self._heap, (deadline, session_id))
+            self.ticks += 1
+            self.reaped += reaped
+            self.last_reaped = reaped
+            self.max_reaped = max(self.max_reaped, reaped)
+        return reaped
+
+    def start(self):
+        """Start the reaper thread (once)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='idle-reaper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                reaped = self.reap()
+                if reaped:
+                    logger.info("Idle reaper: reaped %s sessions this tick (%s)", reaped, self.stats())
+            except Exception as e:
+                logger.error("Error in idle reaper tick: %s", e, exc_info=True)
+
+    def stats(self):
+        return {
+            'tracked': len(self._tracked),
+            'ticks': self.ticks,
+            'reaped': self.reaped,
+            'last_reaped': self.last_reaped,
+            'max_reaped': self.max_reaped,
+        }
+
+    def gauges(self):
+        """The reap counts as RelayMetrics collector entries"""
+        return [
+            ('idle_sessions_tracked', 'Sessions watched by the idle reaper', len(self._tracked)),
+            ('idle_reaped_sessions', 'Idle sessions reaped since the relay started', self.reaped),
+            ('idle_reaped_last_tick', 'Sessions reaped by the last idle reaper tick', self.last_reaped),
+            ('idle_reaped_max_tick', 'Most sessions reaped by one idle reaper tick', self.max_reaped),
+        ]
@@ -0,0 +1,33 @@
+import argparse
+import logging
+import sys
+
+import db
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """Apply the indexes declared in db.INDEXES and check the hot queries use them"""
+    parser = argparse.ArgumentParser(description='Create and verify the MongoDB indexes')
+    parser.add_argument('--check', action='store_true', help='Only verify, do not create indexes')
+    args = parser.parse_args()
+
+    try:
+        if not args.check:
+            created = db.ensure_indexes()
+            logger.info("%s indexes created, the rest already existed", len(created))
+        db.verify_indexes()
+    except db.IndexCheckError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
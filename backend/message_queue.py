@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import socketserver
+import threading
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+logger = logging.getLogger(__name__)
+
+# Scheme of the built-in local message queue, e.g. ipc://127.0.0.1:6390
+IPC_SCHEME = 'ipc'
+
+# Longest message AsyncIPCManager reads from the broker
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server
+        with broker.lock:
+            broker.clients.add(self)
+        try:
+            for line in self.rfile:
+                broker.publish(line)
+        except OSError:
+            pass
+        finally:
+            with broker.lock:
+                broker.clients.discard(self)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """
+    Minimal pub/sub hub for running several relay workers on one machine
+    without Redis: every newline-delimited message a client sends is
+    forwarded to all connected clients, the sender included (Socket.IO's
+    pub/sub managers skip their own messages).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=6390):
+        super().__init__((host, port), _BrokerHandler)
+        self.lock = threading.Lock()
+        self.clients = set()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"{IPC_SCHEME}://{host}:{port}"
+
+    def publish(self, line):
+        # Writing under the lock keeps messages from interleaving
+        with self.lock:
+            for client in list(self.clients):
+                try:
+                    client.wfile.write(line)
+                except OSError:
+                    pass
+
+    def start(self):
+        """Serve on a daemon thread"""
+        thread = threading.Thread(target=self.serve_forever, name='message-broker', daemon=True)
+        thread.start()
+        return thread
+
+
+class IPCManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager that shares emits, rooms and disconnects between
+    workers through a LocalBroker, as RedisManager does through Redis.
+    """
+    name = 'ipc'
+
+    def __init__(self, url='ipc://127.0.0.1:6390', channel='socketio', write_only=False, logger=None):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6390)
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _publish(self, data):
+        line = (json.dumps({'channel': self.channel, 'message': data}) + '\n').encode()
+        with self._publish_lock:
+            for _ in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = socket.create_connection(self.address)
+                    self._publisher.sendall(line)
+                    return
+                except OSError as e:
+                    logger.warning("Message queue publish failed, reconnecting: %s", e)
+                    self._publisher = None
+
+    def _listen(self):
+        while True:
+            try:
+                with socket.create_connection(self.address) as connection:
+                    for line in connection.makefile('rb'):
+                        envelope = json.loads(line)
+                        if envelope.get('channel') == self.channel:
+                            yield envelope['message']
+            except OSError as e:
+                logger.warning("Message queue connection lost, reconnecting: %s", e)
+            self.server.sleep(1)
+
+
+class AsyncIPCManager(AsyncPubSubManager):
+    """
+    IPCManager for the asyncio server. Publishes on the connection it
+    listens on, so everything the broker sends it is read.
+    """
+    name = 'asyncipc'
+
+    def __init__(self, url='ipc://127.0.0.1:6390', channel='socketio', write_only=False, logger=None):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6390)
+        self._writer = None
+        self._connected = asyncio.Event()
+        self._publish_lock = asyncio.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _publish(self, data):
+        line = (json.dumps({'channel': self.channel, 'message': data}) + '\n').encode()
+        async with self._publish_lock:
+            await self._connected.wait()
+            try:
+                self._writer.write(line)
+                await self._writer.drain()
+            except OSError as e:
+                logger.warning("Message queue publish failed: %s", e)
+
+    async def _listen(self):
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_connection(*self.address, limit=MAX_MESSAGE_BYTES)
+                self._connected.set()
+                try:
+                    while line := await reader.readline():
+                        envelope = json.loads(line)
+                        if envelope.get('channel') == self.channel:
+                            yield envelope['message']
+                finally:
+                    self._connected.clear()
+                    self._writer.close()
+            except OSError as e:
+                logger.warning("Message queue connection lost, reconnecting: %s", e)
+            await asyncio.sleep(1)
+
+
+def create_client_manager(url):
+    """
+    Socket.IO client manager for a SOCKETIO_MESSAGE_QUEUE URL: an IPCManager
+    for ipc:// URLs, otherwise None and the URL is handed to Flask-SocketIO's
+    message_queue option (redis://, amqp://, zmq+tcp://, ...)
+    """
+    if url and urlparse(url).scheme == IPC_SCHEME:
+        return IPCManager(url)
+    return None
+
+
+def create_async_client_manager(url):
+    """
+    AsyncServer client manager for a SOCKETIO_MESSAGE_QUEUE URL: an
+    AsyncIPCManager for ipc://, python-socketio's async managers for Redis
+    and AMQP, None without a URL. Raises ValueError for other queues.
+    """
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == IPC_SCHEME:
+        return AsyncIPCManager(url)
+    if scheme in ('redis', 'rediss', 'valkey', 'valkeys'):
+        return socketio.AsyncRedisManager(url)
+    if scheme.startswith('amqp'):
+        return socketio.AsyncAioPikaManager(url)
+    raise ValueError(f"Message queue not supported by the asyncio server: {url}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local message queue for multi-worker relays')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    broker = LocalBroker(args.host, args.port)
+    logger.info("Message broker listening on %s", broker.url)
+    broker.serve_forever()
@@ -0,0 +1,250 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+import bson
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """
+    Byte store behind NotebookCache. LocalCache keeps entries in this
+    process; RedisCache shares them between gunicorn workers. Backends may
+    drop any entry at any time.
+    """
+
+    # Whether every worker sees the same entries
+    shared = False
+
+    def get(self, key):
+        """Value stored under key, or None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store value (bytes) under key, for at most ttl seconds"""
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Store value under key unless it has one. Returns the stored value"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class LocalCache(CacheBackend):
+    """
+    In-process LRU cache with per-entry TTL, bounded by max_entries and by
+    max_bytes of keys and values. Used on its own with a single worker and as
+    the stand-in for a shared backend in tests.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (value, expires_at)
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        # Caller holds self._lock
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(key) + len(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl):
+        # Caller holds self._lock
+        size = len(key) + len(value)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, self._clock() + ttl if ttl else None)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > self._clock()):
+                self._entries.move_to_end(key)
+                return entry[0]
+            self._set(key, value, ttl)
+        return value
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by every worker through Redis 7 or later (needs the redis
+    package, see requirements-redis.txt). client replaces the connection
+    made from url.
+    """
+
+    shared = True
+
+    def __init__(self, url, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._redis = client
+
+    def get(self, key):
+        return self._redis.get(key)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(key, value, ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        # One SET NX GET, so concurrent adds agree on the stored value and no
+        # expiry can fall between setting and reading it
+        current = self._redis.set(key, value, ex=int(ttl) if ttl else None, nx=True, get=True)
+        return value if current is None else current
+
+    def stats(self):
+        info = self._redis.info('stats')
+        return {'evictions': info.get('evicted_keys', 0), 'expirations': info.get('expired_keys', 0)}
+
+
+class NotebookCache:
+    """
+    Read-through cache of per-user notebook reads (lists, list pages and
+    single notebooks).
+
+    Every user has a generation token, and cache keys include it. A write
+    replaces the token, so all cached reads of that user miss from then on
+    and age out of the backend. A read started before a write caches its
+    result under the old token, where no later read looks. With a shared
+    backend the token also serves as a validator (ETag) for the user's
+    notebooks; a local token would not change on workers that missed the
+    write. Values are
+    stored BSON-encoded, so ObjectIds and datetimes come back as they were
+    and callers get their own copy.
+    """
+
+    def __init__(self, backend, ttl=60.0, prefix='notebooks'):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        # Guards the counters, updated from concurrent request threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _generation_key(self, collection, user_id):
+        return f"{self.prefix}:{collection}:{user_id}:generation"
+
+    def generation(self, collection, user_id):
+        """The user's current generation token, created if it has none"""
+        token = os.urandom(8).hex().encode()
+        generation = self.backend.add(self._generation_key(collection, user_id), token, self.ttl)
+        return generation.decode() if isinstance(generation, bytes) else generation
+
+    def read(self, collection, user_id, kind, load):
+        """
+        The cached result of `kind` for the user, or load() stored in the
+        cache. Results of None are not cached.
+        """
+        try:
+            key = f"{self.prefix}:{collection}:{user_id}:{self.generation(collection, user_id)}:{kind}"
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.error("Notebook cache unavailable: %s", e)
+            with self._lock:
+                self.errors += 1
+            return load()
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return bson.decode(cached)['value']
+
+        with self._lock:
+            self.misses += 1
+        value = load()
+        if value is not None:
+            try:
+                self.backend.set(key, bson.encode({'value': value}), self.ttl)
+            except Exception as e:
+                logger.error("Could not store notebook cache entry %s: %s", key, e)
+                with self._lock:
+                    self.errors += 1
+        return value
+
+    def invalidate(self, collection, user_id):
+        """Forget every cached read of the user, after one of their notebooks changed"""
+        with self._lock:
+            self.invalidations += 1
+        try:
+            self.backend.set(self._generation_key(collection, user_id), os.urandom(8).hex().encode(), self.ttl)
+        except Exception as e:
+            # The write itself succeeded, don't fail it; cached reads age out within the TTL
+            logger.error("Could not invalidate notebook cache for %s: %s", user_id, e)
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'errors': self.errors,
+            }
+        stats.update(self.backend.stats())
+        return stats
+
+
+def create_cache_from_env():
+    """
+    Build the NotebookCache configured by NOTEBOOK_CACHE: 'local' (default),
+    a redis:// URL for a cache shared between workers, or 'off' (None).
+    Entries live NOTEBOOK_CACHE_TTL seconds (default 60); the local cache
+    holds up to NOTEBOOK_CACHE_MAX_ENTRIES entries (default 1000) and
+    NOTEBOOK_CACHE_MAX_BYTES bytes (default 64 MB).
+    """
+    setting = os.getenv("NOTEBOOK_CACHE", "local")
+    if setting == 'off':
+        return None
+    if setting.startswith(('redis://', 'rediss://')):
+        backend = RedisCache(setting)
+    else:
+        backend = LocalCache(
+            max_entries=int(os.getenv("NOTEBOOK_CACHE_MAX_ENTRIES", 1000)),
+            max_bytes=int(os.getenv("NOTEBOOK_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        )
+    return NotebookCache(backend, ttl=float(os.getenv("NOTEBOOK_CACHE_TTL", 60)))
@@ -0,0 +1,771 @@
+import logging
+import os
+import time
+from admission import create_admission_from_env
+from audio_buffer import create_buffer_from_env
+from audio_ingest import UnsupportedAudioFormat, decode_audio, negotiate_encoding
+from audio_sender import BLOCK, DROP_OLDEST, create_sender_from_env
+from connection_pool import WarmConnectionPool
+from drain import DrainController
+from idle_reaper import IdleReaper
+from relay_metrics import TRANSCRIPT_BUCKETS, RelayMetrics
+from replay_window import create_replay_window_from_env
+from session_lifecycle import SessionLifecycle
+from session_affinity import topology_from_env
+from session_registry import CLOSED, DRAINING, IDLE, SessionRegistry, SessionRegistryFull, session_room
+from structured_logging import bind_session, create_sampler_from_env, shutdown_logging
+from transcript_batcher import TranscriptBatcher
+from transcript_deltas import TranscriptDeltas
+from transcription_backends import DEFAULT_OPTIONS, create_backend
+from voice_activity import create_vad_from_env
+
+# The transcription relay behind both Socket.IO servers: app_socketio.py
+# (Flask-SocketIO, threading) and app_socketio_async.py (AsyncServer on
+# uvicorn). The servers only translate between their transport and the
+# TranscriptionRelay methods below, so both have the same features.
+
+logger = logging.getLogger(__name__)
+
+# Allow CORS from the main app and production URLs
+CORS_ORIGINS = [
+    'http://127.0.0.1:8000',
+    'http://localhost:8000',
+    'http://localhost:3000',
+    'http://127.0.0.1:3000',
+    'https://firmament-frontend.vercel.app',  # Add Vercel domain explicitly
+    'https://*',
+    'http://*'
+]
+
+# Pooled connections stream interim results, so they serve sessions with and
+# without them; interims are dropped for sessions that did not ask for them.
+POOL_OPTIONS = dict(DEFAULT_OPTIONS, interim_results=True)
+
+
+def admin_authorized(authorization, remote_addr):
+    """Admin endpoints need ADMIN_TOKEN as a bearer token, or a local caller if it is not set"""
+    token = os.getenv("ADMIN_TOKEN")
+    if token:
+        return authorization == f"Bearer {token}"
+    return remote_addr in ('127.0.0.1', '::1')
+
+
+class TranscriptionRelay:
+    """
+    Relays audio from Socket.IO clients to a transcription backend and
+    transcripts back to the session's room.
+
+    The server provides the transport: emit(event, data, room) sends to a
+    room or a single socket and may be called from any thread,
+    enter_room(socket_id, room) and leave_room(socket_id, room) manage room
+    membership of sockets connected to this process. Handlers (connect,
+    disconnect, audio_stream, toggle_transcription) never wait on the network:
+    connection setup and teardown run on the lifecycle's executor and audio
+    goes upstream through each session's sender thread. The exception is
+    AUDIO_SEND_BACKPRESSURE=block, where audio_stream waits for room in a full
+    send queue (see audio_may_block).
+
+    Everything is configured from the environment, as documented in the README.
+    """
+
+    def __init__(self, emit, enter_room, leave_room, backend=None):
+        self.emit = emit
+        self.enter_room = enter_room
+        self.leave_room = leave_room
+
+        # 1 in N sampling of per-packet debug logs (LOG_SAMPLING)
+        self.log_sampler = create_sampler_from_env()
+
+        # Multi-worker mode (see run_workers.py): each session is served by
+        # the worker that owns it
+        self.topology = topology_from_env()
+
+        # Transcription backend: Deepgram, or the offline fake engine (TRANSCRIPTION_BACKEND=fake)
+        self.backend = backend or create_backend()
+
+        # Optional warm pool of idle, already-open connections for the default options
+        warm_pool_size = int(os.getenv("WARM_POOL_SIZE", 0))
+        self.warm_pool = None
+        if warm_pool_size > 0:
+            self.warm_pool = WarmConnectionPool(
+                self.backend,
+                warm_pool_size,
+                POOL_OPTIONS,
+                keepalive_interval=float(os.getenv("WARM_POOL_KEEPALIVE_INTERVAL", 5)),
+                max_age=float(os.getenv("WARM_POOL_MAX_AGE", 300))
+            )
+
+        # Relay metrics, served in the Prometheus text format on /metrics. Counters
+        # and histograms are accumulated per thread, so the audio path takes no lock.
+        self.metrics = RelayMetrics()
+        self.metrics.counter('audio_bytes_in_total', 'Audio bytes received from clients')
+        self.metrics.counter('audio_packets_in_total', 'Audio packets received from clients')
+        self.metrics.counter('audio_bytes_out_total', 'Audio bytes sent upstream')
+        self.metrics.counter('audio_sends_total', 'Upstream audio sends')
+        self.metrics.counter('connection_setups_total', 'Upstream connections opened')
+        self.metrics.counter('connection_setup_failures_total', 'Upstream connections that failed to open')
+        self.metrics.histogram('upstream_send_seconds', 'Time spent in one upstream audio send')
+        self.metrics.histogram('send_queue_wait_seconds', 'Time audio waited in the send queue')
+        self.metrics.histogram('connection_setup_seconds', 'Time to open an upstream connection')
+        self.metrics.histogram('transcript_latency_seconds',
+                               'Time from sending audio upstream to receiving its final transcript',
+                               TRANSCRIPT_BUCKETS)
+
+        # Per-session series, one per active session, are only exported with METRICS_PER_SESSION
+        self.metrics_per_session = os.getenv("METRICS_PER_SESSION", "false").lower() in ("1", "true", "yes")
+
+        # Registry of sessions: upstream connection, attached sockets and last activity.
+        # Each session also gets a bounded buffer for audio that arrives before its
+        # connection is open (AUDIO_BUFFER_MAX_BYTES / _MAX_SECONDS / _POLICY), and a
+        # bounded send queue drained by its own sender thread (AUDIO_SEND_QUEUE_SIZE /
+        # AUDIO_SEND_BACKPRESSURE / AUDIO_SEND_BLOCK_TIMEOUT). The last
+        # REPLAY_WINDOW_SECONDS of sent audio are kept for replay after a reconnect.
+        self.registry = SessionRegistry(
+            stripes=int(os.getenv("SESSION_REGISTRY_STRIPES", 64)),
+            max_sessions=int(os.getenv("SESSION_REGISTRY_MAX_SESSIONS", 10000)),
+            audio_buffer_factory=create_buffer_from_env,
+            sender_factory=self.create_sender,
+            replay_factory=self.create_replay_window
+        )
+
+        # Whether audio_stream can wait for room in a full send queue
+        self.audio_may_block = os.getenv("AUDIO_SEND_BACKPRESSURE", DROP_OLDEST) == BLOCK
+
+        # Gate silence out of raw PCM streams (VAD_* settings in voice_activity.py)
+        self.vad_enabled = os.getenv("VAD_ENABLED", "false").lower() in ("1", "true", "yes")
+
+        # Minimum seconds between interim transcript deltas sent to a session
+        self.interim_emit_interval = float(os.getenv("INTERIM_EMIT_INTERVAL", 0.2))
+
+        # Seconds over which transcript events for a session are batched into one
+        # transcription_batch message (0 sends every event on its own)
+        self.transcript_batch_window = float(os.getenv("TRANSCRIPT_BATCH_MS", 0)) / 1000
+
+        # When did we last print connection stats
+        self.last_stats_time = time.time()
+
+        # Caps on concurrent upstream connections, globally (MAX_UPSTREAM_CONNECTIONS)
+        # and per user (MAX_CONNECTIONS_PER_USER), with a FIFO wait queue of up to
+        # UPSTREAM_QUEUE_SIZE setups over the limit
+        self.admission = create_admission_from_env(on_position=self.notify_queue_position)
+        if self.warm_pool:
+            # Idle pooled connections count against MAX_UPSTREAM_CONNECTIONS too, and
+            # are closed to make room when sessions would have to wait
+            self.warm_pool.admission = self.admission
+            self.admission.reclaim = self.warm_pool.reclaim
+
+        # Stops connections that saw no activity for SESSION_IDLE_TIMEOUT seconds,
+        # checking the sessions due every REAPER_TICK_SECONDS
+        self.reaper = IdleReaper(
+            self.registry.last_activity,
+            self.reap_idle_session,
+            timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", 60)),
+            tick=float(os.getenv("REAPER_TICK_SECONDS", 1))
+        )
+
+        # Connection lifecycle per session: idle -> connecting -> open -> draining -> closed.
+        # Opening and finishing connections runs on a background executor so Socket.IO
+        # handlers always return quickly.
+        self.lifecycle = SessionLifecycle(
+            self.registry,
+            connect=self.open_connection,
+            emit=self.emit,
+            on_open=self.session_opened,
+            on_drain=self.drain_sender,
+            max_workers=int(os.getenv("SESSION_SETUP_WORKERS", 32)),
+            # Replace connections dropped mid-recording (RECONNECT_ATTEMPTS=0 disables)
+            on_reconnect=self.replay_audio,
+            reconnect_attempts=int(os.getenv("RECONNECT_ATTEMPTS", 5)),
+            backoff_base=float(os.getenv("RECONNECT_BACKOFF_BASE", 0.5)),
+            backoff_max=float(os.getenv("RECONNECT_BACKOFF_MAX", 8)),
+            admission=self.admission,
+            # A stopped session waits for the provider's last results (and the close after them)
+            close_timeout=float(os.getenv("CLOSE_WAIT_TIMEOUT", 5))
+        )
+
+        # Drain mode for rolling restarts (SIGTERM or POST /admin/drain): refuse new
+        # recordings, give active ones DRAIN_TIMEOUT seconds to finish, then stop the
+        # rest and exit once their audio and final transcripts are flushed, leaving
+        # DRAIN_FLUSH_SECONDS for queued messages to reach clients
+        self.drain = DrainController(
+            self.registry,
+            self.lifecycle,
+            exit=self.exit_after_drain,
+            notify=self.notify_restart,
+            timeout=float(os.getenv("DRAIN_TIMEOUT", 30)),
+            grace=float(os.getenv("DRAIN_GRACE", 10)),
+            flush=float(os.getenv("DRAIN_FLUSH_SECONDS", 1))
+        )
+
+        self.metrics.collector(self.relay_gauges)
+
+    def start(self):
+        """Start the background work: fill the warm pool before clients arrive, run the idle reaper"""
+        if self.warm_pool:
+            self.warm_pool.start()
+        self.reaper.start()
+
+    def record_send(self, nbytes, send_seconds, wait_seconds):
+        self.metrics.inc('audio_bytes_out_total', nbytes)
+        self.metrics.inc('audio_sends_total')
+        self.metrics.observe('upstream_send_seconds', send_seconds)
+        self.metrics.observe('send_queue_wait_seconds', wait_seconds)
+
+    def notify_backpressure(self, session_id, congested):
+        """Ask the session's clients to slow down (or resume) when its send queue fills up"""
+        status = 'slow_down' if congested else 'resume'
+        self.emit('backpressure', {'status': status}, session_room(session_id))
+
+    def create_sender(self, session_id):
+        return create_sender_from_env(session_id, on_congested=self.notify_backpressure, on_sent=self.record_send)
+
+    def stream_bytes_per_second(self, session_id):
+        # Raw PCM sessions can place their audio on the stream timeline exactly
+        stream_options = self.registry.stream_options(session_id)
+        sample_rate = stream_options.get('sample_rate') if stream_options else None
+        return sample_rate * 2 if sample_rate else None
+
+    def create_replay_window(self, session_id):
+        return create_replay_window_from_env(self.stream_bytes_per_second(session_id))
+
+    def affinity(self, session_id):
+        """URL of the worker that serves a session's audio (null with a single worker)"""
+        return {'url': self.topology.url_for(session_id), 'worker': self.topology.owner(session_id)}
+
+    def owned_here(self, socket_id, session_id, event='connection_error'):
+        """
+        Whether this worker serves the session's audio and upstream connection.
+        If not, tell the socket which worker does.
+        """
+        if self.topology.owns(session_id):
+            return True
+        logger.warning("Socket %s: Session %s belongs to worker %s", socket_id, session_id,
+                       self.topology.owner(session_id))
+        self.emit(event, {'message': 'This session is served by another worker.',
+                          'url': self.topology.url_for(session_id)}, socket_id)
+        return False
+
+    def bind_socket(self, socket_id, session_id):
+        """
+        Attach a socket to a session and to the session's room, moving it out of
+        the room of any previous session. Raises SessionRegistryFull.
+        """
+        previous = self.registry.session_for_socket(socket_id)
+        self.registry.bind_socket(socket_id, session_id)
+        if previous is not None and previous != session_id:
+            self.leave_room(socket_id, session_room(previous))
+        self.enter_room(socket_id, session_room(session_id))
+
+    def emit_transcript(self, session_id, payload):
+        """Broadcast a transcription_update to the session's room: one serialization, one emit"""
+        self.emit('transcription_update', payload, session_room(session_id))
+
+    def emit_transcripts(self, session_id, payloads):
+        """Broadcast several transcript events as one transcription_batch message"""
+        self.emit('transcription_batch', {'updates': payloads}, session_room(session_id))
+
+    def initialize_deepgram_connection(self, session_id):
+        registry = self.registry
+        backend = self.backend
+        try:
+            # Initialize a transcription connection for a specific user
+            logger.info("Initializing %s connection for session %s", backend.name, session_id)
+
+            # Raw PCM sessions need their encoding passed upstream, and sessions
+            # can opt into interim results
+            stream_options = registry.stream_options(session_id)
+            options = dict(DEFAULT_OPTIONS, **stream_options) if stream_options else DEFAULT_OPTIONS
+
+            # Transcript events for the session's room, optionally batched over a short window
+            batcher = TranscriptBatcher(
+                lambda payload: self.emit_transcript(session_id, payload),
+                lambda payloads: self.emit_transcripts(session_id, payloads),
+                self.transcript_batch_window
+            )
+
+            # Interim results go out as rate-limited replace-from-offset deltas
+            deltas = None
+            if options.get('interim_results'):
+                deltas = TranscriptDeltas(batcher.add, self.interim_emit_interval)
+
+            def on_open():
+                try:
+                    logger.info("Session %s: Deepgram connection opened", session_id)
+                    # Track that this connection is active
+                    registry.touch(session_id)
+                except Exception as e:
+                    logger.error("Error in on_open handler: %s", e)
+
+            def on_message(result):
+                try:
+                    # Update activity timestamp
+                    registry.touch(session_id)
+
+                    # Place the result on the session's timeline and drop results
+                    # for audio replayed after a reconnect that was already transcribed
+                    replay = registry.replay_window(session_id)
+                    result.start += dg_connection.stream_offset
+                    if replay.is_duplicate(result.start + result.duration):
+                        return
+                    if result.is_final:
+                        end = result.start + result.duration
+                        replay.cover(end)
+                        sent_at = replay.arrival_time(end)
+                        if sent_at is not None:
+                            self.metrics.observe('transcript_latency_seconds', time.monotonic() - sent_at)
+
+                    if deltas is not None:
+                        deltas.push(result)
+                        return
+                    if not result.is_final:
+                        # Interim result of a pooled connection, not asked for
+                        return
+
+                    transcript = result.text
+                    if len(transcript) > 0:
+                        # Only log non-empty transcripts
+                        logger.info("Session %s transcript received: %.30s...", session_id, transcript,
+                                    extra={'session_id': session_id})
+                        batcher.add({
+                            'transcription': transcript,
+                            'start': result.start,
+                            'duration': result.duration
+                        })
+                except Exception as e:
+                    logger.error("Error in on_message handler: %s", e, exc_info=True)
+
+            def on_close():
+                try:
+                    logger.info("Session %s: Deepgram connection closed", session_id)
+                    if deltas is not None:
+                        deltas.close()
+                    batcher.close()
+                    # If this was the session's live connection, return it to idle
+                    self.lifecycle.connection_closed(session_id, dg_connection)
+                except Exception as e:
+                    logger.error("Error in on_close handler: %s", e)
+
+            def on_error(error):
+                try:
+                    logger.error("Session %s error: %s", session_id, error)
+                except Exception as e:
+                    logger.error("Error in on_error handler: %s", e)
+
+            def on_metadata(metadata):
+                try:
+                    # Only log important metadata
+                    logger.debug("Session %s metadata received", session_id)
+                    registry.touch(session_id)  # Update activity
+                except Exception as e:
+                    logger.error("Error in on_metadata handler: %s", e)
+
+            handlers = dict(
+                on_open=on_open,
+                on_transcript=on_message,
+                on_metadata=on_metadata,
+                on_error=on_error,
+                on_close=on_close
+            )
+
+            # Take an already-open connection from the warm pool if there is one
+            # (pooled connections are opened with POOL_OPTIONS, so they only serve
+            # sessions that do not change anything else, like the encoding)
+            poolable = self.warm_pool and not set(stream_options or ()) - {'interim_results'}
+            dg_connection = self.warm_pool.acquire() if poolable else None
+            if dg_connection:
+                # Rebind its callbacks to this session
+                dg_connection.bind(**handlers)
+                logger.info("Session %s: Using warm pool connection (%s)", session_id, self.warm_pool.stats())
+                return dg_connection
+
+            # Register all event handlers
+            dg_connection = backend.create_connection(session_id)
+            dg_connection.bind(**handlers)
+
+            if not dg_connection.start(options):
+                logger.error("Session %s: Failed to start connection", session_id)
+                return None
+
+            logger.info("Session %s: %s connection started successfully", session_id, backend.name)
+            return dg_connection
+        except Exception as e:
+            logger.error("Error initializing %s connection for session %s: %s", backend.name, session_id, e,
+                         exc_info=True)
+            return None
+
+    def open_connection(self, session_id):
+        """initialize_deepgram_connection, timed for the connection setup metrics"""
+        started = time.monotonic()
+        conn = self.initialize_deepgram_connection(session_id)
+        if conn is None:
+            self.metrics.inc('connection_setup_failures_total')
+        else:
+            self.metrics.inc('connection_setups_total')
+            self.metrics.observe('connection_setup_seconds', time.monotonic() - started)
+        return conn
+
+    def forward(self, session_id, conn, packet):
+        """Queue a packet for the upstream connection, keeping it for replay after a reconnect"""
+        self.registry.replay_window(session_id).append(packet)
+        self.registry.sender(session_id).put(conn, packet)
+
+    def flush_audio_buffer(self, session_id, conn):
+        """Send audio buffered while the session had no connection, in arrival order"""
+        buffer = self.registry.audio_buffer(session_id, create=False)
+        if buffer is None:
+            return
+        with buffer.lock:
+            packets = buffer.drain()
+            for packet in packets:
+                self.forward(session_id, conn, packet)
+        if packets:
+            logger.info("Session %s: Flushed %s buffered audio packets (%s)", session_id, len(packets), buffer.stats())
+
+    def send_audio(self, session_id, conn, binary_data):
+        """
+        Queue audio for the session's sender thread without overtaking packets
+        still waiting in the buffer
+        """
+        buffer = self.registry.audio_buffer(session_id, create=False)
+        if buffer is None:
+            self.forward(session_id, conn, binary_data)
+            return
+        with buffer.lock:
+            if len(buffer):
+                buffer.append(binary_data)
+                for packet in buffer.drain():
+                    self.forward(session_id, conn, packet)
+            else:
+                self.forward(session_id, conn, binary_data)
+
+    def drain_sender(self, session_id, conn):
+        """Let queued audio reach the connection before it is finished"""
+        sender = self.registry.sender(session_id, create=False)
+        if sender is not None and not sender.wait_empty(timeout=float(os.getenv("AUDIO_SEND_DRAIN_TIMEOUT", 5))):
+            logger.warning("Session %s: Send queue not drained before stop (%s packets left)", session_id, len(sender))
+
+    def replay_audio(self, session_id, old_conn, conn, gap_seconds):
+        """
+        After a reconnect, resend the audio the old connection received but never
+        transcribed, ahead of the audio buffered while reconnecting
+        """
+        sender = self.registry.sender(session_id)
+        # Packets still queued for the dead connection are part of the replayed tail
+        sender.discard(old_conn)
+        replay = self.registry.replay_window(session_id)
+        start, packets = replay.tail()
+        conn.stream_offset = start
+        for packet in packets:
+            sender.put(conn, packet)
+        replayed_bytes = sum(len(packet) for packet in packets)
+        replay.reconnected(gap_seconds, replayed_bytes)
+        logger.info("Session %s: Replaying %s bytes of audio from %.2fs after a %.3fs gap (%s)",
+                    session_id, replayed_bytes, start, gap_seconds, replay.stats())
+
+    def negotiate_stream(self, socket_id, session_id, args):
+        """
+        Set the session's upstream options from the query parameters (args)
+        of the socket starting it, before its connection is opened. Sockets
+        that send raw PCM (encoding=linear16&sampleRate=<hz>) set the upstream
+        encoding and, with VAD_ENABLED, a voice activity gate;
+        interimResults=true turns on interim results sent as deltas. The
+        session's replay window starts a new stream timeline in the
+        negotiated encoding.
+        """
+        options = negotiate_encoding(args.get('encoding'), args.get('sampleRate'))
+        if args.get('interimResults') == 'true':
+            options = dict(options or {}, interim_results=True)
+        if self.registry.stream_options(session_id) != options:
+            vad = None
+            if self.vad_enabled and options and 'sample_rate' in options:
+                vad = create_vad_from_env(options['sample_rate'])
+            self.registry.configure_stream(session_id, options, vad)
+        self.registry.replay_window(session_id).reset(self.stream_bytes_per_second(session_id))
+        logger.info("Socket %s: Stream options %s", socket_id, options or 'default')
+
+    def notify_queue_position(self, session_id, position):
+        """Tell a session's clients where its connection request is in the wait queue"""
+        self.emit('queue_position', {'position': position}, session_room(session_id))
+
+    def reap_idle_session(self, session_id, idle_seconds):
+        """Stop an idle session's connection once no socket is attached to it any more"""
+        if self.registry.sockets_for_session(session_id):
+            return False
+        logger.info("Cleaning up inactive session %s (inactive for %.1fs)", session_id, idle_seconds)
+        self.lifecycle.stop(session_id)
+        return True
+
+    def session_opened(self, session_id, conn):
+        self.reaper.track(session_id)
+        self.flush_audio_buffer(session_id, conn)
+
+    def exit_after_drain(self):
+        shutdown_logging()
+        os._exit(0)
+
+    def notify_restart(self, session_id):
+        """Tell a session's clients its recording was stopped for a restart"""
+        self.emit('deepgram_stopped', {'status': 'restarting', 'message': 'Server is restarting'},
+                  session_room(session_id))
+
+    def relay_gauges(self):
+        """Gauges for /metrics, read from the registry, admission and idle reaper stats at scrape time"""
+        stats = self.registry.stats()
+        upstream = self.admission.stats()
+        gauges = [
+            ('active_sessions', 'Sessions with an open upstream connection', stats['connections']),
+            ('attached_sockets', 'Client sockets attached to a session', stats['sockets']),
+            ('buffered_audio_bytes', 'Audio bytes held while a connection opens', stats['buffered_bytes']),
+            ('send_queue_packets', 'Audio packets waiting in send queues', stats['queued_packets']),
+            ('admission_waiting', 'Connection setups waiting for an upstream slot', upstream['waiting']),
+            *self.reaper.gauges(),
+        ]
+        if self.metrics_per_session:
+            sender_stats = self.registry.sender_stats()
+            gauges.append(('session_sent_bytes', 'Audio bytes sent upstream per session',
+                           {session_id: s['sent_bytes'] for session_id, s in sender_stats.items()}, 'session'))
+            gauges.append(('session_send_queue_depth', 'Packets waiting in the send queue per session',
+                           {session_id: s['depth'] for session_id, s in sender_stats.items()}, 'session'))
+        return gauges
+
+    def log_stats(self):
+        """Print connection stats, at most every 60 seconds"""
+        registry = self.registry
+        current_time = time.time()
+        if current_time - self.last_stats_time <= 60:
+            return
+        self.last_stats_time = current_time
+        stats = registry.stats()
+        logger.info("Active connections: %s, Socket mappings: %s, Buffered bytes: %s, Dropped bytes: %s",
+                    stats['connections'], stats['sockets'], stats['buffered_bytes'], stats['dropped_bytes'])
+        if self.warm_pool:
+            logger.info("Warm pool: %s", self.warm_pool.stats())
+        logger.info("Upstream admission: %s", self.admission.stats())
+        logger.info("Idle reaper: %s", self.reaper.stats())
+        sender_stats = registry.sender_stats()
+        packets = sum(s['sent_packets'] for s in sender_stats.values())
+        frames = sum(s['sent_frames'] for s in sender_stats.values())
+        logger.info("Sent %s audio packets in %s upstream sends (batching ratio %.2f)",
+                    packets, frames, packets / frames if frames else 0.0)
+        replay_stats = registry.replay_stats().values()
+        reconnects = sum(s['reconnects'] for s in replay_stats)
+        if reconnects:
+            logger.info("Reconnects: %s, longest gap %.3fs, duplicate transcripts dropped: %s", reconnects,
+                        max(s['gap_seconds_max'] for s in replay_stats),
+                        sum(s['duplicates_dropped'] for s in replay_stats))
+        for gated_session, vad_stats in registry.vad_stats().items():
+            logger.info("VAD for session %s: suppressed %.1f%% of %s bytes", gated_session,
+                        vad_stats['suppressed_fraction'] * 100, vad_stats['total_bytes'])
+        # Sessions whose send queue is falling behind
+        lagging = sorted(sender_stats.items(), key=lambda item: item[1]['depth'], reverse=True)[:5]
+        for lagging_session, session_stats in lagging:
+            if session_stats['depth'] or session_stats['dropped_packets']:
+                logger.info("Send queue for session %s: %s", lagging_session, session_stats)
+
+    def audio_stream(self, socket_id, data, args):
+        registry = self.registry
+        try:
+            # Get session ID from socket-to-session mapping
+            session_id = registry.session_for_socket(socket_id)
+
+            # If session ID not found in mapping, try to extract from data
+            if not session_id:
+                if isinstance(data, dict) and 'userId' in data:
+                    session_id = data['userId']
+                    try:
+                        self.bind_socket(socket_id, session_id)
+                    except SessionRegistryFull as e:
+                        logger.error("Socket %s: Cannot register session %s: %s", socket_id, session_id, e)
+                        self.emit('connection_lost', {'message': 'Server is at capacity. Please try again later.'},
+                                  socket_id)
+                        return
+                    logger.info("Mapped socket %s to session %s from audio payload", socket_id, session_id)
+                else:
+                    logger.error("Socket %s: No session ID found for audio stream", socket_id)
+                    self.emit('connection_lost', {'message': 'Session not found. Please refresh the page.'},
+                              socket_id)
+                    return
+
+            # A session's audio must reach the worker holding its connection
+            if not self.owned_here(socket_id, session_id, 'connection_lost'):
+                return
+            bind_session(session_id)
+
+            self.log_stats()
+
+            # Binary attachments pass through as received; base64 and file-like
+            # payloads are decoded
+            try:
+                binary_data = decode_audio(data)
+            except UnsupportedAudioFormat as e:
+                logger.error(str(e))
+                self.emit('deepgram_error', {'error': 'Unsupported audio format'}, socket_id)
+                return
+
+            self.metrics.inc('audio_packets_in_total')
+            self.metrics.inc('audio_bytes_in_total', len(binary_data))
+
+            # Log some packets to help with debugging
+            if self.log_sampler.due('audio_packet'):
+                logger.info("Audio packet from session %s: type=%s, size=%d bytes",
+                            session_id, type(binary_data).__name__, len(binary_data))
+
+            # Check the state of this session's connection
+            state, conn = registry.get_state(session_id)
+            if state in (DRAINING, CLOSED):
+                # Late packets from a recording that has been stopped
+                return
+
+            # Drop silence for PCM sessions with a voice activity gate
+            vad = registry.vad(session_id)
+            if vad is not None:
+                binary_data = vad.process(binary_data)
+                if not binary_data:
+                    # Keep the upstream stream open through long silences
+                    if conn and vad.keepalive_due():
+                        registry.sender(session_id).keep_alive(conn)
+                    return
+            if not conn:
+                # Hold the packet until a connection opens instead of dropping it
+                registry.audio_buffer(session_id).append(binary_data)
+
+                # Try to create a new connection in the background
+                if state == IDLE and self.drain.accepting() and registry.warn_once(session_id):
+                    logger.warning("Session %s: Received audio but no active connection exists, "
+                                   "attempting to create one", session_id)
+                    self.negotiate_stream(socket_id, session_id, args)
+                    self.lifecycle.start(session_id, socket_id, failure_event='connection_lost')
+                return
+
+            # Update activity timestamp
+            registry.touch(session_id)
+
+            # Send the audio data to Deepgram API
+            try:
+                self.send_audio(session_id, conn, binary_data)
+                if self.log_sampler.due('audio_sent'):
+                    logger.info("Successfully sent %d bytes to Deepgram for session %s", len(binary_data), session_id)
+            except Exception as e:
+                logger.error("Error sending data to Deepgram: %s", e)
+                self.emit('deepgram_error', {'error': f'Error sending audio: {str(e)}'}, socket_id)
+
+        except Exception as e:
+            logger.error("Error handling audio stream: %s", e, exc_info=True)
+
+    def toggle_transcription(self, socket_id, data, args):
+        registry = self.registry
+        try:
+            # Get session ID from mapping or from payload
+            session_id = registry.session_for_socket(socket_id)
+            if not session_id and isinstance(data, dict) and 'userId' in data:
+                session_id = data.get('userId')
+                try:
+                    self.bind_socket(socket_id, session_id)
+                except SessionRegistryFull as e:
+                    logger.error("Socket %s: Cannot register session %s: %s", socket_id, session_id, e)
+                    self.emit('connection_error', {'message': 'Server is at capacity. Please try again later.'},
+                              socket_id)
+                    return
+                logger.info("Mapped socket %s to session %s from toggle event", socket_id, session_id)
+
+            if not session_id:
+                logger.error("Socket %s: No session ID found for toggle_transcription", socket_id)
+                self.emit('connection_error', {'message': 'Session not found. Please refresh the page.'}, socket_id)
+                return
+
+            if not self.owned_here(socket_id, session_id):
+                return
+            bind_session(session_id)
+
+            logger.info("Session %s: toggle_transcription %s", session_id, data)
+            action = data.get("action")
+
+            # Setup and teardown run in the background, the outcome is reported
+            # with deepgram_ready / connection_error / deepgram_stopped
+            if action == "start":
+                if not self.drain.accepting():
+                    logger.info("Session %s: Refusing to start while draining", session_id)
+                    self.emit('connection_error', {'message': 'Server is restarting. Please try again in a moment.'},
+                              socket_id)
+                    return
+                logger.info("Session %s: Starting Deepgram connection", session_id)
+                # Settle the session's audio encoding before a connection is opened
+                # for it; a new recording starts a new stream timeline
+                self.negotiate_stream(socket_id, session_id, args)
+                self.lifecycle.start(session_id, socket_id)
+
+            elif action == "stop":
+                logger.info("Session %s: Stopping Deepgram connection", session_id)
+                # Audio still waiting for a connection belongs to the stopped recording
+                buffer = registry.audio_buffer(session_id, create=False)
+                if buffer is not None:
+                    buffer.clear()
+                self.lifecycle.stop(session_id, socket_id)
+        except Exception as e:
+            logger.error("Error handling toggle_transcription: %s", e, exc_info=True)
+
+    def connect(self, socket_id, args):
+        registry = self.registry
+        try:
+            # Extract userId from connection query params
+            session_id = args.get('userId')
+
+            if not session_id:
+                logger.warning("Socket %s connected without userId", socket_id)
+                self.emit('connection_error', {'message': 'No session ID provided. Please refresh the page.'},
+                          socket_id)
+                return
+
+            # Store the mapping between socket ID and session ID
+            try:
+                self.bind_socket(socket_id, session_id)
+            except SessionRegistryFull as e:
+                logger.error("Socket %s: Cannot register session %s: %s", socket_id, session_id, e)
+                self.emit('connection_error', {'message': 'Server is at capacity. Please try again later.'},
+                          socket_id)
+                return
+
+            # Per-user connection caps count the user's account, not the
+            # per-recording session ID
+            account_id = args.get('accountId')
+            if account_id:
+                registry.set_account(session_id, account_id)
+
+            logger.info('Client connected: Socket %s, Session %s', socket_id, session_id)
+
+            # Check if there's already an active connection for this session
+            if registry.get_connection(session_id):
+                # If we have a recent activity timestamp, reuse connection
+                last_activity = registry.last_activity(session_id)
+                if last_activity is not None and (time.time() - last_activity) < 60:
+                    logger.info("Session %s: Reusing existing Deepgram connection", session_id)
+                    self.emit('deepgram_ready', {'status': 'connected'}, socket_id)
+                else:
+                    # Connection exists but might be stale
+                    logger.info("Session %s: Existing connection may be stale", session_id)
+                    self.emit('server_status', {'status': 'connected', 'note': 'May need to restart recording'},
+                              socket_id)
+            else:
+                # No existing connection
+                self.emit('server_status', {'status': 'connected'}, socket_id)
+        except Exception as e:
+            logger.error("Error handling connect: %s", e)
+
+    def disconnect(self, socket_id):
+        try:
+            # Remove the socket-to-session mapping
+            session_id, other_sockets = self.registry.unbind_socket(socket_id)
+
+            logger.info('Client disconnected: Socket %s, Session %s', socket_id, session_id)
+
+            # Don't immediately close Deepgram connection on disconnect
+            # Check if any other sockets are using this session
+            if session_id:
+                # Only clean up if this was the last socket AND connection is inactive
+                if not other_sockets:
+                    # Keep connection open for a short time to allow for reconnects
+                    # The idle reaper will remove it if no reconnection occurs
+                    logger.info("Session %s: Last socket disconnected, keeping connection for possible reconnect",
+                                session_id)
+        except Exception as e:
+            logger.error("Error handling disconnect: %s", e)
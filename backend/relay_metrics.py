@@ -0,0 +1,128 @@
+import bisect
+import itertools
+import threading
+
+# Histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRANSCRIPT_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+class _Shard:
+    """One stripe of counters and histogram buckets, written under its own lock"""
+    __slots__ = ('lock', 'counters', 'histograms')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}  # name -> [bucket counts..., +Inf count, sum]
+
+
+class RelayMetrics:
+    """
+    Counters and histograms for the relay, exported in the Prometheus text
+    format.
+
+    Writes are spread over a fixed number of stripes, each with its own lock.
+    A thread is assigned a stripe round-robin the first time it records, so
+    concurrent handlers rarely share one and the hot path never waits on a
+    lock common to every thread. Memory stays fixed however many short-lived
+    handler threads record; stripes are only summed when the metrics are
+    scraped.
+
+    Metrics are declared up front with counter() / histogram(); gauges are
+    computed at scrape time by collectors, callables returning
+    [(name, help, value)] or [(name, help, {label_value: value}, label)].
+    """
+
+    def __init__(self, prefix='relay', stripes=16):
+        self.prefix = prefix
+        self._local = threading.local()
+        self._shards = [_Shard() for _ in range(stripes)]
+        self._next_shard = itertools.count()
+        self._help = {}
+        self._buckets = {}
+        self._collectors = []
+
+    def counter(self, name, help):
+        self._help[name] = ('counter', help)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._help[name] = ('histogram', help)
+        self._buckets[name] = buckets
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # next() on itertools.count is atomic under the GIL
+            shard = self._local.shard = self._shards[next(self._next_shard) % len(self._shards)]
+        return shard
+
+    def inc(self, name, value=1):
+        shard = self._shard()
+        with shard.lock:
+            shard.counters[name] = shard.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        shard = self._shard()
+        buckets = self._buckets[name]
+        index = bisect.bisect_left(buckets, value)
+        with shard.lock:
+            counts = shard.histograms.get(name)
+            if counts is None:
+                counts = shard.histograms[name] = [0] * (len(buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        """Summed counters and histograms across stripes"""
+        total = _Shard()
+        for shard in self._shards:
+            with shard.lock:
+                for name, value in shard.counters.items():
+                    total.counters[name] = total.counters.get(name, 0) + value
+                for name, counts in shard.histograms.items():
+                    merged = total.histograms.get(name)
+                    if merged is None:
+                        merged = total.histograms[name] = [0] * len(counts)
+                    for index, count in enumerate(counts):
+                        merged[index] += count
+        return total
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        total = self.snapshot()
+        lines = []
+        for name, (kind, help) in self._help.items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == 'counter':
+                lines.append(f"{full} {total.counters.get(name, 0)}")
+                continue
+            buckets = self._buckets[name]
+            counts = total.histograms.get(name) or [0] * (len(buckets) + 2)
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append(f'{full}_bucket{{le="{bound}"}} {cumulative}')
+            cumulative += counts[len(buckets)]
+            lines.append(f'{full}_bucket{{le="+Inf"}} {cumulative}')
+            lines.append(f"{full}_sum {counts[-1]}")
+            lines.append(f"{full}_count {cumulative}")
+
+        for collect in self._collectors:
+            for entry in collect():
+                full = f"{self.prefix}_{entry[0]}"
+                lines.append(f"# HELP {full} {entry[1]}")
+                lines.append(f"# TYPE {full} gauge")
+                if len(entry) == 3:
+                    lines.append(f"{full} {entry[2]}")
+                    continue
+                _, _, values, label = entry
+                for label_value, value in values.items():
+                    escaped = str(label_value).replace('\\', '\\\\').replace('"', '\\"')
+                    lines.append(f'{full}{{{label}="{escaped}"}} {value}')
+        return '\n'.join(lines) + '\n'
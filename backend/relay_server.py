@@ -0,0 +1,30 @@
+import importlib
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Entry point of the transcription relay. SOCKETIO_ASYNC_MODE picks the
+# server before either one is imported, so only its stack is built:
+#   threading  Flask-SocketIO, a thread per client socket (app_socketio.py)
+#   asyncio    python-socketio's AsyncServer on uvicorn, one event loop for
+#              all client sockets and Deepgram connections (app_socketio_async.py)
+# Both run the same relay, see relay.py.
+
+SERVER_MODULES = {
+    'threading': 'app_socketio',
+    'asyncio': 'app_socketio_async',
+}
+
+
+def main():
+    load_dotenv()
+    mode = os.getenv("SOCKETIO_ASYNC_MODE", "threading")
+    if mode not in SERVER_MODULES:
+        sys.exit(f"Unknown SOCKETIO_ASYNC_MODE {mode!r}, expected one of: {', '.join(SERVER_MODULES)}")
+    server = importlib.import_module(SERVER_MODULES[mode])
+    server.main()
+
+
+if __name__ == '__main__':
+    main()
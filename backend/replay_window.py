@@ -0,0 +1,146 @@
+import collections
+import os
+import threading
+import time
+
+# Transcripts ending within this many seconds of already covered audio count as duplicates
+DUPLICATE_TOLERANCE = 0.05
+
+
+class ReplayWindow:
+    """
+    Rolling window of the audio a session recently sent upstream, kept so it
+    can be replayed to a new connection after the old one dropped.
+
+    Packets are placed on the session's stream timeline: exactly for raw PCM
+    (bytes_per_second known), otherwise by arrival time, which matches media
+    time for real-time capture. Final transcripts mark the timeline as
+    covered; tail() returns the packets past that point. For containerized
+    audio the stream's first packet (the container header) is kept and
+    replayed ahead of the tail.
+
+    is_duplicate() / cover() let the transcript handler drop results for
+    audio that was already transcribed before the reconnect, and
+    arrival_time() tells it when the audio a transcript refers to was sent.
+    """
+
+    def __init__(self, max_seconds=10.0, bytes_per_second=None):
+        self.max_seconds = max_seconds
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._packets = collections.deque()  # (offset_seconds, data, appended_at)
+        self._header = None
+        self._started = None
+        self._sent_bytes = 0
+        self.covered_until = 0.0
+        self.reconnects = 0
+        self.gap_seconds_total = 0.0
+        self.gap_seconds_max = 0.0
+        self.replayed_bytes = 0
+        self.duplicates_dropped = 0
+
+    def _offset(self, now):
+        # Caller holds self._lock
+        if self.bytes_per_second:
+            return self._sent_bytes / self.bytes_per_second
+        return now - self._started
+
+    @property
+    def end(self):
+        """Stream offset just past the last packet sent"""
+        with self._lock:
+            if self._started is None:
+                return 0.0
+            return self._offset(time.monotonic())
+
+    def append(self, data, now=None):
+        """Record a packet that is being sent upstream"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            if self._started is None:
+                self._started = now
+                if not self.bytes_per_second:
+                    self._header = data
+            self._packets.append((self._offset(now), data, now))
+            self._sent_bytes += len(data)
+            horizon = self._packets[-1][0] - self.max_seconds
+            while self._packets and self._packets[0][0] < horizon:
+                self._packets.popleft()
+
+    def tail(self):
+        """
+        (start_offset, packets) to replay: the audio past the covered point,
+        preceded by the container header if the tail does not start with it
+        """
+        with self._lock:
+            packets = [(offset, data) for offset, data, _ in self._packets if offset >= self.covered_until]
+            if not packets:
+                return self._offset(time.monotonic()) if self._started is not None else 0.0, []
+            start = packets[0][0]
+            data = [data for _, data in packets]
+            if self._header is not None and data[0] is not self._header:
+                data.insert(0, self._header)
+        return start, data
+
+    def arrival_time(self, offset):
+        """
+        time.monotonic() at which the packet holding stream offset `offset` was
+        sent, or None if it is no longer in the window
+        """
+        with self._lock:
+            # Transcripts refer to recent audio, so search from the newest packet
+            for packet_offset, _, appended_at in reversed(self._packets):
+                if packet_offset <= offset:
+                    return appended_at
+        return None
+
+    def cover(self, end):
+        """Mark the stream up to `end` seconds as transcribed"""
+        with self._lock:
+            self.covered_until = max(self.covered_until, end)
+
+    def is_duplicate(self, end):
+        """Whether a transcript ending at `end` seconds repeats already covered audio"""
+        with self._lock:
+            if self.covered_until and end <= self.covered_until + DUPLICATE_TOLERANCE:
+                self.duplicates_dropped += 1
+                return True
+            return False
+
+    def reconnected(self, gap_seconds, replayed_bytes):
+        """Count a reconnect that left `gap_seconds` without a connection"""
+        with self._lock:
+            self.reconnects += 1
+            self.gap_seconds_total += gap_seconds
+            self.gap_seconds_max = max(self.gap_seconds_max, gap_seconds)
+            self.replayed_bytes += replayed_bytes
+
+    def reset(self, bytes_per_second=None):
+        """
+        Forget the stream, e.g. when a new recording starts. The new stream
+        may have another encoding: bytes_per_second for raw PCM, else None.
+        """
+        with self._lock:
+            self.bytes_per_second = bytes_per_second
+            self._packets.clear()
+            self._header = None
+            self._started = None
+            self._sent_bytes = 0
+            self.covered_until = 0.0
+
+    def stats(self):
+        return {
+            'reconnects': self.reconnects,
+            'gap_seconds_total': self.gap_seconds_total,
+            'gap_seconds_max': self.gap_seconds_max,
+            'replayed_bytes': self.replayed_bytes,
+            'duplicates_dropped': self.duplicates_dropped,
+        }
+
+
+def create_replay_window_from_env(bytes_per_second=None):
+    """Build a ReplayWindow holding REPLAY_WINDOW_SECONDS of audio"""
+    return ReplayWindow(
+        max_seconds=float(os.getenv("REPLAY_WINDOW_SECONDS", 10)),
+        bytes_per_second=bytes_per_second
+    )
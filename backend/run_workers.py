@@ -0,0 +1,77 @@
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from message_queue import IPC_SCHEME, LocalBroker
+
+# Runs the Socket.IO relay as several worker processes on one machine, in
+# the server mode set by SOCKETIO_ASYNC_MODE (see relay_server.py).
+# Worker i listens on --port + i. Workers share emits and rooms through
+# --queue (a Redis URL, or by default the built-in local broker, which this
+# script then hosts). A load balancer in front should route clients with
+# the /affinity endpoint, see session_affinity.py.
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker_env(index, workers, port, queue, public_url):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port + index),
+        'WORKER_INDEX': str(index),
+        'WORKER_URLS': ','.join(public_url.format(port=port + i, index=i) for i in range(workers)),
+        'SOCKETIO_MESSAGE_QUEUE': queue,
+    })
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Socket.IO relay as several worker processes')
+    parser.add_argument('--workers', type=int, default=int(os.getenv("RELAY_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", 5001)), help='Port of the first worker')
+    parser.add_argument('--queue', default=os.getenv("SOCKETIO_MESSAGE_QUEUE", f"{IPC_SCHEME}://127.0.0.1:6390"),
+                        help='Message queue URL shared by the workers')
+    parser.add_argument('--public-url', default=os.getenv("WORKER_PUBLIC_URL", "http://127.0.0.1:{port}"),
+                        help='URL clients use to reach a worker, {port} and {index} are filled in')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    broker = None
+    if args.queue.startswith(f"{IPC_SCHEME}://"):
+        host, _, port = args.queue[len(IPC_SCHEME) + 3:].partition(':')
+        broker = LocalBroker(host or '127.0.0.1', int(port or 6390))
+        broker.start()
+        logger.info("Message broker listening on %s", broker.url)
+
+    processes = [
+        subprocess.Popen([sys.executable, 'relay_server.py'], cwd=BACKEND_DIR,
+                         env=worker_env(index, args.workers, args.port, args.queue, args.public_url))
+        for index in range(args.workers)
+    ]
+    logger.info("Started %s relay workers on ports %s-%s", args.workers, args.port, args.port + args.workers - 1)
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        # If one worker dies the others keep serving their sessions; exit once all are gone
+        while any(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    finally:
+        if broker is not None:
+            broker.shutdown()
+    return max(process.returncode or 0 for process in processes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import functools
+import hashlib
+import os
+
+
+@functools.lru_cache(maxsize=65536)
+def owner_index(session_id, workers):
+    """
+    Index of the worker that owns a session, by rendezvous hashing: each
+    session goes to the worker with the highest hash of (worker, session), so
+    changing the number of workers only moves the sessions of the workers
+    added or removed
+    """
+    def weight(index):
+        return hashlib.blake2b(f"{index}:{session_id}".encode(), digest_size=8).digest()
+
+    return max(range(workers), key=weight)
+
+
+class WorkerTopology:
+    """
+    Where sessions live when the relay runs as several workers. A session's
+    audio and upstream connection must stay on its owning worker; sockets
+    that only watch a session may connect to any worker, since transcripts
+    reach them through the message queue. With no worker_urls there is a
+    single worker that owns everything.
+    """
+
+    def __init__(self, worker_index=0, worker_urls=()):
+        self.worker_index = worker_index
+        self.worker_urls = tuple(worker_urls)
+
+    def owner(self, session_id):
+        return owner_index(session_id, len(self.worker_urls)) if self.worker_urls else self.worker_index
+
+    def owns(self, session_id):
+        return self.owner(session_id) == self.worker_index
+
+    def url_for(self, session_id):
+        """Public URL of the session's worker, or None with a single worker"""
+        return self.worker_urls[self.owner(session_id)] if self.worker_urls else None
+
+
+def topology_from_env():
+    """WorkerTopology from WORKER_INDEX and the comma-separated WORKER_URLS"""
+    urls = [url.strip() for url in os.getenv("WORKER_URLS", "").split(",") if url.strip()]
+    return WorkerTopology(int(os.getenv("WORKER_INDEX", 0)), urls)
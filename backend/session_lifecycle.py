@@ -0,0 +1,356 @@
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+
+from session_registry import CLOSED, CONNECTING, DRAINING, IDLE, OPEN
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLifecycle:
+    """
+    Drives each session's upstream connection through
+    idle -> connecting -> open -> draining -> closed.
+
+    start() and stop() only record the transition and return; opening and
+    finishing connections happens on a background executor. Every start or
+    stop bumps the session's generation, so a setup that completes after the
+    session was stopped or restarted is recognised as stale and closed.
+
+    connect(session_id) opens a connection (or returns None), emit(event,
+    data, socket_id) notifies clients, on_open(session_id, connection) runs
+    once a connection is installed, e.g. to flush buffered audio, and
+    on_drain(session_id, connection) runs before a stopped connection is
+    finished, e.g. to wait for queued audio. A stopped session stays
+    draining until its connection reports closing through
+    connection_closed(), after the provider's last results, or for at most
+    close_timeout seconds (0 does not wait).
+
+    With reconnect_attempts set, a connection the upstream side closes while
+    the session is open is replaced automatically: the session goes back to
+    connecting (so audio is buffered meanwhile) and up to reconnect_attempts
+    connections are tried, each after an exponential backoff with full
+    jitter. on_reconnect(session_id, old_connection, connection, gap_seconds)
+    runs before on_open, e.g. to replay audio the old connection lost.
+
+    With an admission controller (see admission.py), every connection setup
+    first waits for a slot, counted against the session's account (see
+    SessionRegistry.set_account), which is given back once the connection is
+    finished, closed or failed to open. A stop cancels a queued setup; a
+    setup rejected because the queue is full fails like any other.
+    """
+
+    def __init__(self, registry, connect, emit, on_open=None, on_drain=None, max_workers=32,
+                 on_reconnect=None, reconnect_attempts=0, backoff_base=0.5, backoff_max=8.0, admission=None,
+                 close_timeout=0.0):
+        self.registry = registry
+        self.admission = admission
+        self.connect = connect
+        self.emit = emit
+        self.on_open = on_open
+        self.on_drain = on_drain
+        self.on_reconnect = on_reconnect
+        self.reconnect_attempts = reconnect_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.close_timeout = close_timeout
+        self._closing = {}  # connection -> threading.Event set when it reports closing
+        self._closing_lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='session-setup'
+        )
+
+    def state(self, session_id):
+        return self.registry.get_state(session_id)[0]
+
+    def start(self, session_id, socket_id=None, failure_event='connection_error'):
+        """
+        Begin opening a connection for the session. An open connection is
+        replaced; a setup already in flight is joined instead of duplicated.
+        """
+        def begin(record):
+            if socket_id is not None:
+                record.waiters[socket_id] = failure_event
+            # Claim the one-shot auto-create so audio arriving during setup is
+            # buffered instead of starting a second setup
+            record.warned = True
+            if record.state == CONNECTING:
+                return None, None
+            old_connection = record.connection
+            record.connection = None
+            record.generation += 1
+            record.state = CONNECTING
+            return record.generation, old_connection
+
+        generation, old_connection = self.registry.update(session_id, begin)
+        if generation is None:
+            logger.info("Session %s: Connection setup already in progress, joining it", session_id)
+            return
+        if old_connection is not None:
+            logger.info("Session %s: Closing existing connection before starting new one", session_id)
+            self.executor.submit(self._finish, session_id, old_connection)
+        if not self._submit(session_id, self._open, session_id, generation):
+            self._rejected(session_id, generation)
+
+    def _submit(self, session_id, fn, *args):
+        """
+        Run fn(*args) on the executor once the admission controller has a
+        slot for the session. Returns False if the request was rejected.
+        """
+        def run():
+            try:
+                self.executor.submit(fn, *args)
+            except RuntimeError:
+                # Shut down meanwhile
+                self._release(session_id)
+
+        if self.admission is None:
+            run()
+            return True
+        return self.admission.request(session_id, run, self.registry.account(session_id)) is not None
+
+    def _release(self, session_id):
+        if self.admission is not None:
+            self.admission.release(session_id)
+
+    def _rejected(self, session_id, generation):
+        def fail(record):
+            if record.generation != generation or record.state != CONNECTING:
+                return {}
+            waiters, record.waiters = record.waiters, {}
+            record.state = IDLE
+            record.warned = False
+            return waiters
+
+        waiters = self.registry.update(session_id, fail, create=False, default={})
+        for socket_id, failure_event in waiters.items():
+            self.emit(failure_event, {'message': 'Server is at capacity. Please try again later.'}, socket_id)
+
+    def _open(self, session_id, generation):
+        started = time.monotonic()
+        connection = self._try_connect(session_id)
+        current, waiters = self._install(session_id, generation, connection)
+        if not current:
+            return
+
+        if connection is None:
+            logger.error("Session %s: Failed to initialize Deepgram connection", session_id)
+            for socket_id, failure_event in waiters.items():
+                if failure_event == 'connection_lost':
+                    self.emit('connection_lost', {'message': 'Failed to create Deepgram connection'}, socket_id)
+                else:
+                    self.emit(failure_event, {'message': 'Failed to connect to Deepgram'}, socket_id)
+            return
+
+        logger.info("Session %s: Deepgram connection open after %.3fs", session_id, time.monotonic() - started)
+        self._opened(session_id, connection)
+        for socket_id in waiters:
+            self.emit('deepgram_ready', {'status': 'connected'}, socket_id)
+
+    def _try_connect(self, session_id):
+        try:
+            connection = self.connect(session_id)
+        except Exception as e:
+            logger.error("Session %s: Error opening connection: %s", session_id, e, exc_info=True)
+            connection = None
+        if connection is None:
+            self._release(session_id)
+        return connection
+
+    def _install(self, session_id, generation, connection, retry=False):
+        """
+        Make connection the session's live connection if the setup for
+        generation is still current. Returns (current, waiters). A failed
+        setup (connection None) goes back to idle unless retry is set.
+        """
+        def complete(record):
+            if record.generation != generation or record.state != CONNECTING:
+                return False, {}
+            if connection is None and retry:
+                return True, {}
+            waiters, record.waiters = record.waiters, {}
+            if connection is not None:
+                record.connection = connection
+                record.state = OPEN
+                record.last_activity = time.time()
+            else:
+                record.state = IDLE
+                record.warned = False
+            return True, waiters
+
+        current, waiters = self.registry.update(session_id, complete)
+        if not current and connection is not None:
+            # Stopped or restarted while we were connecting
+            logger.info("Session %s: Discarding connection from a superseded setup", session_id)
+            self._finish(session_id, connection)
+        return current, waiters
+
+    def _opened(self, session_id, connection):
+        if self.on_open is not None:
+            try:
+                self.on_open(session_id, connection)
+            except Exception as e:
+                logger.error("Session %s: Error in on_open: %s", session_id, e, exc_info=True)
+
+    def stop(self, session_id, socket_id=None):
+        """
+        Stop the session's connection. An open connection is drained in the
+        background; a setup in flight is cancelled.
+        """
+        def begin(record):
+            state, connection = record.state, record.connection
+            record.connection = None
+            record.last_activity = None
+            record.waiters = {}
+            if state == CONNECTING:
+                record.generation += 1
+                record.state = CLOSED
+                if self.admission is not None:
+                    self.admission.cancel(session_id)
+            elif state == OPEN:
+                record.state = DRAINING
+            return state, connection
+
+        state, connection = self.registry.update(session_id, begin, create=False, default=(None, None))
+        if connection is not None:
+            self.executor.submit(self._drain, session_id, connection, socket_id)
+        elif socket_id is not None:
+            if state == CONNECTING:
+                self.emit('deepgram_stopped', {'status': 'stopped'}, socket_id)
+            else:
+                logger.warning("Session %s: No active connection to stop", session_id)
+                self.emit('deepgram_stopped', {'status': 'no_connection'}, socket_id)
+
+    def _drain(self, session_id, connection, socket_id):
+        if self.on_drain is not None:
+            try:
+                self.on_drain(session_id, connection)
+            except Exception as e:
+                logger.error("Session %s: Error in on_drain: %s", session_id, e, exc_info=True)
+        closed = threading.Event()
+        with self._closing_lock:
+            self._closing[connection] = closed
+        try:
+            error = self._finish(session_id, connection)
+            # Final results arrive between the finish and the close
+            if error is None and self.close_timeout and not closed.wait(self.close_timeout):
+                logger.warning("Session %s: Connection did not report closing within %ss of finishing",
+                               session_id, self.close_timeout)
+        finally:
+            with self._closing_lock:
+                self._closing.pop(connection, None)
+
+        def done(record):
+            if record.state == DRAINING:
+                record.state = CLOSED
+
+        self.registry.update(session_id, done, create=False)
+        if socket_id is not None:
+            if error is None:
+                self.emit('deepgram_stopped', {'status': 'stopped'}, socket_id)
+            else:
+                # Still notify client even if there was an error
+                self.emit('deepgram_stopped', {'status': 'error', 'message': str(error)}, socket_id)
+
+    def connection_closed(self, session_id, connection):
+        """
+        The upstream side closed a connection. If it was the session's live
+        connection, reconnect (see reconnect_attempts) or go back to idle so
+        the next audio can open a new one.
+        """
+        with self._closing_lock:
+            closed = self._closing.get(connection)
+        if closed is not None:
+            # A connection being stopped, see _drain
+            closed.set()
+            return
+
+        def closed(record):
+            if record.connection is not connection:
+                return False
+            record.connection = None
+            record.last_activity = None
+            if self.reconnect_attempts and record.state == OPEN:
+                record.generation += 1
+                record.state = CONNECTING
+                # Audio arriving meanwhile is buffered, not used to auto-create
+                record.warned = True
+                return record.generation
+            record.state = IDLE
+            record.warned = False
+            return True
+
+        result = self.registry.update(session_id, closed, create=False, default=False)
+        if result is False:
+            return
+        self._release(session_id)
+        logger.warning("Session %s: Upstream connection closed unexpectedly", session_id)
+        if result is not True:
+            self._schedule_reconnect(session_id, connection, result, time.monotonic(), 0)
+
+    def _schedule_reconnect(self, session_id, old_connection, generation, closed_at, attempt):
+        # Full jitter: anywhere between 0 and the exponential backoff
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        timer = threading.Timer(delay, self._submit_reconnect,
+                                args=(session_id, old_connection, generation, closed_at, attempt))
+        timer.daemon = True
+        timer.start()
+
+    def _submit_reconnect(self, session_id, old_connection, generation, closed_at, attempt):
+        if not self._submit(session_id, self._reconnect, session_id, old_connection, generation, closed_at, attempt):
+            logger.error("Session %s: Reconnect rejected, connection queue is full", session_id)
+            self._rejected(session_id, generation)
+            for socket_id in self.registry.sockets_for_session(session_id):
+                self.emit('connection_lost', {'message': 'Lost connection to Deepgram'}, socket_id)
+
+    def _reconnect(self, session_id, old_connection, generation, closed_at, attempt):
+        def pending(record):
+            return record.generation == generation and record.state == CONNECTING
+
+        if not self.registry.update(session_id, pending, create=False, default=False):
+            # Stopped or restarted while we were waiting
+            self._release(session_id)
+            return
+        last_attempt = attempt + 1 >= self.reconnect_attempts
+        connection = self._try_connect(session_id)
+        current, waiters = self._install(session_id, generation, connection, retry=not last_attempt)
+        if not current:
+            return
+
+        if connection is None:
+            if not last_attempt:
+                logger.warning("Session %s: Reconnect attempt %s failed, retrying", session_id, attempt + 1)
+                self._schedule_reconnect(session_id, old_connection, generation, closed_at, attempt + 1)
+                return
+            logger.error("Session %s: Giving up after %s reconnect attempts", session_id, self.reconnect_attempts)
+            for socket_id in set(waiters) | set(self.registry.sockets_for_session(session_id)):
+                self.emit('connection_lost', {'message': 'Lost connection to Deepgram'}, socket_id)
+            return
+
+        gap = time.monotonic() - closed_at
+        logger.info("Session %s: Reconnected after %.3fs (attempt %s)", session_id, gap, attempt + 1)
+        if self.on_reconnect is not None:
+            try:
+                self.on_reconnect(session_id, old_connection, connection, gap)
+            except Exception as e:
+                logger.error("Session %s: Error in on_reconnect: %s", session_id, e, exc_info=True)
+        self._opened(session_id, connection)
+        for socket_id in waiters:
+            self.emit('deepgram_ready', {'status': 'connected'}, socket_id)
+
+    def _finish(self, session_id, connection):
+        try:
+            logger.info("Session %s: Sending finish signal to Deepgram", session_id)
+            connection.finish()
+            logger.info("Session %s: Deepgram connection closed successfully", session_id)
+            return None
+        except Exception as e:
+            logger.error("Session %s: Error closing connection: %s", session_id, e)
+            return e
+        finally:
+            self._release(session_id)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,361 @@
+import threading
+import time
+
+# Number of lock stripes used by the registry. Sessions hash onto a stripe so
+# handlers working on different sessions rarely contend for the same lock.
+DEFAULT_STRIPES = 64
+
+# Upper bound on the number of session records kept in memory
+DEFAULT_MAX_SESSIONS = 10000
+
+# Lifecycle states of a session's upstream connection, see session_lifecycle.py
+IDLE = 'idle'
+CONNECTING = 'connecting'
+OPEN = 'open'
+DRAINING = 'draining'
+CLOSED = 'closed'
+
+
+def session_room(session_id):
+    """Name of the Socket.IO room holding every socket of a session"""
+    return f"session:{session_id}"
+
+
+class SessionRecord:
+    """
+    Compact per-session state. One record per session ID, holding the upstream
+    connection, the sockets attached to the session and its last activity time.
+    """
+    __slots__ = ('session_id', 'connection', 'socket_ids', 'last_activity', 'warned', 'audio_buffer',
+                 'state', 'generation', 'waiters', 'sender', 'stream_options', 'vad', 'replay', 'account_id')
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.connection = None
+        self.socket_ids = set()
+        self.last_activity = None
+        self.warned = False
+        self.audio_buffer = None
+        self.state = IDLE
+        self.generation = 0  # Bumped on every start/stop so stale setups can be discarded
+        self.waiters = {}    # socket_id -> event to emit if the pending setup fails
+        self.sender = None
+        self.stream_options = None  # Upstream option overrides (raw PCM encoding, interim results)
+        self.vad = None
+        self.replay = None  # Recently sent audio, replayed after a reconnect
+        self.account_id = None  # User the session's recordings belong to (session IDs are per recording)
+
+    def is_empty(self):
+        """A record with no sockets, no connection, no activity and no setup in flight can be dropped"""
+        return (not self.socket_ids and self.connection is None and self.last_activity is None
+                and self.state in (IDLE, CLOSED))
+
+
+class SessionRegistryFull(Exception):
+    """Raised when a new session would exceed the registry's max_sessions bound"""
+
+
+class SessionRegistry:
+    """
+    Thread-safe registry of sessions and the sockets attached to them.
+
+    Keeps a socket->session index and a session->sockets reverse index so that
+    looking up the sockets of a session is O(1) instead of a scan over every
+    connected socket. State is guarded by striped locks keyed on session ID;
+    the socket index has its own lock because a lookup by socket ID must happen
+    before we know which stripe to take.
+    """
+
+    def __init__(self, stripes=DEFAULT_STRIPES, max_sessions=DEFAULT_MAX_SESSIONS, audio_buffer_factory=None,
+                 sender_factory=None, replay_factory=None):
+        self.audio_buffer_factory = audio_buffer_factory
+        self.sender_factory = sender_factory
+        self.replay_factory = replay_factory
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._sessions = {}
+        self._sid_to_session = {}
+        self._sid_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self.max_sessions = max_sessions
+
+    def _lock_for(self, session_id):
+        return self._stripes[hash(session_id) % len(self._stripes)]
+
+    def _get_or_create(self, session_id):
+        # Caller must hold the stripe lock for session_id
+        record = self._sessions.get(session_id)
+        if record is None:
+            with self._count_lock:
+                if len(self._sessions) >= self.max_sessions:
+                    raise SessionRegistryFull(f"Registry holds {len(self._sessions)} sessions")
+                record = SessionRecord(session_id)
+                self._sessions[session_id] = record
+        return record
+
+    def _drop_if_empty(self, record):
+        # Caller must hold the stripe lock for record.session_id
+        if record.is_empty():
+            with self._count_lock:
+                self._sessions.pop(record.session_id, None)
+
+    # Socket <-> session mapping
+
+    def bind_socket(self, socket_id, session_id):
+        """
+        Attach a socket to a session, detaching it from any previous session.
+        Raises SessionRegistryFull if the session is new and the registry is full.
+        """
+        previous = self.session_for_socket(socket_id)
+        if previous is not None and previous != session_id:
+            self.unbind_socket(socket_id)
+
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            record.socket_ids.add(socket_id)
+        with self._sid_lock:
+            self._sid_to_session[socket_id] = session_id
+
+    def unbind_socket(self, socket_id):
+        """
+        Detach a socket from its session.
+        Returns (session_id, remaining_socket_count), session_id is None if unknown.
+        """
+        with self._sid_lock:
+            session_id = self._sid_to_session.pop(socket_id, None)
+        if session_id is None:
+            return None, 0
+
+        with self._lock_for(session_id):
+            record = self._sessions.get(session_id)
+            if record is None:
+                return session_id, 0
+            record.socket_ids.discard(socket_id)
+            remaining = len(record.socket_ids)
+            self._drop_if_empty(record)
+        return session_id, remaining
+
+    def session_for_socket(self, socket_id):
+        """Get the session ID a socket is attached to, or None"""
+        return self._sid_to_session.get(socket_id)
+
+    def sockets_for_session(self, session_id):
+        """Get a snapshot of the socket IDs attached to a session"""
+        with self._lock_for(session_id):
+            record = self._sessions.get(session_id)
+            return tuple(record.socket_ids) if record else ()
+
+    # Upstream connection
+
+    def get_connection(self, session_id):
+        """Get the upstream connection for a session, or None"""
+        record = self._sessions.get(session_id)
+        return record.connection if record else None
+
+    def set_connection(self, session_id, connection):
+        """Store the upstream connection for a session and mark it active"""
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            record.connection = connection
+            record.last_activity = time.time()
+
+    def pop_connection(self, session_id):
+        """
+        Remove and return the upstream connection for a session, also clearing
+        its activity tracking. Returns None if there was no connection.
+        """
+        with self._lock_for(session_id):
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            connection = record.connection
+            record.connection = None
+            record.last_activity = None
+            self._drop_if_empty(record)
+        return connection
+
+    # Activity tracking
+
+    def touch(self, session_id, now=None):
+        """Update the last activity time of a session that already has a record"""
+        record = self._sessions.get(session_id)
+        if record is not None:
+            record.last_activity = now if now is not None else time.time()
+
+    def last_activity(self, session_id):
+        """Get the last activity time of a session, or None"""
+        record = self._sessions.get(session_id)
+        return record.last_activity if record else None
+
+    def clear_activity(self, session_id):
+        """Stop tracking activity for a session"""
+        with self._lock_for(session_id):
+            record = self._sessions.get(session_id)
+            if record is not None:
+                record.last_activity = None
+                self._drop_if_empty(record)
+
+    def inactive_sessions(self, timeout, now=None):
+        """Get (session_id, idle_seconds) for sessions idle longer than timeout"""
+        now = now if now is not None else time.time()
+        inactive = []
+        for record in list(self._sessions.values()):
+            last_activity = record.last_activity
+            if last_activity is not None and now - last_activity > timeout:
+                inactive.append((record.session_id, now - last_activity))
+        return inactive
+
+    def sessions_in_state(self, *states):
+        """Get the IDs of sessions whose lifecycle is in one of states"""
+        return [record.session_id for record in list(self._sessions.values()) if record.state in states]
+
+    def update(self, session_id, fn, create=True, default=None):
+        """
+        Run fn(record) atomically with respect to other updates of the session
+        and return its result. fn must be quick and must not block. Returns
+        default if the session has no record and create is False.
+        """
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id) if create else self._sessions.get(session_id)
+            if record is None:
+                return default
+            try:
+                return fn(record)
+            finally:
+                self._drop_if_empty(record)
+
+    def get_state(self, session_id):
+        """Get (state, connection) for a session"""
+        record = self._sessions.get(session_id)
+        return (record.state, record.connection) if record else (IDLE, None)
+
+    # One-shot warnings
+
+    def warn_once(self, session_id):
+        """
+        Returns True the first time it is called for a session's current record,
+        False afterwards. Replaces ad-hoc warned_<session> attributes.
+        """
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            if record.warned:
+                return False
+            record.warned = True
+            return True
+
+    # Pre-connect audio buffer
+
+    def audio_buffer(self, session_id, create=True):
+        """
+        Get the session's audio buffer, creating it with audio_buffer_factory
+        when create is True. Returns None if there is no buffer.
+        """
+        record = self._sessions.get(session_id)
+        if record is not None and record.audio_buffer is not None:
+            return record.audio_buffer
+        if not create or self.audio_buffer_factory is None:
+            return None
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            if record.audio_buffer is None:
+                record.audio_buffer = self.audio_buffer_factory()
+            return record.audio_buffer
+
+    # Outbound send queue
+
+    def sender(self, session_id, create=True):
+        """
+        Get the session's outbound sender, creating it with
+        sender_factory(session_id) when create is True. Returns None if there is
+        no sender.
+        """
+        record = self._sessions.get(session_id)
+        if record is not None and record.sender is not None:
+            return record.sender
+        if not create or self.sender_factory is None:
+            return None
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            if record.sender is None:
+                record.sender = self.sender_factory(session_id)
+            return record.sender
+
+    # Replay window
+
+    def replay_window(self, session_id, create=True):
+        """
+        Get the session's replay window, creating it with
+        replay_factory(session_id) when create is True. Returns None if there
+        is no window.
+        """
+        record = self._sessions.get(session_id)
+        if record is not None and record.replay is not None:
+            return record.replay
+        if not create or self.replay_factory is None:
+            return None
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            if record.replay is None:
+                record.replay = self.replay_factory(session_id)
+            return record.replay
+
+    def replay_stats(self):
+        """Get {session_id: replay window stats} for sessions with a replay window"""
+        return {record.session_id: record.replay.stats()
+                for record in list(self._sessions.values()) if record.replay is not None}
+
+    # Account of a session, for per-user connection caps
+
+    def set_account(self, session_id, account_id):
+        """Record which user the session belongs to"""
+        with self._lock_for(session_id):
+            self._get_or_create(session_id).account_id = account_id
+
+    def account(self, session_id):
+        """Get the user the session belongs to, or None if unknown"""
+        record = self._sessions.get(session_id)
+        return record.account_id if record else None
+
+    # Upstream stream options and voice activity gating
+
+    def configure_stream(self, session_id, options, vad=None):
+        """Set the session's upstream option overrides (None for the defaults) and optional VAD"""
+        with self._lock_for(session_id):
+            record = self._get_or_create(session_id)
+            record.stream_options = options
+            record.vad = vad
+
+    def stream_options(self, session_id):
+        """Get the session's upstream option overrides, or None for the defaults"""
+        record = self._sessions.get(session_id)
+        return record.stream_options if record else None
+
+    def vad(self, session_id):
+        """Get the session's voice activity gate, or None"""
+        record = self._sessions.get(session_id)
+        return record.vad if record else None
+
+    def vad_stats(self):
+        """Get {session_id: VAD stats} for gated sessions"""
+        return {record.session_id: record.vad.stats()
+                for record in list(self._sessions.values()) if record.vad is not None}
+
+    def sender_stats(self):
+        """Get {session_id: sender stats} for sessions with a sender"""
+        return {record.session_id: record.sender.stats()
+                for record in list(self._sessions.values()) if record.sender is not None}
+
+    # Stats
+
+    def stats(self):
+        """Get counts of sessions, sockets and upstream connections"""
+        records = list(self._sessions.values())
+        buffers = [record.audio_buffer for record in records if record.audio_buffer is not None]
+        senders = [record.sender for record in records if record.sender is not None]
+        return {
+            'sessions': len(records),
+            'sockets': len(self._sid_to_session),
+            'connections': sum(1 for record in records if record.connection is not None),
+            'buffered_bytes': sum(buffer.buffered_bytes for buffer in buffers),
+            'dropped_bytes': sum(buffer.dropped_bytes for buffer in buffers),
+            'queued_packets': sum(len(sender) for sender in senders),
+        }
@@ -0,0 +1,225 @@
+import atexit
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Session a Socket.IO handler is working for, added to the records it logs
+current_session = contextvars.ContextVar('current_session', default=None)
+
+# LogRecord attributes that are not extra fields
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# 1 in N sampling for per-packet events, overridden with LOG_SAMPLING
+DEFAULT_SAMPLING = {'audio_packet': 50, 'audio_sent': 200}
+
+
+def bind_session(session_id):
+    """Tag the records logged by the current thread (or task) with session_id"""
+    current_session.set(session_id)
+
+
+class SessionFilter(logging.Filter):
+    """Adds session_id to records from a bound handler, unless the call passed one"""
+
+    def filter(self, record):
+        if not hasattr(record, 'session_id'):
+            session_id = current_session.get()
+            if session_id is not None:
+                record.session_id = session_id
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per second (bursts of up to `burst`)
+    for each message template and session, so one failing session cannot
+    flood the log. Templates are only stable with lazy %-style arguments.
+    The next record let through carries the number it suppressed as
+    `suppressed`. Errors are never dropped.
+    """
+
+    def __init__(self, rate=10.0, burst=20):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}  # (logger, template, session) -> [tokens, updated_at, suppressed]
+        self.suppressed = 0
+
+    def filter(self, record):
+        if not self.rate or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.msg, getattr(record, 'session_id', None))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= 10000:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class EventSampler:
+    """
+    Deterministic 1-in-N sampling of frequent events, checked before a record
+    is built: `if sampler.due('audio_packet'): logger.info(...)`. Events
+    without a rate are always due.
+    """
+
+    def __init__(self, rates=None):
+        self.rates = dict(rates or {})
+        self._counters = {}
+
+    def due(self, event):
+        every = self.rates.get(event)
+        if not every or every <= 1:
+            return every != 0
+        counter = self._counters.get(event)
+        if counter is None:
+            counter = self._counters.setdefault(event, itertools.count())
+        # next() on itertools.count is atomic under the GIL
+        return next(counter) % every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, session_id and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic text format, with the session appended when known"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        session_id = getattr(record, 'session_id', None)
+        return f"{line} [session={session_id}]" if session_id is not None else line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread and
+    drops records (counting them) instead of blocking when the queue is full
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Tracebacks can't wait, the frames they refer to change; everything
+        # else is formatted by the listener
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging(log_file=None, level=logging.INFO):
+    """
+    Route all logging through a queue to a background writer thread.
+
+    Records go to stdout and, if log_file is given, to a file rotated at
+    LOG_MAX_BYTES (default 10 MB) keeping LOG_BACKUP_COUNT old files (default
+    5). LOG_FORMAT is json (default) or text. The queue holds LOG_QUEUE_SIZE
+    records (default 10000); records beyond that are dropped rather than
+    stalling the caller. Each message template is rate limited to
+    LOG_RATE_LIMIT records per second and session (default 10, 0 disables);
+    errors are always kept.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = TextFormatter() if os.getenv("LOG_FORMAT", "json") == "text" else JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", 5))
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+    # Sessions first, the rate limit is per session
+    queue_handler.addFilter(SessionFilter())
+    queue_handler.addFilter(RateLimitFilter(rate=float(os.getenv("LOG_RATE_LIMIT", 10))))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Write out queued records and close the log handlers"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    logging.shutdown()
+
+
+def create_sampler_from_env():
+    """
+    Build an EventSampler from DEFAULT_SAMPLING and LOG_SAMPLING, e.g.
+    "audio_packet=50,audio_sent=200" (1 in N; 0 turns an event off)
+    """
+    rates = dict(DEFAULT_SAMPLING)
+    for item in os.getenv("LOG_SAMPLING", "").split(','):
+        event, _, every = item.partition('=')
+        if event.strip() and every.strip():
+            rates[event.strip()] = int(every)
+    return EventSampler(rates)
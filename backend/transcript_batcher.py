@@ -0,0 +1,60 @@
+import threading
+
+
+class TranscriptBatcher:
+    """
+    Collects a session's transcript events for up to `window` seconds and
+    delivers them as one message, so sessions with many viewers pay for one
+    serialization and one broadcast per window instead of per event.
+
+    emit_one(payload) sends a single event and emit_many(payloads) a batch.
+    With window 0 every event is sent on its own. Events keep their order;
+    close() sends whatever is still pending.
+    """
+
+    def __init__(self, emit_one, emit_many, window=0.0):
+        self.emit_one = emit_one
+        self.emit_many = emit_many
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+        self.events = 0
+        self.messages = 0
+
+    def add(self, payload):
+        with self._lock:
+            self.events += 1
+            if self.window <= 0:
+                self.messages += 1
+                self.emit_one(payload)
+                return
+            self._pending.append(payload)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Send the pending events now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            self.messages += 1
+            # Emitting under the lock keeps batches in order
+            if len(pending) == 1:
+                self.emit_one(pending[0])
+            else:
+                self.emit_many(pending)
+
+    close = flush
+
+    def stats(self):
+        return {
+            'events': self.events,
+            'messages': self.messages,
+        }
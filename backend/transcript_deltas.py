@@ -0,0 +1,113 @@
+import threading
+import time
+
+
+def common_prefix_length(a, b):
+    """Length of the longest common prefix of two strings"""
+    limit = min(len(a), len(b))
+    index = 0
+    while index < limit and a[index] == b[index]:
+        index += 1
+    return index
+
+
+class TranscriptDeltas:
+    """
+    Turns a session's interim and final results into compact
+    transcription_update deltas.
+
+    The client holds the committed text plus the current unstable hypothesis.
+    Each delta says "replace the hypothesis from character `offset` on with
+    `transcription`"; with is_final set, the resulting text is committed and
+    the next hypothesis starts empty. Interim deltas are sent at most once per
+    min_interval: in between, only the newest interim is kept and a timer
+    sends it when the interval is up. A final result is sent immediately and
+    supersedes any pending interim.
+
+    emit(payload) delivers a delta to the session's clients. It is called
+    with the internal lock held, so deltas can never arrive out of order; it
+    must not block.
+    """
+
+    def __init__(self, emit, min_interval=0.2):
+        self.emit = emit
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._hypothesis = ''  # What the clients currently show as unstable text
+        self._pending = None
+        self._timer = None
+        self._last_emit = 0.0
+        self.interim_received = 0
+        self.interim_sent = 0
+        self.finals_sent = 0
+
+    def push(self, result):
+        """Handle a TranscriptResult from the provider"""
+        with self._lock:
+            if result.is_final:
+                self._pending = None
+                self._send(self._delta(result, final=True))
+                return
+            self.interim_received += 1
+            self._pending = result
+            wait = self.min_interval - (time.monotonic() - self._last_emit)
+            if wait <= 0:
+                self._send_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(wait, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def close(self):
+        """Cancel a pending interim emit"""
+        with self._lock:
+            self._pending = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def stats(self):
+        return {
+            'interim_received': self.interim_received,
+            'interim_sent': self.interim_sent,
+            'finals_sent': self.finals_sent,
+        }
+
+    def _flush(self):
+        with self._lock:
+            self._timer = None
+            self._send_pending()
+
+    def _send_pending(self):
+        # Caller holds self._lock
+        result, self._pending = self._pending, None
+        if result is not None:
+            self._send(self._delta(result, final=False))
+
+    def _send(self, payload):
+        # Caller holds self._lock
+        if payload is not None:
+            self.emit(payload)
+
+    def _delta(self, result, final):
+        # Caller holds self._lock
+        text = result.text
+        offset = common_prefix_length(self._hypothesis, text)
+        if offset == len(text) == len(self._hypothesis) and not (final and text):
+            # Nothing changed (or an empty final with nothing to clear)
+            if final:
+                self._hypothesis = ''
+            return None
+        self._hypothesis = '' if final else text
+        self._last_emit = time.monotonic()
+        if final:
+            self.finals_sent += 1
+        else:
+            self.interim_sent += 1
+        return {
+            'transcription': text[offset:],
+            'offset': offset,
+            'is_final': final,
+            'start': result.start,
+            'duration': result.duration
+        }
@@ -0,0 +1,591 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Events a transcription connection reports to its listener
+OPEN = 'open'
+TRANSCRIPT = 'transcript'
+METADATA = 'metadata'
+ERROR = 'error'
+CLOSE = 'close'
+
+# Options used for every live transcription unless a caller overrides them
+DEFAULT_OPTIONS = {
+    'model': 'nova-3',
+    'language': 'en-US',
+    'interim_results': False,  # Get results as they come
+    'punctuate': True,         # Add punctuation
+}
+
+
+class TranscriptResult:
+    """
+    Backend-neutral transcript. start and duration are offsets in seconds
+    into the audio sent on the connection.
+    """
+    __slots__ = ('text', 'is_final', 'speech_final', 'start', 'duration')
+
+    def __init__(self, text, is_final=True, speech_final=False, start=0.0, duration=0.0):
+        self.text = text
+        self.is_final = is_final
+        self.speech_final = speech_final
+        self.start = start
+        self.duration = duration
+
+    def __repr__(self):
+        return f"TranscriptResult({self.text!r}, is_final={self.is_final}, start={self.start}, duration={self.duration})"
+
+
+class TranscriptionConnection:
+    """
+    A live transcription stream for one session.
+
+    Subclasses implement start, send, finish and keep_alive. Event callbacks
+    are attached with bind() and can be re-bound at any time, the backend
+    dispatches through _dispatch() so the callbacks in effect are always the
+    latest ones.
+
+    stream_offset is where this connection's audio starts on the session's
+    stream timeline, in seconds: non-zero for a connection that took over a
+    session mid-recording, whose transcript times count from its own start.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self.stream_offset = 0.0
+
+    def bind(self, on_open=None, on_transcript=None, on_metadata=None, on_error=None, on_close=None):
+        """Attach the callbacks that receive this connection's events"""
+        self._handlers = {
+            OPEN: on_open,
+            TRANSCRIPT: on_transcript,
+            METADATA: on_metadata,
+            ERROR: on_error,
+            CLOSE: on_close,
+        }
+
+    def _dispatch(self, event, *args):
+        handler = self._handlers.get(event)
+        if handler is None:
+            return
+        try:
+            handler(*args)
+        except Exception as e:
+            logger.error("Error in %s handler: %s", event, e, exc_info=True)
+
+    def start(self, options=None):
+        """Open the stream. Returns True on success"""
+        raise NotImplementedError
+
+    def send(self, data):
+        """Send a chunk of audio. Returns True on success"""
+        raise NotImplementedError
+
+    def keep_alive(self):
+        """Keep an idle stream open. Returns True on success"""
+        raise NotImplementedError
+
+    def finish(self):
+        """Flush and close the stream. Returns True on success"""
+        raise NotImplementedError
+
+
+class TranscriptionBackend:
+    """Creates transcription connections for sessions"""
+    name = None
+
+    def create_connection(self, session_id):
+        """Create an unstarted TranscriptionConnection"""
+        raise NotImplementedError
+
+    def create_async_connection(self, session_id):
+        """Create an unstarted AsyncTranscriptionConnection for the asyncio server"""
+        return AsyncConnectionAdapter(self.create_connection(session_id))
+
+
+class AsyncTranscriptionConnection:
+    """
+    Coroutine flavour of TranscriptionConnection, run on the asyncio server's
+    loop through LoopConnection. Callbacks passed to bind() are coroutine
+    functions.
+    """
+
+    def bind(self, on_open=None, on_transcript=None, on_metadata=None, on_error=None, on_close=None):
+        raise NotImplementedError
+
+    async def start(self, options=None):
+        raise NotImplementedError
+
+    async def send(self, data):
+        raise NotImplementedError
+
+    async def keep_alive(self):
+        raise NotImplementedError
+
+    async def finish(self):
+        raise NotImplementedError
+
+
+class AsyncConnectionAdapter(AsyncTranscriptionConnection):
+    """
+    Runs a thread-based TranscriptionConnection under asyncio. Blocking calls
+    go to a worker thread and callbacks are scheduled on the caller's loop.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._loop = None
+
+    def bind(self, on_open=None, on_transcript=None, on_metadata=None, on_error=None, on_close=None):
+        self._loop = asyncio.get_running_loop()
+        self.connection.bind(
+            on_open=self._wrap(on_open),
+            on_transcript=self._wrap(on_transcript),
+            on_metadata=self._wrap(on_metadata),
+            on_error=self._wrap(on_error),
+            on_close=self._wrap(on_close),
+        )
+
+    def _wrap(self, handler):
+        if handler is None:
+            return None
+
+        def schedule(*args):
+            asyncio.run_coroutine_threadsafe(handler(*args), self._loop)
+        return schedule
+
+    async def start(self, options=None):
+        return await asyncio.to_thread(self.connection.start, options)
+
+    async def send(self, data):
+        return await asyncio.to_thread(self.connection.send, data)
+
+    async def keep_alive(self):
+        return await asyncio.to_thread(self.connection.keep_alive)
+
+    async def finish(self):
+        return await asyncio.to_thread(self.connection.finish)
+
+
+class LoopConnection(TranscriptionConnection):
+    """
+    Thread-facing TranscriptionConnection over an AsyncTranscriptionConnection
+    whose websocket lives on an event loop, so the relay's lifecycle and
+    sender threads can use it like any other connection. Calls block the
+    calling thread until the loop has done the work (at most timeout
+    seconds), and raise RuntimeError on the loop's own thread. Events are
+    dispatched on the loop.
+    """
+
+    def __init__(self, connection, loop, timeout=30.0):
+        super().__init__()
+        self.connection = connection
+        self.loop = loop
+        self.timeout = timeout
+
+        def forward(event):
+            async def dispatch(*args):
+                self._dispatch(event, *args)
+            return dispatch
+
+        connection.bind(
+            on_open=forward(OPEN),
+            on_transcript=forward(TRANSCRIPT),
+            on_metadata=forward(METADATA),
+            on_error=forward(ERROR),
+            on_close=forward(CLOSE),
+        )
+
+    def _call(self, coroutine):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coroutine.close()
+            raise RuntimeError("LoopConnection would block its own event loop")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(self.timeout)
+
+    def start(self, options=None):
+        return self._call(self.connection.start(options))
+
+    def send(self, data):
+        return self._call(self.connection.send(data))
+
+    def keep_alive(self):
+        return self._call(self.connection.keep_alive())
+
+    def finish(self):
+        return self._call(self.connection.finish())
+
+
+class LoopBackend(TranscriptionBackend):
+    """
+    Wraps a backend for the asyncio server: connections with a native async
+    client run it on loop (see LoopConnection), thread-based ones are used
+    as they are. loop can be set once it is running, before the first
+    connection is created.
+    """
+
+    def __init__(self, backend, loop=None):
+        self.backend = backend
+        self.name = backend.name
+        self.loop = loop
+
+    def create_connection(self, session_id):
+        connection = self.backend.create_async_connection(session_id)
+        if isinstance(connection, AsyncConnectionAdapter):
+            # No async client, the thread-based connection needs no loop
+            return connection.connection
+        return LoopConnection(connection, self.loop)
+
+
+# Deepgram
+
+def _deepgram_result(result):
+    return TranscriptResult(
+        result.channel.alternatives[0].transcript,
+        is_final=bool(getattr(result, 'is_final', True)),
+        speech_final=bool(getattr(result, 'speech_final', False)),
+        start=float(getattr(result, 'start', 0.0) or 0.0),
+        duration=float(getattr(result, 'duration', 0.0) or 0.0),
+    )
+
+
+class DeepgramConnection(TranscriptionConnection):
+    """TranscriptionConnection over the Deepgram SDK's sync websocket client"""
+
+    def __init__(self, dg_connection):
+        super().__init__()
+        from deepgram import LiveTranscriptionEvents
+
+        self.dg_connection = dg_connection
+        # SDK handlers are registered once and forward to whatever is bound now
+        dg_connection.on(LiveTranscriptionEvents.Open, lambda _, open, **kwargs: self._dispatch(OPEN))
+        dg_connection.on(LiveTranscriptionEvents.Transcript,
+                         lambda _, result, **kwargs: self._dispatch(TRANSCRIPT, _deepgram_result(result)))
+        dg_connection.on(LiveTranscriptionEvents.Metadata,
+                         lambda _, metadata, **kwargs: self._dispatch(METADATA, metadata))
+        dg_connection.on(LiveTranscriptionEvents.Error, lambda _, error, **kwargs: self._dispatch(ERROR, error))
+        dg_connection.on(LiveTranscriptionEvents.Close, lambda _, close, **kwargs: self._dispatch(CLOSE))
+
+    def start(self, options=None):
+        from deepgram import LiveOptions
+        return self.dg_connection.start(LiveOptions(**(options or DEFAULT_OPTIONS))) is not False
+
+    def send(self, data):
+        return self.dg_connection.send(data)
+
+    def keep_alive(self):
+        return self.dg_connection.keep_alive()
+
+    def finish(self):
+        return self.dg_connection.finish()
+
+
+class DeepgramAsyncConnection(AsyncTranscriptionConnection):
+    """AsyncTranscriptionConnection over the Deepgram SDK's async websocket client"""
+
+    def __init__(self, dg_connection):
+        from deepgram import LiveTranscriptionEvents
+
+        self.dg_connection = dg_connection
+        self._handlers = {}
+
+        async def dispatch(event, *args):
+            handler = self._handlers.get(event)
+            if handler is not None:
+                try:
+                    await handler(*args)
+                except Exception as e:
+                    logger.error("Error in %s handler: %s", event, e, exc_info=True)
+
+        async def on_open(_, open, **kwargs):
+            await dispatch(OPEN)
+
+        async def on_transcript(_, result, **kwargs):
+            await dispatch(TRANSCRIPT, _deepgram_result(result))
+
+        async def on_metadata(_, metadata, **kwargs):
+            await dispatch(METADATA, metadata)
+
+        async def on_error(_, error, **kwargs):
+            await dispatch(ERROR, error)
+
+        async def on_close(_, close, **kwargs):
+            await dispatch(CLOSE)
+
+        dg_connection.on(LiveTranscriptionEvents.Open, on_open)
+        dg_connection.on(LiveTranscriptionEvents.Transcript, on_transcript)
+        dg_connection.on(LiveTranscriptionEvents.Metadata, on_metadata)
+        dg_connection.on(LiveTranscriptionEvents.Error, on_error)
+        dg_connection.on(LiveTranscriptionEvents.Close, on_close)
+
+    def bind(self, on_open=None, on_transcript=None, on_metadata=None, on_error=None, on_close=None):
+        self._handlers = {
+            OPEN: on_open,
+            TRANSCRIPT: on_transcript,
+            METADATA: on_metadata,
+            ERROR: on_error,
+            CLOSE: on_close,
+        }
+
+    async def start(self, options=None):
+        from deepgram import LiveOptions
+        return await self.dg_connection.start(LiveOptions(**(options or DEFAULT_OPTIONS))) is not False
+
+    async def send(self, data):
+        return await self.dg_connection.send(data)
+
+    async def keep_alive(self):
+        return await self.dg_connection.keep_alive()
+
+    async def finish(self):
+        return await self.dg_connection.finish()
+
+
+class DeepgramBackend(TranscriptionBackend):
+    """Live transcription through Deepgram's websocket API"""
+    name = 'deepgram'
+
+    def __init__(self, api_key):
+        from deepgram import DeepgramClient, DeepgramClientOptions
+
+        # Set up client configuration with better timeout handling
+        config = DeepgramClientOptions(
+            verbose=logging.WARNING,  # Reduce back to WARNING from INFO
+            options={
+                "keepalive": "true",
+                "keepalive_timeout": "30"  # 30 seconds timeout (default is 10)
+            }
+        )
+        self.client = DeepgramClient(api_key, config)
+
+    def create_connection(self, session_id):
+        return DeepgramConnection(self.client.listen.websocket.v("1"))
+
+    def create_async_connection(self, session_id):
+        return DeepgramAsyncConnection(self.client.listen.asyncwebsocket.v("1"))
+
+
+# Offline fake engine
+
+# Transcripts the fake engine cycles through when no canned list is given
+SYNTHETIC_WORDS = (
+    "the quick brown fox jumps over the lazy dog while the lecture continues "
+    "with notes on signals systems and measurement"
+).split()
+
+
+class FakeEngine:
+    """
+    Deterministic local stand-in for a streaming speech-to-text service.
+
+    Audio is converted to seconds with bytes_per_second and "processed" at
+    real_time_factor (0.5 means a second of audio takes half a second). Each
+    segment_seconds of audio produces one final transcript, delivered latency
+    seconds after it has been processed. A single scheduler thread serves all
+    connections so thousands of fake sessions stay cheap.
+
+    Failure injection: start_failure_rate makes start() fail, error_rate
+    emits an error instead of a transcript for a segment, and drop_after
+    closes the stream once that many seconds of audio have been received.
+    Randomness is seeded per session so runs are reproducible.
+    """
+
+    def __init__(self, real_time_factor=1.0, latency=0.2, segment_seconds=1.0, bytes_per_second=4000,
+                 transcripts=None, start_delay=0.0, start_failure_rate=0.0, error_rate=0.0,
+                 drop_after=None, seed=0):
+        self.real_time_factor = real_time_factor
+        self.latency = latency
+        self.segment_seconds = segment_seconds
+        self.bytes_per_second = bytes_per_second
+        self.transcripts = list(transcripts) if transcripts else None
+        self.start_delay = start_delay
+        self.start_failure_rate = start_failure_rate
+        self.error_rate = error_rate
+        self.drop_after = drop_after
+        self.seed = seed
+
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, due, callback, *args):
+        """Run callback(*args) on the scheduler thread at time.monotonic() >= due"""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='fake-engine', daemon=True)
+                self._thread.start()
+            heapq.heappush(self._queue, (due, next(self._counter), callback, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                due, _, callback, args = self._queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error("Error in fake engine callback: %s", e, exc_info=True)
+
+    def rng_for(self, session_id):
+        return random.Random(self.seed ^ zlib.crc32(str(session_id).encode()))
+
+    def text_for(self, index, rng):
+        if self.transcripts:
+            return self.transcripts[index % len(self.transcripts)]
+        count = rng.randint(3, 8)
+        return ' '.join(rng.choice(SYNTHETIC_WORDS) for _ in range(count))
+
+
+class FakeConnection(TranscriptionConnection):
+    """A connection to the FakeEngine"""
+
+    def __init__(self, engine, session_id):
+        super().__init__()
+        self.engine = engine
+        self.session_id = session_id
+        self.rng = engine.rng_for(session_id)
+        self.options = None
+        self.is_open = False
+        self.keepalives = 0
+        self._lock = threading.Lock()
+        self._received_seconds = 0.0   # Audio received on this connection
+        self._emitted_seconds = 0.0    # Audio already covered by a transcript
+        self._processed_at = 0.0       # Monotonic time the engine catches up with received audio
+        self._segment_index = 0
+
+    def start(self, options=None):
+        self.options = dict(options or DEFAULT_OPTIONS)
+        if self.engine.start_delay:
+            time.sleep(self.engine.start_delay)
+        if self.rng.random() < self.engine.start_failure_rate:
+            logger.warning("Fake engine: injected start failure for session %s", self.session_id)
+            return False
+        self.is_open = True
+        self._processed_at = time.monotonic()
+        self.engine.schedule(time.monotonic(), self._dispatch, OPEN)
+        return True
+
+    def send(self, data):
+        with self._lock:
+            if not self.is_open:
+                return False
+            seconds = len(data) / self.engine.bytes_per_second
+            self._received_seconds += seconds
+            now = time.monotonic()
+            self._processed_at = max(self._processed_at, now) + seconds * self.engine.real_time_factor
+
+            drop_after = self.engine.drop_after
+            if drop_after is not None and self._received_seconds >= drop_after:
+                self.is_open = False
+                self.engine.schedule(now, self._dispatch, CLOSE)
+                return True
+
+            while self._received_seconds - self._emitted_seconds >= self.engine.segment_seconds:
+                self._emit_segment(self.engine.segment_seconds)
+        return True
+
+    def _emit_segment(self, duration):
+        # Caller holds self._lock
+        start = self._emitted_seconds
+        self._emitted_seconds += duration
+        index = self._segment_index
+        self._segment_index += 1
+        due = self._processed_at + self.engine.latency
+
+        if self.rng.random() < self.engine.error_rate:
+            self.engine.schedule(due, self._dispatch, ERROR, f"injected error for segment {index}")
+            return
+
+        text = self.engine.text_for(index, self.rng)
+        if self.options.get('interim_results'):
+            words = text.split()
+            partial = ' '.join(words[:max(1, len(words) // 2)])
+            self.engine.schedule(due - self.engine.latency / 2, self._dispatch, TRANSCRIPT,
+                                 TranscriptResult(partial, is_final=False, start=start, duration=duration / 2))
+        self.engine.schedule(due, self._dispatch, TRANSCRIPT,
+                             TranscriptResult(text, is_final=True, speech_final=True, start=start, duration=duration))
+
+    def keep_alive(self):
+        self.keepalives += 1
+        return self.is_open
+
+    def finish(self):
+        with self._lock:
+            if not self.is_open:
+                return True
+            self.is_open = False
+            remainder = self._received_seconds - self._emitted_seconds
+            if remainder > 0:
+                self._emit_segment(remainder)
+            due = self._processed_at + self.engine.latency
+        self.engine.schedule(due, self._dispatch, CLOSE)
+        return True
+
+
+class FakeBackend(TranscriptionBackend):
+    """Offline backend for benchmarks and soak tests, see FakeEngine"""
+    name = 'fake'
+
+    def __init__(self, engine=None):
+        self.engine = engine or FakeEngine()
+
+    def create_connection(self, session_id):
+        return FakeConnection(self.engine, session_id)
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def create_backend(name=None):
+    """
+    Build the transcription backend selected by TRANSCRIPTION_BACKEND
+    ('deepgram' by default, or 'fake'). The fake engine is configured with
+    FAKE_ENGINE_* environment variables.
+    """
+    name = name or os.getenv('TRANSCRIPTION_BACKEND', 'deepgram')
+    if name == 'deepgram':
+        api_key = os.getenv('DEEPGRAM_API_KEY')
+        if not api_key:
+            raise ValueError("DEEPGRAM_API_KEY is not set")
+        logger.info("Deepgram API Key first 5 chars: %s...", api_key[:5])
+        logger.info("Deepgram API Key length: %s", len(api_key))
+        return DeepgramBackend(api_key)
+    if name == 'fake':
+        drop_after = os.getenv('FAKE_ENGINE_DROP_AFTER')
+        transcripts = os.getenv('FAKE_ENGINE_TRANSCRIPTS')
+        engine = FakeEngine(
+            real_time_factor=_env_float('FAKE_ENGINE_RTF', 1.0),
+            latency=_env_float('FAKE_ENGINE_LATENCY', 0.2),
+            segment_seconds=_env_float('FAKE_ENGINE_SEGMENT_SECONDS', 1.0),
+            bytes_per_second=_env_float('FAKE_ENGINE_BYTES_PER_SECOND', 4000),
+            transcripts=transcripts.split('|') if transcripts else None,
+            start_delay=_env_float('FAKE_ENGINE_START_DELAY', 0.0),
+            start_failure_rate=_env_float('FAKE_ENGINE_START_FAILURE_RATE', 0.0),
+            error_rate=_env_float('FAKE_ENGINE_ERROR_RATE', 0.0),
+            drop_after=float(drop_after) if drop_after else None,
+            seed=int(os.getenv('FAKE_ENGINE_SEED', 0)),
+        )
+        logger.info("Using fake transcription engine")
+        return FakeBackend(engine)
+    raise ValueError(f"Unknown transcription backend: {name}")
@@ -0,0 +1,128 @@
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class EnergyVAD:
+    """
+    Energy / zero-crossing voice activity gate for a linear16 mono stream.
+
+    Audio is cut into frame_ms frames; per frame we compute the level in dBFS
+    and the zero-crossing rate, vectorized over the whole packet. A frame is
+    speech if it is louder than threshold_db, or within 10 dB of it with a
+    zero-crossing rate above zcr_threshold (unvoiced consonants are quiet but
+    noisy). Silent frames are suppressed, except for the preroll_ms before
+    speech starts and the hangover_ms after it ends, so word edges survive.
+
+    process() returns the audio to forward for a packet (possibly empty).
+    While nothing is forwarded, keepalive_due() turns True every
+    keepalive_interval seconds so the upstream stream can be kept open.
+    Counters: total_bytes, suppressed_bytes.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, threshold_db=-45.0, zcr_threshold=0.25,
+                 preroll_ms=300, hangover_ms=500, keepalive_interval=5.0):
+        self.sample_rate = sample_rate
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * 2
+        self.threshold_db = threshold_db
+        self.zcr_threshold = zcr_threshold
+        self.hangover_frames = max(0, hangover_ms // frame_ms)
+        self._preroll = collections.deque(maxlen=max(0, preroll_ms // frame_ms))
+        self._remainder = b''
+        self._hangover = 0
+        # A session's packets can be handled on several threads
+        self.lock = threading.Lock()
+        self.keepalive_interval = keepalive_interval
+        self._last_upstream = time.monotonic()
+        self.total_bytes = 0
+        self.suppressed_bytes = 0
+
+    def classify(self, samples):
+        """Speech flags for a (frames, samples_per_frame) int16 array"""
+        frames = samples.astype(np.float32) / 32768.0
+        power = np.mean(frames * frames, axis=1)
+        level_db = 10.0 * np.log10(power + 1e-10)
+        crossings = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        return (level_db > self.threshold_db) | (
+            (level_db > self.threshold_db - 10.0) & (crossings > self.zcr_threshold)
+        )
+
+    def process(self, data):
+        """Gate a packet of audio, returning the bytes to forward upstream"""
+        with self.lock:
+            return self._process(data)
+
+    def _process(self, data):
+        self.total_bytes += len(data)
+        # The packet can be forwarded untouched if it is all speech and no
+        # earlier audio is carried into it
+        untouched = not self._remainder and not self._preroll
+        if self._remainder:
+            data = self._remainder + bytes(data)
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = bytes(data[usable:])
+        if not usable:
+            return b''
+
+        samples = np.frombuffer(data, dtype='<i2', count=usable // 2).reshape(-1, self.frame_bytes // 2)
+        speech = self.classify(samples)
+
+        view = memoryview(data)
+        out = []
+        for index, is_speech in enumerate(speech.tolist()):
+            frame = view[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+            if is_speech:
+                out.extend(self._preroll)
+                self._preroll.clear()
+                out.append(frame)
+                self._hangover = self.hangover_frames
+            elif self._hangover > 0:
+                out.append(frame)
+                self._hangover -= 1
+            else:
+                if self._preroll.maxlen == 0:
+                    self.suppressed_bytes += len(frame)
+                    continue
+                if len(self._preroll) == self._preroll.maxlen:
+                    self.suppressed_bytes += len(self._preroll[0])
+                self._preroll.append(frame)
+
+        if out:
+            self._last_upstream = time.monotonic()
+        if untouched and usable == len(data) and len(out) == len(speech):
+            return data
+        return b''.join(out)
+
+    def keepalive_due(self, now=None):
+        """True (and restarts the timer) once keepalive_interval passes without upstream traffic"""
+        now = now if now is not None else time.monotonic()
+        if now - self._last_upstream < self.keepalive_interval:
+            return False
+        self._last_upstream = now
+        return True
+
+    def stats(self):
+        return {
+            'total_bytes': self.total_bytes,
+            'suppressed_bytes': self.suppressed_bytes,
+            'suppressed_fraction': self.suppressed_bytes / self.total_bytes if self.total_bytes else 0.0,
+        }
+
+
+def create_vad_from_env(sample_rate):
+    """
+    Build an EnergyVAD from VAD_FRAME_MS, VAD_THRESHOLD_DB, VAD_ZCR_THRESHOLD,
+    VAD_PREROLL_MS, VAD_HANGOVER_MS and VAD_KEEPALIVE_INTERVAL
+    """
+    return EnergyVAD(
+        sample_rate=sample_rate,
+        frame_ms=int(os.getenv("VAD_FRAME_MS", 20)),
+        threshold_db=float(os.getenv("VAD_THRESHOLD_DB", -45)),
+        zcr_threshold=float(os.getenv("VAD_ZCR_THRESHOLD", 0.25)),
+        preroll_ms=int(os.getenv("VAD_PREROLL_MS", 300)),
+        hangover_ms=int(os.getenv("VAD_HANGOVER_MS", 500)),
+        keepalive_interval=float(os.getenv("VAD_KEEPALIVE_INTERVAL", 5))
+    )
@@ -0,0 +1,117 @@
+"""
+Microbenchmark for the audio_stream ingestion path.
+
+Compares, per packet, what the relay allocates between receiving a Socket.IO
+frame and holding the audio it will forward upstream:
+
+  base64   audio as a base64 string in a JSON frame
+  binary   audio as a binary attachment
+
+Frames are built up front, so the received wire data is not counted. For
+each path the report gives the bytes and allocations still held per packet
+(copies of the audio), the transient peak per packet, and the time per
+packet:
+
+    python benchmarks/ingest_microbench.py --packet-bytes 4000 --packets 2000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import socketio.packet
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from audio_ingest import decode_audio  # noqa: E402
+
+
+def build_frames(packet_bytes, packets, as_base64):
+    """Encode audio_stream events the way a client would put them on the wire"""
+    frames = []
+    for i in range(packets):
+        audio = bytes([i % 256]) * packet_bytes
+        payload = {'audio': base64.b64encode(audio).decode('ascii') if as_base64 else audio, 'userId': 'bench'}
+        frames.append(socketio.packet.Packet(socketio.packet.EVENT, data=['audio_stream', payload]).encode())
+    return frames
+
+
+def receive(frame):
+    """Decode a wire frame like the Socket.IO server does and return the event payload"""
+    if isinstance(frame, list):
+        packet = socketio.packet.Packet(encoded_packet=frame[0])
+        for attachment in frame[1:]:
+            packet.add_attachment(attachment)
+    else:
+        packet = socketio.packet.Packet(encoded_packet=frame)
+    return packet.data[1]
+
+
+def ingest(frame):
+    return decode_audio(receive(frame))
+
+
+def measure(ingest, frames):
+    # Time first, without tracemalloc overhead
+    started = time.perf_counter()
+    for frame in frames:
+        ingest(frame)
+    seconds = time.perf_counter() - started
+
+    held = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    peaks = 0
+    for frame in frames:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        held.append(ingest(frame))
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    count = len(frames)
+    return {
+        'held_bytes_per_packet': sum(stat.size_diff for stat in stats) / count,
+        'held_allocations_per_packet': sum(stat.count_diff for stat in stats) / count,
+        'peak_bytes_per_packet': peaks / count,
+        'us_per_packet': seconds / count * 1e6,
+        'audio_bytes': len(held[0]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packet-bytes', type=int, default=4000, help='Audio bytes per packet (default 4000)')
+    parser.add_argument('--packets', type=int, default=2000, help='Packets per path (default 2000)')
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    base64_frames = build_frames(args.packet_bytes, args.packets, as_base64=True)
+    binary_frames = build_frames(args.packet_bytes, args.packets, as_base64=False)
+    report = {
+        'packet_bytes': args.packet_bytes,
+        'packets': args.packets,
+        'python': sys.version.split()[0],
+        'paths': {
+            'base64': measure(ingest, base64_frames),
+            'binary': measure(ingest, binary_frames),
+        },
+    }
+
+    print(f"{'path':<14} {'held B/pkt':>11} {'held allocs':>12} {'peak B/pkt':>11} {'us/pkt':>8}")
+    for name, result in report['paths'].items():
+        print(f"{name:<14} {result['held_bytes_per_packet']:>11.0f} {result['held_allocations_per_packet']:>12.1f} "
+              f"{result['peak_bytes_per_packet']:>11.0f} {result['us_per_packet']:>8.2f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark of the per-packet logging overhead on the audio path.
+
+Replays the logging the audio_stream handler does for each packet, plus a
+transcript log every `--transcript-every` packets, and reports the time the
+handler thread spends per packet (mean and p99/max, which is where disk
+stalls show up) with:
+
+  before  logging.basicConfig with a StreamHandler and a FileHandler,
+          f-string messages and random.randint sampling, as the relay did
+  after   structured_logging.configure_logging: JSON records written by a
+          background thread, lazy %-style messages and EventSampler
+
+Both write to files in a temporary directory (stdout is redirected there
+too). --disk-latency-ms adds a delay to every file write to show what a
+slow disk does to each setup:
+
+    python benchmarks/logging_overhead.py --packets 20000 --disk-latency-ms 2
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import structured_logging  # noqa: E402
+
+
+class SlowFile:
+    """File wrapper that waits `latency` seconds on every write, like a congested disk"""
+
+    def __init__(self, stream, latency):
+        self._stream = stream
+        self._latency = latency
+
+    def write(self, data):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def slow_down(handlers, latency):
+    for handler in handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(SlowFile(handler.stream, latency))
+
+
+def reset_root():
+    structured_logging.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run_before(logger, packets, transcript_every, session_id):
+    timings = []
+    for i in range(packets):
+        started = time.perf_counter()
+        binary_data = b'\0' * 4096
+        if random.randint(1, 50) == 1:
+            logger.info(f"Audio packet from session {session_id}: type={type(binary_data)}, size={len(binary_data)} bytes")
+        if random.randint(1, 200) == 1:
+            logger.info(f"Successfully sent {len(binary_data)} bytes to Deepgram for session {session_id}")
+        if i % transcript_every == 0:
+            logger.info(f"Session {session_id} transcript received: {'hello world ' * 4 :.30}...")
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_after(logger, packets, transcript_every, session_id, sampler):
+    timings = []
+    for i in range(packets):
+        started = time.perf_counter()
+        binary_data = b'\0' * 4096
+        if sampler.due('audio_packet'):
+            logger.info("Audio packet from session %s: type=%s, size=%d bytes",
+                        session_id, type(binary_data).__name__, len(binary_data))
+        if sampler.due('audio_sent'):
+            logger.info("Successfully sent %d bytes to Deepgram for session %s", len(binary_data), session_id)
+        if i % transcript_every == 0:
+            logger.info("Session %s transcript received: %.30s...", session_id, 'hello world ' * 4,
+                        extra={'session_id': session_id})
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name, timings):
+    ordered = sorted(timings)
+    p99 = ordered[int(len(ordered) * 0.99)]
+    print(f"{name:8} mean {statistics.mean(timings) * 1e6:8.2f} us  p99 {p99 * 1e6:8.2f} us  "
+          f"max {ordered[-1] * 1e3:8.2f} ms  total {sum(timings):.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-packet logging overhead on the audio path')
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--transcript-every', type=int, default=25, help='Packets per logged transcript')
+    parser.add_argument('--disk-latency-ms', type=float, default=0.0, help='Delay added to every log write')
+    args = parser.parse_args()
+    latency = args.disk_latency_ms / 1000
+    logger = logging.getLogger('bench')
+
+    with tempfile.TemporaryDirectory() as directory:
+        stdout = open(os.path.join(directory, 'stdout.log'), 'w')
+        real_stdout, sys.stdout = sys.stdout, stdout
+        try:
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                handlers=[logging.StreamHandler(sys.stdout), logging.FileHandler(os.path.join(directory, 'before.log'))]
+            )
+            slow_down(logging.getLogger().handlers, latency)
+            before = run_before(logger, args.packets, args.transcript_every, 'bench')
+            reset_root()
+
+            listener = structured_logging.configure_logging(os.path.join(directory, 'after.log'))
+            slow_down(listener.handlers, latency)
+            after = run_after(logger, args.packets, args.transcript_every, 'bench',
+                              structured_logging.EventSampler(structured_logging.DEFAULT_SAMPLING))
+            reset_root()
+        finally:
+            sys.stdout = real_stdout
+            stdout.close()
+
+    print(f"{args.packets} packets, transcript every {args.transcript_every}, "
+          f"disk latency {args.disk_latency_ms} ms per write")
+    report('before', before)
+    report('after', after)
+
+
+if __name__ == '__main__':
+    main()
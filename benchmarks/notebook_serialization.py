@@ -0,0 +1,109 @@
+"""
+Benchmark of the notebook list response, from MongoDB documents to response
+bytes.
+
+Builds `--notebooks` notebook documents as pymongo returns them (ObjectId
+ids, datetime timestamps) with `--body-kb` KB each of noteText,
+curTranscript and curSummary, and times:
+
+  before  the per-document loop db.get_userdata used to run (stringify ids,
+          isoformat timestamps, scan every key for ObjectIds) followed by
+          Flask's jsonify
+  after   bson_json.json_response, one orjson pass over the documents
+
+Both responses are parsed and compared, so the output is known to match:
+
+    python benchmarks/notebook_serialization.py --notebooks 500 --body-kb 20
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+from bson.objectid import ObjectId
+from flask import Flask, jsonify
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from bson_json import json_response  # noqa: E402
+
+
+def build_notes(count, body_kb):
+    user_id = ObjectId()
+    now = datetime.datetime(2025, 4, 13, 8, 30, 0, 123000)
+    body = ('The voice says hello to the team. ' * (body_kb * 32))[:body_kb * 1024]
+    return [{
+        '_id': ObjectId(),
+        'userId': user_id,
+        'title': f'Note {i}',
+        'noteText': body,
+        'curTranscript': body,
+        'curSummary': body,
+        'date': now.isoformat(),
+        'duration': 450,
+        'createdAt': now - datetime.timedelta(minutes=i),
+        'updatedAt': now - datetime.timedelta(minutes=i),
+    } for i in range(count)]
+
+
+def copy_notes(notes):
+    # The old path converts the documents in place, give each run fresh ones
+    return [dict(note) for note in notes]
+
+
+def serialize_before(notes):
+    for note in notes:
+        if '_id' in note:
+            note['_id'] = str(note['_id'])
+        if 'userId' in note and isinstance(note['userId'], ObjectId):
+            note['userId'] = str(note['userId'])
+        if 'createdAt' in note and note['createdAt']:
+            note['createdAt'] = note['createdAt'].isoformat()
+        if 'updatedAt' in note and note['updatedAt']:
+            note['updatedAt'] = note['updatedAt'].isoformat()
+        for key, value in note.items():
+            if isinstance(value, ObjectId):
+                note[key] = str(value)
+    return jsonify({'success': True, 'notes': notes}).get_data()
+
+
+def serialize_after(notes):
+    return json_response({'success': True, 'notes': notes}).get_data()
+
+
+def measure(serialize, notes, runs):
+    timings = []
+    for _ in range(runs):
+        fresh = copy_notes(notes)
+        started = time.perf_counter()
+        body = serialize(fresh)
+        timings.append(time.perf_counter() - started)
+    return timings, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare notebook list serialization paths')
+    parser.add_argument('--notebooks', type=int, default=500)
+    parser.add_argument('--body-kb', type=int, default=20, help='KB in each of noteText, curTranscript, curSummary')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    notes = build_notes(args.notebooks, args.body_kb)
+    app = Flask('bench')
+    with app.app_context():
+        before, before_body = measure(serialize_before, notes, args.runs)
+        after, after_body = measure(serialize_after, notes, args.runs)
+
+    assert json.loads(before_body) == json.loads(after_body), "Serializers disagree"
+    print(f"{args.notebooks} notebooks, {args.body_kb} KB per field, response {len(after_body) / 1e6:.1f} MB")
+    for name, timings in (('before', before), ('after', after)):
+        print(f"{name:8} median {statistics.median(timings) * 1000:8.2f} ms  best {min(timings) * 1000:8.2f} ms")
+    print(f"speedup  {statistics.median(before) / statistics.median(after):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""
+Real-time audio replay benchmark for the Socket.IO transcription relay.
+
+Starts N simulated clients that connect with ?userId=
+like the frontend, send toggle_transcription start and stream recorded audio
+as audio_stream events paced at --speed times real time (0 streams as fast
+as possible). Measures
+connect time, time-to-deepgram_ready, audio-to-transcription_update latency,
+dropped packets and the server's CPU and RSS, and writes a JSON report so
+releases can be compared.
+
+By default the relay is spawned locally with the offline fake engine
+(TRANSCRIPTION_BACKEND=fake), so no network or API key is needed:
+
+    python benchmarks/relay_benchmark.py --clients 50 --audio sample.wav --output report.json
+
+Use --url to benchmark an already running relay (pass --server-pid to sample
+its CPU and RSS).
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+import socketio
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+# Browser MediaRecorder defaults used by the frontend: 250ms slices at 16 kbps
+DEFAULT_CHUNK_MS = 250
+DEFAULT_BYTES_PER_SECOND = 2000
+
+
+def load_audio(path, chunk_ms, bytes_per_second):
+    """
+    Split an audio file into packets of chunk_ms.
+    WAV files are chunked on PCM frames; anything else is treated as an opaque
+    stream at bytes_per_second. Returns (chunks, seconds_per_chunk, bytes_per_second).
+    """
+    if path.lower().endswith('.wav'):
+        with wave.open(path, 'rb') as wav:
+            frame_bytes = wav.getsampwidth() * wav.getnchannels()
+            bytes_per_second = wav.getframerate() * frame_bytes
+            data = wav.readframes(wav.getnframes())
+        chunk_size = max(frame_bytes, int(bytes_per_second * chunk_ms / 1000) // frame_bytes * frame_bytes)
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+        chunk_size = max(1, int(bytes_per_second * chunk_ms / 1000))
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    return chunks, chunk_size / bytes_per_second, bytes_per_second
+
+
+def synthetic_audio(duration, chunk_ms, sample_rate=16000, seed=0):
+    """Low-level noise as 16-bit mono PCM, for runs without a recording"""
+    rng = random.Random(seed)
+    bytes_per_second = sample_rate * 2
+    samples = int(duration * sample_rate)
+    data = b''.join(rng.randint(-500, 500).to_bytes(2, 'little', signed=True) for _ in range(samples))
+    chunk_size = int(bytes_per_second * chunk_ms / 1000)
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    return chunks, chunk_size / bytes_per_second, bytes_per_second
+
+
+def percentiles(values):
+    """Summary statistics in milliseconds for a list of seconds"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+class ResourceSampler:
+    """Samples CPU time and RSS of a process from /proc (Linux only)"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def _read(self):
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu_seconds = (int(fields[11]) + int(fields[12])) / self._clock_ticks
+            with open(f'/proc/{self.pid}/status') as f:
+                rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            return time.monotonic(), cpu_seconds, rss_kb
+        except (OSError, StopIteration, IndexError, ValueError):
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            sample = self._read()
+            if sample:
+                self.samples.append(sample)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if len(self.samples) < 2:
+            return {'available': False}
+        (t0, cpu0, _), (t1, cpu1, _) = self.samples[0], self.samples[-1]
+        rss = [sample[2] for sample in self.samples]
+        return {
+            'available': True,
+            'cpu_seconds': cpu1 - cpu0,
+            'cpu_percent_avg': 100 * (cpu1 - cpu0) / (t1 - t0) if t1 > t0 else 0.0,
+            'rss_mb_max': max(rss) / 1024,
+            'rss_mb_end': rss[-1] / 1024,
+        }
+
+
+class ClientResult:
+    __slots__ = ('connect_time', 'ready_time', 'latencies', 'packets_sent', 'packets_dropped',
+                 'audio_seconds_sent', 'audio_seconds_transcribed', 'transcripts', 'errors')
+
+    def __init__(self):
+        self.connect_time = None
+        self.ready_time = None
+        self.latencies = []
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self.audio_seconds_sent = 0.0
+        self.audio_seconds_transcribed = 0.0
+        self.transcripts = 0
+        self.errors = []
+
+
+async def run_client(index, url, chunks, chunk_seconds, speed, wait_ready, drain_seconds, run_id, query=''):
+    result = ClientResult()
+    session_id = f'bench-{run_id}-{index}'
+    client = socketio.AsyncClient(reconnection=False)
+    ready = asyncio.Event()
+    # Cumulative audio offset at the end of each packet and when it was sent
+    offsets = []
+    send_times = []
+
+    @client.on('deepgram_ready')
+    async def on_ready(data=None):
+        if result.ready_time is None:
+            result.ready_time = time.monotonic() - start_sent
+        ready.set()
+
+    @client.on('transcription_update')
+    async def on_transcript(data):
+        received = time.monotonic()
+        result.transcripts += 1
+        if not isinstance(data, dict) or 'start' not in data:
+            return
+        end = data['start'] + data.get('duration', 0.0)
+        result.audio_seconds_transcribed = max(result.audio_seconds_transcribed, end)
+        position = bisect.bisect_left(offsets, end - 1e-6)
+        if position < len(send_times):
+            result.latencies.append(received - send_times[position])
+
+    @client.on('transcription_batch')
+    async def on_transcript_batch(data):
+        for update in data.get('updates', []):
+            await on_transcript(update)
+
+    async def on_failure(data=None):
+        result.packets_dropped += 1
+        result.errors.append(data)
+
+    client.on('connection_lost', on_failure)
+    client.on('deepgram_error', on_failure)
+
+    connect_started = time.monotonic()
+    try:
+        await client.connect(f'{url}?userId={session_id}{query}', transports=['websocket'])
+    except Exception as e:
+        result.errors.append(f'connect failed: {e}')
+        return result
+    result.connect_time = time.monotonic() - connect_started
+
+    start_sent = time.monotonic()
+    await client.emit('toggle_transcription', {'action': 'start', 'userId': session_id})
+    if wait_ready:
+        try:
+            await asyncio.wait_for(ready.wait(), timeout=30)
+        except asyncio.TimeoutError:
+            result.errors.append('deepgram_ready timeout')
+
+    stream_started = time.monotonic()
+    position = 0.0
+    for n, chunk in enumerate(chunks):
+        if speed > 0:
+            delay = stream_started + n * chunk_seconds / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if not client.connected:
+            result.packets_dropped += 1
+            continue
+        position += chunk_seconds
+        offsets.append(position)
+        send_times.append(time.monotonic())
+        await client.emit('audio_stream', {'audio': chunk, 'userId': session_id})
+        result.packets_sent += 1
+    result.audio_seconds_sent = position
+
+    await client.emit('toggle_transcription', {'action': 'stop', 'userId': session_id})
+    await asyncio.sleep(drain_seconds)
+    await client.disconnect()
+    return result
+
+
+def wait_for_port(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def spawn_server(port, bytes_per_second, extra_env):
+    env = dict(os.environ)
+    env.setdefault('TRANSCRIPTION_BACKEND', 'fake')
+    env.setdefault('FAKE_ENGINE_BYTES_PER_SECOND', str(bytes_per_second))
+    env['PORT'] = str(port)
+    env.update(extra_env)
+    process = subprocess.Popen(
+        [sys.executable, 'relay_server.py'], cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    if not wait_for_port('127.0.0.1', port):
+        process.kill()
+        raise RuntimeError(f"Relay did not start listening on port {port}")
+    return process
+
+
+async def run_clients(args, chunks, chunk_seconds, run_id):
+    tasks = []
+    for index in range(args.clients):
+        tasks.append(asyncio.create_task(run_client(
+            index, args.url, chunks[index % len(chunks)], chunk_seconds, args.speed,
+            not args.no_wait_ready, args.drain, run_id, args.query
+        )))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.clients)
+    return await asyncio.gather(*tasks)
+
+
+def build_report(args, results, resources, wall_seconds, audio_info):
+    latencies = [latency for result in results for latency in result.latencies]
+    sent = sum(result.packets_sent for result in results)
+    dropped = sum(result.packets_dropped for result in results)
+    audio_sent = sum(result.audio_seconds_sent for result in results)
+    audio_transcribed = sum(min(result.audio_seconds_transcribed, result.audio_seconds_sent) for result in results)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'config': {
+            'clients': args.clients,
+            'speed': args.speed,
+            'chunk_ms': args.chunk_ms,
+            'url': args.url,
+            'spawned_server': args.spawn,
+            'wait_ready': not args.no_wait_ready,
+            'pcm': args.pcm,
+            'audio': audio_info,
+        },
+        'wall_seconds': wall_seconds,
+        'connect': percentiles([r.connect_time for r in results if r.connect_time is not None]),
+        'time_to_ready': percentiles([r.ready_time for r in results if r.ready_time is not None]),
+        'transcript_latency': percentiles(latencies),
+        'packets': {
+            'sent': sent,
+            'dropped': dropped,
+            'dropped_ratio': dropped / (sent + dropped) if sent + dropped else 0.0,
+        },
+        'audio': {
+            'seconds_sent': audio_sent,
+            'seconds_transcribed': audio_transcribed,
+            'uncovered_seconds': audio_sent - audio_transcribed,
+        },
+        'transcripts': sum(result.transcripts for result in results),
+        'failed_clients': sum(1 for result in results if result.connect_time is None),
+        'errors': [str(error) for result in results for error in result.errors][:50],
+        'server': resources,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=10, help='Number of simulated clients')
+    parser.add_argument('--audio', nargs='*', default=[], help='Audio files to replay, assigned round-robin')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of synthetic audio when no --audio is given')
+    parser.add_argument('--chunk-ms', type=int, default=DEFAULT_CHUNK_MS, help='Packet size in milliseconds of audio')
+    parser.add_argument('--bytes-per-second', type=int, default=DEFAULT_BYTES_PER_SECOND,
+                        help='Byte rate of non-WAV audio files')
+    parser.add_argument('--speed', type=float, default=1.0, help='Pacing multiple of real time, 0 for unpaced')
+    parser.add_argument('--ramp', type=float, default=0.0, help='Seconds over which clients are started')
+    parser.add_argument('--warmup', type=float, default=0.0,
+                        help='Seconds to wait after the relay is up, e.g. to let a warm pool fill')
+    parser.add_argument('--drain', type=float, default=2.0, help='Seconds to wait for final transcripts after stop')
+    parser.add_argument('--no-wait-ready', action='store_true', help='Stream audio before deepgram_ready arrives')
+    parser.add_argument('--pcm', action='store_true',
+                        help='Declare the audio as raw linear16 (WAV or synthetic), e.g. to exercise VAD_ENABLED')
+    parser.add_argument('--url', default=None, help='URL of a running relay, otherwise one is spawned')
+    parser.add_argument('--port', type=int, default=5055, help='Port for the spawned relay')
+    parser.add_argument('--server-pid', type=int, default=None, help='PID of the relay at --url to sample')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the spawned relay')
+    parser.add_argument('--output', default='relay_benchmark.json', help='Path of the JSON report')
+    args = parser.parse_args(argv)
+
+    if args.audio:
+        loaded = [load_audio(path, args.chunk_ms, args.bytes_per_second) for path in args.audio]
+        chunks = [chunk_list for chunk_list, _, _ in loaded]
+        chunk_seconds = loaded[0][1]
+        bytes_per_second = loaded[0][2]
+        audio_info = {'files': args.audio, 'bytes_per_second': bytes_per_second}
+    else:
+        chunk_list, chunk_seconds, bytes_per_second = synthetic_audio(args.duration, args.chunk_ms)
+        chunks = [chunk_list]
+        audio_info = {'synthetic_seconds': args.duration, 'bytes_per_second': bytes_per_second}
+    args.query = f'&encoding=linear16&sampleRate={bytes_per_second // 2}' if args.pcm else ''
+
+    process = None
+    args.spawn = args.url is None
+    if args.spawn:
+        extra_env = dict(item.split('=', 1) for item in args.server_env)
+        process = spawn_server(args.port, bytes_per_second, extra_env)
+        args.url = f'http://127.0.0.1:{args.port}'
+    if args.warmup:
+        time.sleep(args.warmup)
+    pid = process.pid if process else args.server_pid
+
+    sampler = ResourceSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+    run_id = f'{os.getpid()}-{int(time.time())}'
+    started = time.monotonic()
+    try:
+        results = asyncio.run(run_clients(args, chunks, chunk_seconds, run_id))
+    finally:
+        wall_seconds = time.monotonic() - started
+        resources = sampler.stop() if sampler else {'available': False}
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = build_report(args, results, resources, wall_seconds, audio_info)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    latency = report['transcript_latency']
+    print(f"clients={args.clients} transcripts={report['transcripts']} "
+          f"dropped={report['packets']['dropped']}/{report['packets']['sent']} "
+          f"latency p50={latency.get('p50_ms', 0):.0f}ms p95={latency.get('p95_ms', 0):.0f}ms "
+          f"p99={latency.get('p99_ms', 0):.0f}ms -> {args.output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
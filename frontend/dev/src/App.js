@@ -8,6 +8,9 @@ import NotebookList from './components/NotebookList';
 import NotebookDetail from './components/NotebookDetail';
 
 // Animation variants
+// Notebooks fetched per page of the notebook list
+const NOTEBOOK_PAGE_SIZE = 50;
+
 const containerVariants = {
   hidden: { opacity: 0 },
   visible: { 
@@ -46,6 +49,7 @@ function App() {
   
   // Notebook states
   const [notebooks, setNotebooks] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [currentView, setCurrentView] = useState('list'); // 'list', 'new', 'view'
   const [selectedNotebook, setSelectedNotebook] = useState(null);
   const [isSaving, setIsSaving] = useState(false);
@@ -75,11 +79,16 @@ function App() {
     }
   }, []);
 
-  // Fetch user notebooks from the server
-  const fetchUserNotebooks = async (userId) => {
+  // Fetch a page of the user's notebooks (list fields only) from the server.
+  // Without a cursor this reloads the first page, with one it appends the next.
+  const fetchUserNotebooks = async (userId, cursor = null) => {
     try {
       // Fetch from notebooks collection
-      const response = await fetch(`https://firmament-api.onrender.com/notebooks/${userId}`);
+      const params = new URLSearchParams({ view: 'list', limit: NOTEBOOK_PAGE_SIZE });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+      const response = await fetch(`https://firmament-api.onrender.com/notebooks/${userId}?${params}`);
       
       if (!response.ok) {
         // Handle HTTP errors
@@ -98,7 +107,8 @@ function App() {
 
       // Update state with notebooks data
       if (data.success && Array.isArray(data.notes)) {
-        setNotebooks(data.notes);
+        setNotebooks(prevNotebooks => cursor ? [...prevNotebooks, ...data.notes] : data.notes);
+        setNextCursor(data.nextCursor || null);
       } else {
         console.error('Failed to fetch notebooks:', data.message || 'Unknown error');
         // Initialize with empty array if no data
@@ -140,6 +150,7 @@ function App() {
     setUserInfo(null);
     setShowLogin(true);
     setNotebooks([]);
+    setNextCursor(null);
     setCurrentView('list');
     setSelectedNotebook(null);
   };
@@ -156,16 +167,29 @@ function App() {
     console.log("View state updated to 'new'");
   };
 
-  const handleViewNotebook = (notebookId) => {
+  const handleLoadMoreNotebooks = () => {
+    if (nextCursor) {
+      fetchUserNotebooks(userId, nextCursor);
+    }
+  };
+
+  const handleViewNotebook = async (notebookId) => {
     console.log("View notebook requested for ID:", notebookId);
-    const notebook = notebooks.find(n => n._id === notebookId);
     
-    if (notebook) {
-      console.log("Found notebook to view:", notebook);
-      setSelectedNotebook(notebook);
-      setCurrentView('view');
-    } else {
-      console.error("Notebook not found with ID:", notebookId);
+    // The list only has summaries, fetch the full notebook
+    try {
+      const response = await fetch(`https://firmament-api.onrender.com/notebooks/${userId}/${notebookId}`);
+      const data = await response.json();
+      
+      if (response.ok && data.success) {
+        console.log("Found notebook to view:", data.note);
+        setSelectedNotebook(data.note);
+        setCurrentView('view');
+      } else {
+        console.error("Notebook not found with ID:", notebookId, data.message);
+      }
+    } catch (error) {
+      console.error('Error fetching notebook:', error);
     }
   };
 
@@ -391,6 +415,8 @@ function App() {
                 onStartNewNotebook={handleStartNewNotebook}
                 onViewNotebook={handleViewNotebook}
                 onDeleteNotebook={handleDeleteNotebook}
+                hasMore={Boolean(nextCursor)}
+                onLoadMore={handleLoadMoreNotebooks}
               />
             </motion.div>
           )}
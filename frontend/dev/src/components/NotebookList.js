@@ -6,7 +6,9 @@ const NotebookList = ({
   notebooks, 
   onStartNewNotebook, 
   onViewNotebook,
-  onDeleteNotebook 
+  onDeleteNotebook,
+  hasMore,
+  onLoadMore
 }) => {
   // State to track deletion in progress
   const [deletingId, setDeletingId] = useState(null);
@@ -98,11 +100,11 @@ const NotebookList = ({
                   </span>
                 </div>
                 <p className="notebook-preview">
-                  {((notebook.noteText || '').substring(0, 100))}
-                  {((notebook.noteText || '').length > 100 ? '...' : '')}
+                  {/* List pages carry a server-side preview of the first 100 characters */}
+                  {notebookPreview(notebook)}
                 </p>
                 <div className="notebook-item-footer">
-                  {notebook.curTranscript && notebook.curTranscript.trim() !== '' && (
+                  {hasTranscript(notebook) && (
                     <span className="notebook-duration">
                       Duration: {formatDuration(notebook.duration)}
                     </span>
@@ -132,6 +134,16 @@ const NotebookList = ({
               </motion.div>
             ))}
           </AnimatePresence>
+          {hasMore && (
+            <motion.button 
+              className="new-notebook-button load-more-button" 
+              onClick={onLoadMore}
+              whileHover={{ y: -2 }}
+              whileTap={{ y: 0 }}
+            >
+              Load more
+            </motion.button>
+          )}
         </motion.div>
       ) : (
         <motion.div 
@@ -155,6 +167,19 @@ const NotebookList = ({
   );
 };
 
+// Preview text: the list's preview field, or the start of the full note text
+const notebookPreview = (notebook) => {
+  const text = notebook.preview !== undefined ? notebook.preview : (notebook.noteText || '');
+  return text.length >= 100 ? `${text.substring(0, 100)}...` : text;
+};
+
+const hasTranscript = (notebook) => {
+  if (notebook.hasTranscript !== undefined) {
+    return notebook.hasTranscript;
+  }
+  return Boolean(notebook.curTranscript && notebook.curTranscript.trim() !== '');
+};
+
 // Format date for display
 const formatDate = (dateStr) => {
   if (!dateStr) return 'Unknown date';
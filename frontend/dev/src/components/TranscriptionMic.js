@@ -50,6 +50,7 @@ const TranscriptionMic = ({
   const reconnectAttemptsRef = useRef(0);
   const ephemeralUserIdRef = useRef(null);
   const accumulatedTranscriptRef = useRef('');
+  const interimTranscriptRef = useRef(''); // Unstable interim hypothesis, replaced by deltas
   const startTimeRef = useRef(null);
   const MAX_RECONNECT_ATTEMPTS = 5;
   
@@ -118,8 +119,22 @@ const TranscriptionMic = ({
     }
   };
 
+  // Ask the relay which worker serves this session (multi-worker deployments)
+  const resolveSocketUrl = async (defaultUrl, ephemeralUserId) => {
+    try {
+      const response = await fetch(`${defaultUrl}/affinity?userId=${encodeURIComponent(ephemeralUserId)}`);
+      if (response.ok) {
+        const { url } = await response.json();
+        if (url) return url;
+      }
+    } catch (error) {
+      debugLog("Could not resolve session worker, using default server", error);
+    }
+    return defaultUrl;
+  };
+
   // Initialize a fresh socket connection with a new ephemeral ID
-  const initializeSocket = (ephemeralUserId) => {
+  const initializeSocket = (ephemeralUserId, socketUrl) => {
     return new Promise((resolve, reject) => {
       // Ensure we have an ephemeral user ID
       if (!ephemeralUserId) {
@@ -134,14 +149,13 @@ const TranscriptionMic = ({
         socketRef.current = null;
       }
 
-      // Use the Render-deployed socketio server
-      const socketUrl = `https://firmament-socketio.onrender.com`;
-      
       debugLog(`Initializing socket connection to ${socketUrl} with userId ${ephemeralUserId}`);
       
       try {
         const socket = io(socketUrl, {
-          query: { userId: ephemeralUserId }, // Use ephemeral ID in query params
+          // Use ephemeral ID in query params, the account ID for per-user connection limits,
+          // interim results arrive as deltas
+          query: { userId: ephemeralUserId, accountId: userId || '', interimResults: 'true' },
           reconnection: true,
           reconnectionAttempts: 5,
           reconnectionDelay: 1000,
@@ -241,9 +255,36 @@ const TranscriptionMic = ({
           onStatusChange(data.message);
         });
 
+        socket.on('queue_position', (data) => {
+          debugLog("⏳ Waiting for a speech service connection", data);
+          onStatusChange(`Waiting for the speech service... (position ${data.position} in queue)`);
+        });
+
         // Handle socket transcription updates
-        socket.on("transcription_update", (data) => {
-          if (data.transcription && data.transcription.trim() !== '') {
+        const handleTranscriptionUpdate = (data) => {
+          if (typeof data.offset === 'number') {
+            // Interim mode: replace the unstable text from offset on, a final commits it
+            lastActivityTimeRef.current = Date.now();
+            const interim = interimTranscriptRef.current.substring(0, data.offset) + data.transcription;
+            let shown;
+            if (data.is_final) {
+              interimTranscriptRef.current = '';
+              if (interim.trim() !== '') {
+                const currentTranscript = accumulatedTranscriptRef.current;
+                const spacer = currentTranscript && !currentTranscript.endsWith(' ') ? ' ' : '';
+                accumulatedTranscriptRef.current = currentTranscript + spacer + interim;
+              }
+              shown = accumulatedTranscriptRef.current;
+            } else {
+              interimTranscriptRef.current = interim;
+              const currentTranscript = accumulatedTranscriptRef.current;
+              const spacer = currentTranscript && interim && !currentTranscript.endsWith(' ') ? ' ' : '';
+              shown = currentTranscript + spacer + interim;
+            }
+            if (onTranscriptChange) {
+              onTranscriptChange(shown, recording);
+            }
+          } else if (data.transcription && data.transcription.trim() !== '') {
             // Update last activity time when receiving transcripts
             lastActivityTimeRef.current = Date.now();
             
@@ -266,6 +307,11 @@ const TranscriptionMic = ({
               onTranscriptChange(accumulatedTranscriptRef.current, recording);
             }
           }
+        };
+        socket.on("transcription_update", handleTranscriptionUpdate);
+        // Several updates batched into one message by the server
+        socket.on("transcription_batch", (batch) => {
+          batch.updates.forEach(handleTranscriptionUpdate);
         });
 
         // Store socket in ref
@@ -467,6 +513,7 @@ const TranscriptionMic = ({
       
       // Reset accumulated transcript
       accumulatedTranscriptRef.current = '';
+      interimTranscriptRef.current = '';
       
       // IMPORTANT: Set recording state to true BEFORE starting the recording process
       setRecording(true);
@@ -494,7 +541,9 @@ const TranscriptionMic = ({
       
       // Initialize a fresh socket connection with the new ephemeral ID
       onStatusChange("Connecting to server...");
-      await initializeSocket(newEphemeralUserId);
+      // Use the Render-deployed socketio server, or the worker that owns this session
+      const socketUrl = await resolveSocketUrl(`https://firmament-socketio.onrender.com`, newEphemeralUserId);
+      await initializeSocket(newEphemeralUserId, socketUrl);
       
       onStatusChange("Initializing microphone...");
       
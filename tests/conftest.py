@@ -0,0 +1,109 @@
+import importlib
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from bson.objectid import ObjectId
+
+# Backend modules are flat files in backend/, make them importable from tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+# Keep db.py from reaching the database configured in .env; collections are
+# stubbed by the tests that need them
+os.environ['MONGO_URI'] = 'mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=50&connectTimeoutMS=50'
+
+
+def wait_until(condition, timeout=3.0):
+    """Poll condition() until it is true or timeout seconds pass. Returns whether it became true"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def http_app(tmp_path, monkeypatch):
+    """The HTTP app module (app.py), imported with its log file written outside the tree"""
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module('app')
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, spec, direction=None):
+        if direction is not None:
+            spec = [(spec, direction)]
+        # Missing fields sort lowest, like null in MongoDB
+        for field, direction in reversed(spec):
+            self.docs.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field) or 0), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    """
+    The subset of a pymongo collection db.py's note functions use, with
+    filters of equalities, $lt and $or
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.projections = []
+
+    @classmethod
+    def matches(cls, doc, query):
+        for field, condition in query.items():
+            if field == '$or':
+                if not any(cls.matches(doc, branch) for branch in condition):
+                    return False
+            elif isinstance(condition, dict):
+                if doc.get(field) is None or not doc[field] < condition['$lt']:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        self.projections.append(projection)
+        return FakeCursor([doc for doc in self.docs if self.matches(doc, query)])
+
+    def find_one(self, query, projection=None, sort=None):
+        return next(iter(self.find(query).sort(sort or [])), None)
+
+    def count_documents(self, query):
+        return len(self.find(query).docs)
+
+    def insert_one(self, doc):
+        doc = dict(doc, _id=ObjectId())
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc['_id'])
+
+    def find_one_and_update(self, query, update, projection=None):
+        doc = self.find_one(query)
+        if doc is not None:
+            previous = dict(doc)
+            doc.update(update['$set'])
+            return previous
+        return None
+
+
+@pytest.fixture
+def notebooks(monkeypatch):
+    """db's notebooks collection, stubbed and empty, with the notebook cache off"""
+    import db
+    collection = FakeCollection([])
+    monkeypatch.setattr(db, 'notebooks_collection', collection)
+    monkeypatch.setattr(db, 'notebook_cache', None)
+    return collection
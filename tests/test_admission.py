@@ -0,0 +1,70 @@
+from admission import AdmissionController
+
+
+def test_queue_is_fifo_and_reports_positions():
+    positions = []
+    admission = AdmissionController(max_connections=1, max_queue=2,
+                                    on_position=lambda session_id, position: positions.append((session_id, position)))
+    admitted = []
+
+    assert admission.request('a', lambda: admitted.append('a')) == 0
+    assert admission.request('b', lambda: admitted.append('b')) == 1
+    assert admission.request('c', lambda: admitted.append('c')) == 2
+    # The queue is full
+    assert admission.request('d', lambda: admitted.append('d')) is None
+    assert admitted == ['a']
+    assert positions == [('b', 1), ('c', 2)]
+
+    admission.release('a')
+    assert admitted == ['a', 'b']
+    assert positions[-1] == ('c', 1)
+
+    stats = admission.stats()
+    assert stats['active'] == 1 and stats['waiting'] == 1
+    assert stats['queued'] == 2 and stats['rejected'] == 1
+
+
+def test_user_at_cap_does_not_block_others():
+    admission = AdmissionController(max_connections=3, max_per_user=1)
+    admitted = []
+    admission.request('a', lambda: admitted.append('a1'))
+    # Waits for user a's own connection, not for global room
+    assert admission.request('a', lambda: admitted.append('a2')) == 1
+    assert admission.request('b', lambda: admitted.append('b1')) == 0
+    assert admitted == ['a1', 'b1']
+
+    assert admission.cancel('a')
+    admission.release('a')
+    assert admitted == ['a1', 'b1']
+    assert admission.stats()['active'] == 1
+
+
+def test_caps_count_accounts_and_reserved_slots():
+    admission = AdmissionController(max_connections=2, max_per_user=1)
+    pool = []  # Stands in for idle warm pool connections
+
+    def reclaim():
+        if not pool:
+            return False
+        pool.pop()
+        return True
+
+    admission.reclaim = reclaim
+    for _ in range(2):
+        assert admission.reserve()
+        pool.append('idle')
+    assert not admission.reserve()
+
+    admitted = []
+    # Takes the slot of an idle connection instead of waiting
+    assert admission.request('recording-1', lambda: admitted.append(1), 'alice') == 0
+    # Every recording of a user counts against the same cap; no slot is reclaimed for it
+    assert admission.request('recording-2', lambda: admitted.append(2), 'alice') == 1
+    assert pool == ['idle']
+    assert admission.request('recording-3', lambda: admitted.append(3), 'bob') == 0
+    assert admitted == [1, 3] and pool == []
+
+    admission.release('recording-1')
+    assert admitted == [1, 3, 2]
+    stats = admission.stats()
+    assert (stats['active'], stats['reserved'], stats['reclaimed']) == (2, 0, 2)
@@ -0,0 +1,79 @@
+import pytest
+from bson.objectid import ObjectId
+from flask import jsonify
+
+import db
+from notebook_cache import LocalCache, NotebookCache
+
+
+def test_not_modified_does_not_build(http_app):
+    built = []
+
+    def build():
+        built.append(1)
+        return jsonify({'success': True})
+
+    with http_app.app.test_request_context(headers={'If-None-Match': 'W/"v1"'}):
+        response = http_app.conditional_response('v1', build)
+        assert response.status_code == 304 and built == []
+        assert response.headers['ETag'] == 'W/"v1"'
+
+        response = http_app.conditional_response('v2', build)
+        assert response.status_code == 200 and built == [1]
+        assert response.headers['ETag'] == 'W/"v2"'
+        assert response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_errors_carry_no_etag(http_app, notebooks):
+    client = http_app.app.test_client()
+    user_id = str(ObjectId())
+    assert 'ETag' in client.get(f'/notebooks/{user_id}').headers
+
+    for path in (f'/notebooks/{user_id}/{ObjectId()}', f'/notebooks/{user_id}/not-an-id',
+                 f'/notebooks/{user_id}?view=list&cursor=garbage'):
+        response = client.get(path)
+        assert response.status_code in (400, 404)
+        assert 'ETag' not in response.headers and 'Cache-Control' not in response.headers
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_a_write_changes_the_etag(http_app, notebooks, monkeypatch, shared):
+    backend = LocalCache()
+    # Stands in for a Redis cache; a local one falls back to the database's version
+    backend.shared = shared
+    monkeypatch.setattr(db, 'notebook_cache', NotebookCache(backend))
+    client = http_app.app.test_client()
+    user_id = str(ObjectId())
+
+    etag = client.get(f'/notebooks/{user_id}').headers['ETag']
+    assert client.get(f'/notebooks/{user_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    saved = client.post('/notebooks', json={'userId': user_id, 'noteText': 'First'}).get_json()
+    response = client.get(f'/notebooks/{user_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert [note['noteText'] for note in response.get_json()['notes']] == ['First']
+
+    etag = response.headers['ETag']
+    client.post('/notebooks', json={'userId': user_id, 'noteId': saved['noteId'], 'noteText': 'Edited'})
+    response = client.get(f'/notebooks/{user_id}?view=list', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_workers_with_local_caches_agree_on_the_etag(notebooks, monkeypatch):
+    workers = [NotebookCache(LocalCache()) for _ in range(2)]
+    user_id = str(ObjectId())
+
+    def versions():
+        seen = []
+        for worker in workers:
+            monkeypatch.setattr(db, 'notebook_cache', worker)
+            seen.append(db.notes_version(user_id))
+        return seen
+
+    before = versions()
+    assert before[0] == before[1]
+    # Saved through the first worker, only its local cache is invalidated
+    monkeypatch.setattr(db, 'notebook_cache', workers[0])
+    assert db.insert_or_update_note({'userId': user_id, 'noteId': None, 'noteText': 'New'})['success']
+    after = versions()
+    assert after[0] == after[1] != before[0]
@@ -0,0 +1,46 @@
+import pytest
+
+from audio_buffer import DROP_NEWEST, DROP_OLDEST, PreconnectBuffer
+
+
+def test_drain_preserves_order():
+    buffer = PreconnectBuffer(max_bytes=100, max_seconds=10)
+    for packet in (b'header', b'a', b'b', b'c'):
+        buffer.append(packet, now=0.0)
+    assert buffer.drain(now=1.0) == [b'header', b'a', b'b', b'c']
+    assert len(buffer) == 0
+    assert buffer.stats()['flushed_bytes'] == 9
+
+
+def test_drop_oldest_keeps_pinned_header():
+    buffer = PreconnectBuffer(max_bytes=4, max_seconds=10, policy=DROP_OLDEST)
+    buffer.append(b'HDR', now=0.0)
+    for packet in (b'aa', b'bb', b'cc'):
+        buffer.append(packet, now=0.0)
+    assert buffer.drain(now=0.0) == [b'HDR', b'bb', b'cc']
+    assert buffer.dropped_bytes == 2
+
+
+def test_drop_newest_and_age_limit():
+    buffer = PreconnectBuffer(max_bytes=4, max_seconds=5, policy=DROP_NEWEST, pin_first=False)
+    assert buffer.append(b'aa', now=0.0)
+    assert buffer.append(b'bb', now=1.0)
+    assert not buffer.append(b'cc', now=2.0)
+    # 'aa' is older than max_seconds by the time we drain
+    assert buffer.drain(now=5.5) == [b'bb']
+    assert buffer.dropped_bytes == 4
+
+
+def test_clear_counts_dropped_and_resets_stream():
+    buffer = PreconnectBuffer(max_bytes=100)
+    buffer.append(b'HDR')
+    buffer.append(b'xx')
+    buffer.clear()
+    assert buffer.dropped_bytes == 5
+    buffer.append(b'NEW')
+    assert buffer.drain() == [b'NEW']
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PreconnectBuffer(policy='drop_random')
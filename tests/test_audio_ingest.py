@@ -0,0 +1,21 @@
+import base64
+
+import pytest
+
+from audio_ingest import LINEAR16, UnsupportedAudioFormat, decode_audio, negotiate_encoding
+
+
+def test_decode_audio_accepts_every_payload_shape():
+    audio = b'\x01\x02' * 100
+    # Binary attachments pass through without a copy
+    assert decode_audio(audio) is audio
+    assert decode_audio({'audio': audio, 'userId': 'session-a'}) is audio
+    assert decode_audio({'audio': base64.b64encode(audio).decode()}) == audio
+    for payload in ('not base64!', {'audio': 42}):
+        with pytest.raises(UnsupportedAudioFormat):
+            decode_audio(payload)
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None, None) is None
+    assert negotiate_encoding(LINEAR16, '16000') == {'encoding': LINEAR16, 'sample_rate': 16000, 'channels': 1}
@@ -0,0 +1,107 @@
+import threading
+
+from audio_sender import BLOCK, DROP_OLDEST, SIGNAL, SessionSender
+
+
+class GatedConnection:
+    """Connection whose send() waits until the test opens the gate"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.sent = []
+
+    def send(self, data):
+        self.gate.wait(2)
+        self.sent.append(data)
+        return True
+
+
+def test_sender_preserves_order_and_reports_stats():
+    connection = GatedConnection()
+    connection.gate.set()
+    sender = SessionSender('session-a')
+    for i in range(20):
+        assert sender.put(connection, bytes([i]))
+    assert sender.wait_empty(2)
+
+    assert connection.sent == [bytes([i]) for i in range(20)]
+    stats = sender.stats()
+    assert stats['sent_packets'] == 20 and stats['sent_bytes'] == 20
+    assert stats['depth'] == 0 and stats['dropped_packets'] == 0
+
+
+def test_drop_oldest_and_block_policies():
+    connection = GatedConnection()
+    sender = SessionSender('session-a', max_packets=2, policy=DROP_OLDEST)
+    sender.put(connection, b'a')  # Picked up by the sender thread, stuck in send()
+    assert sender.wait_empty(0.05) is False
+    for packet in (b'b', b'c', b'd'):
+        sender.put(connection, packet)
+    connection.gate.set()
+    assert sender.wait_empty(2)
+    assert connection.sent == [b'a', b'c', b'd']
+    assert sender.stats()['dropped_packets'] == 1
+
+    connection = GatedConnection()
+    sender = SessionSender('session-a', max_packets=1, policy=BLOCK, block_timeout=0.05)
+    sender.put(connection, b'a')
+    sender.wait_empty(0.05)
+    assert sender.put(connection, b'b')
+    assert sender.put(connection, b'c') is False  # Queue stayed full for block_timeout
+    connection.gate.set()
+    assert sender.wait_empty(2)
+    assert connection.sent == [b'a', b'b']
+
+
+def test_signal_policy_notifies_congestion_and_resume():
+    connection = GatedConnection()
+    signals = []
+    sender = SessionSender('session-a', max_packets=2, policy=SIGNAL,
+                           on_congested=lambda session_id, congested: signals.append(congested))
+    sender.put(connection, b'a')
+    sender.wait_empty(0.05)
+    sender.put(connection, b'b')
+    sender.put(connection, b'c')
+    assert sender.put(connection, b'd') is False
+    assert sender.put(connection, b'e') is False
+    assert signals == [True]
+
+    connection.gate.set()
+    assert sender.wait_empty(2)
+    assert signals == [True, False]
+    assert connection.sent == [b'a', b'b', b'c']
+
+
+def test_batching_coalesces_packets_and_flushes_on_wait():
+    connection = GatedConnection()
+    connection.gate.set()
+    sender = SessionSender('session-a', batch_bytes=4, batch_window=10.0)
+    for packet in (b'a', b'b', b'c', b'd', b'e', b'f'):
+        sender.put(connection, packet)
+    # The partial second frame goes out on wait_empty instead of after the window
+    assert sender.wait_empty(1)
+
+    assert connection.sent == [b'abcd', b'ef']
+    stats = sender.stats()
+    assert stats['sent_packets'] == 6 and stats['sent_frames'] == 2
+    assert stats['batching_ratio'] == 3.0
+
+
+def test_keepalives_are_sent_in_order_with_audio():
+    calls = []
+
+    class Connection:
+        def send(self, data):
+            calls.append(data)
+
+        def keep_alive(self):
+            calls.append('keepalive')
+
+    connection = Connection()
+    sender = SessionSender('session-a', batch_bytes=4)
+    sender.put(connection, b'a')
+    sender.keep_alive(connection)
+    sender.put(connection, b'b')
+    assert sender.wait_empty(1)
+    assert calls == [b'a', 'keepalive', b'b']
+    assert sender.stats()['keepalives'] == 1
@@ -0,0 +1,33 @@
+import datetime
+import json
+
+import pytest
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from flask import Flask
+
+from bson_json import dumps, json_response
+
+
+def test_documents_serialize_like_the_old_conversion():
+    note_id, user_id = ObjectId(), ObjectId()
+    created = datetime.datetime(2025, 4, 13, 8, 30, 0, 123000)
+    note = {'_id': note_id, 'userId': user_id, 'createdAt': created, 'updatedAt': created.replace(microsecond=0),
+            'nested': {'ref': note_id}, 'tags': [user_id], 'price': Decimal128('1.50'), 'raw': b'\x00\x01'}
+
+    assert json.loads(dumps({'notes': [note]})) == {'notes': [{
+        '_id': str(note_id), 'userId': str(user_id), 'createdAt': created.isoformat(),
+        'updatedAt': created.replace(microsecond=0).isoformat(), 'nested': {'ref': str(note_id)},
+        'tags': [str(user_id)], 'price': '1.50', 'raw': 'AAE=',
+    }]}
+
+    with pytest.raises(TypeError):
+        dumps({'value': object()})
+
+
+def test_json_response():
+    with Flask('test').app_context():
+        response = json_response({'success': False}, status=404)
+    assert response.status_code == 404
+    assert response.mimetype == 'application/json'
+    assert response.get_data() == b'{"success":false}'
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from admission import AdmissionController
+from conftest import wait_until
+from connection_pool import WarmConnectionPool
+from transcription_backends import DEFAULT_OPTIONS, FakeBackend, FakeEngine
+
+
+def test_pool_hands_out_open_connections_and_replenishes():
+    backend = FakeBackend(FakeEngine(real_time_factor=0.0, latency=0.0, bytes_per_second=1000))
+    pool = WarmConnectionPool(backend, 2, DEFAULT_OPTIONS, keepalive_interval=0.05)
+    assert pool.acquire() is None  # Nothing opened yet
+
+    pool.start()
+    try:
+        assert wait_until(lambda: pool.stats()['idle'] == 2), "Pool never filled"
+        connection = pool.acquire()
+        assert connection is not None and connection.is_open
+
+        # The pool keeps idle connections alive and refills the one we took
+        assert wait_until(lambda: pool.stats()['idle'] == 2), "Pool never replenished"
+        assert wait_until(lambda: connection.keepalives == 0 and pool._idle[0][1].keepalives > 0)
+
+        # Callbacks are rebound to the session that took the connection
+        transcripts = []
+        connection.bind(on_transcript=transcripts.append)
+        connection.send(b'\0' * 1000)
+        assert wait_until(lambda: transcripts), "Rebound connection did not deliver transcripts"
+
+        stats = pool.stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+    finally:
+        pool.close()
+    assert pool.stats()['idle'] == 0
+
+
+def test_pool_expires_old_connections():
+    backend = FakeBackend(FakeEngine())
+    pool = WarmConnectionPool(backend, 1, DEFAULT_OPTIONS, keepalive_interval=0.05, max_age=0.05)
+    pool.start()
+    try:
+        assert wait_until(lambda: pool.stats()['expired'] >= 1), "Idle connection never expired"
+    finally:
+        pool.close()
+
+
+def test_pooled_connections_count_against_the_connection_cap():
+    admission = AdmissionController(max_connections=1)
+    backend = FakeBackend(FakeEngine(real_time_factor=0.0, latency=0.0))
+    pool = WarmConnectionPool(backend, 2, DEFAULT_OPTIONS, keepalive_interval=0.05, admission=admission)
+    admission.reclaim = pool.reclaim
+    pool.start()
+    try:
+        assert wait_until(lambda: pool.stats()['idle'] == 1), "Pool never filled"
+        time.sleep(0.1)
+        assert pool.stats()['idle'] == 1 and admission.stats()['reserved'] == 1
+
+        # A session at the cap gets the idle connection's slot
+        admitted = []
+        assert admission.request('session', lambda: admitted.append(True)) == 0
+        assert admitted and pool.stats()['reclaimed'] == 1
+        assert admission.stats()['active'] == 1
+    finally:
+        pool.close()
+
+
+def test_connections_opened_after_close_are_finished():
+    admission = AdmissionController(max_connections=2)
+    backend = FakeBackend(FakeEngine(real_time_factor=0.0, latency=0.0))
+    gate = threading.Event()
+    opened = []
+    create_connection = backend.create_connection
+
+    def create_gated_connection(session_id):
+        connection = create_connection(session_id)
+        start = connection.start
+
+        def gated_start(options=None):
+            gate.wait(2.0)
+            opened.append(connection)
+            return start(options)
+
+        connection.start = gated_start
+        return connection
+
+    backend.create_connection = create_gated_connection
+    pool = WarmConnectionPool(backend, 1, DEFAULT_OPTIONS, keepalive_interval=0.05, admission=admission)
+    pool.start()
+    assert wait_until(lambda: admission.stats()['reserved'] == 1), "Pool never started filling"
+    # Closed while the connection is still opening
+    pool.close()
+    gate.set()
+    assert wait_until(lambda: opened and not opened[0].is_open), "Connection opened after close was left open"
+    assert wait_until(lambda: admission.stats()['reserved'] == 0), "Slot of the late connection was not released"
+    assert pool.stats()['idle'] == 0
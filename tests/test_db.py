@@ -0,0 +1,151 @@
+import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+import db
+
+
+def test_cursor_round_trips():
+    note = {'_id': ObjectId(), 'updatedAt': datetime.datetime(2025, 4, 13, 8, 30, 0, 123000)}
+    assert db.decode_cursor(db.encode_cursor(note)) == (note['updatedAt'], note['_id'])
+    # Notes saved before updatedAt existed
+    assert db.decode_cursor(db.encode_cursor({'_id': note['_id']})) == (None, note['_id'])
+    for cursor in ('not a cursor', db.encode_cursor(note)[:-4]):
+        with pytest.raises(ValueError):
+            db.decode_cursor(cursor)
+
+
+def test_pages_break_ties_on_id(notebooks):
+    user_id = ObjectId()
+    tied = datetime.datetime(2025, 4, 13, 8, 30)
+    newest = {'_id': ObjectId(), 'userId': user_id, 'updatedAt': tied + datetime.timedelta(minutes=1)}
+    same_time = [{'_id': ObjectId(), 'userId': user_id, 'updatedAt': tied} for _ in range(4)]
+    undated = [{'_id': ObjectId(), 'userId': user_id} for _ in range(2)]
+    other_user = {'_id': ObjectId(), 'userId': ObjectId(), 'updatedAt': tied}
+    notebooks.docs = [*undated, *same_time, other_user, newest]
+
+    listed, cursor = [], None
+    while True:
+        result = db.list_notes(str(user_id), limit=2, cursor=cursor)
+        assert result['success']
+        listed += [note['_id'] for note in result['notes']]
+        cursor = result['nextCursor']
+        if cursor is None:
+            break
+
+    expected = [newest] + sorted(same_time, key=lambda note: note['_id'], reverse=True) \
+        + sorted(undated, key=lambda note: note['_id'], reverse=True)
+    assert listed == [note['_id'] for note in expected]
+
+
+def test_list_leaves_note_bodies_on_the_server(notebooks):
+    user_id = ObjectId()
+    notebooks.docs = [{'_id': ObjectId(), 'userId': user_id, 'updatedAt': datetime.datetime(2025, 4, 13)}]
+    assert db.list_notes(str(user_id))['success']
+    assert notebooks.projections == [db.NOTE_LIST_PROJECTION]
+    assert not {'noteText', 'curTranscript', 'curSummary'} & set(db.NOTE_LIST_PROJECTION)
+    assert {'preview', 'hasTranscript', 'updatedAt'} <= set(db.NOTE_LIST_PROJECTION)
+
+
+def test_invalid_cursor_is_a_bad_request(http_app, notebooks):
+    client = http_app.app.test_client()
+    response = client.get(f'/notebooks/{ObjectId()}?view=list&cursor=garbage')
+    assert response.status_code == 400
+    assert response.get_json()['message'].startswith('Invalid cursor')
+
+
+class IndexedCollection:
+    """index_information(), create_indexes() and explain() of a collection"""
+
+    def __init__(self, indexes=None, stages=('IXSCAN',)):
+        self.indexes = {'_id_': {'key': [('_id', 1)]}, **(indexes or {})}
+        self.stages = stages
+        self.created = []
+
+    def index_information(self):
+        return self.indexes
+
+    def create_indexes(self, models):
+        self.created += models
+        return [model.document['name'] for model in models]
+
+    def find(self, query):
+        return self
+
+    def sort(self, spec):
+        return self
+
+    def explain(self):
+        # FETCH <- first stage <- ... as nested inputStage documents
+        plan = {}
+        for stage in reversed(self.stages):
+            plan = {'stage': stage, 'inputStage': plan} if plan else {'stage': stage}
+        return {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': plan}}}
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, IndexedCollection())
+
+
+def test_ensure_indexes_creates_missing_and_rejects_conflicting():
+    database = FakeDatabase()
+    created = db.ensure_indexes(database)
+    assert 'users.email_unique' in created and 'notebooks.userId_updatedAt' in created
+    # Indexes that already exist as defined are left alone
+    for collection in database.values():
+        collection.indexes.update({model.document['name']: {
+            'key': list(model.document['key'].items()), 'unique': model.document.get('unique', False)}
+            for model in collection.created})
+    assert db.ensure_indexes(database) == []
+
+    # Same name, not unique
+    database = FakeDatabase(users=IndexedCollection({'email_unique': {'key': [('email', 1)]}}))
+    with pytest.raises(db.IndexCheckError, match='users.email_unique exists with a different definition'):
+        db.ensure_indexes(database)
+    # Same name, other keys
+    database = FakeDatabase(notebooks=IndexedCollection({'userId_updatedAt': {'key': [('userId', 1)]}}))
+    with pytest.raises(db.IndexCheckError, match='notebooks.userId_updatedAt'):
+        db.ensure_indexes(database)
+
+
+@pytest.mark.parametrize('stages, problem', [
+    (('IXSCAN',), None),
+    (('COLLSCAN',), 'COLLSCAN'),
+    (('SORT', 'IXSCAN'), 'SORT'),
+])
+def test_verify_indexes_flags_scans_and_in_memory_sorts(stages, problem):
+    database = FakeDatabase(notebooks=IndexedCollection(stages=stages))
+    if problem is None:
+        db.verify_indexes(database)
+        return
+    with pytest.raises(db.IndexCheckError, match=f"notebooks.*uses {problem}") as e:
+        db.verify_indexes(database)
+    assert 'users' not in str(e.value)
+
+
+def test_plan_stages_walks_nested_plans():
+    plan = {'stage': 'FETCH', 'inputStage': {'stage': 'OR', 'inputStages': [
+        {'stage': 'IXSCAN'}, {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}]}}
+    assert db._plan_stages(plan) == ['FETCH', 'OR', 'IXSCAN', 'SORT', 'COLLSCAN']
+
+
+@pytest.mark.parametrize('mode', ['apply', 'strict'])
+def test_setup_indexes_modes(http_app, monkeypatch, mode):
+    database = FakeDatabase(users=IndexedCollection(stages=('COLLSCAN',)))
+    monkeypatch.setattr(db, 'db', database)
+    monkeypatch.setenv('DB_INDEXES', mode)
+    if mode == 'strict':
+        with pytest.raises(db.IndexCheckError, match='users.*uses COLLSCAN'):
+            http_app.setup_indexes()
+    else:
+        # Logged, the app starts anyway
+        http_app.setup_indexes()
+    # Indexes are applied before the check either way
+    assert database['notebooks'].created
+
+    monkeypatch.setenv('DB_INDEXES', 'off')
+    database.clear()
+    http_app.setup_indexes()
+    assert not database
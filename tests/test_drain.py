@@ -0,0 +1,89 @@
+import threading
+
+from conftest import wait_until
+from drain import DrainController
+from session_lifecycle import SessionLifecycle
+from session_registry import CLOSED, OPEN, SessionRegistry
+from transcription_backends import FakeBackend, FakeEngine
+
+
+def make_drain(timeout, latency=0.05, delivered=None, exit=None):
+    registry = SessionRegistry()
+    backend = FakeBackend(FakeEngine(latency=latency, bytes_per_second=1000))
+    opened = []
+
+    def connect(session_id):
+        connection = backend.create_connection(session_id)
+        connection.bind(on_transcript=delivered.append if delivered is not None else None,
+                        on_close=lambda: lifecycle.connection_closed(session_id, connection))
+        connection.start()
+        opened.append(connection)
+        return connection
+
+    lifecycle = SessionLifecycle(registry, connect, lambda event, data, sid: None, close_timeout=2.0)
+    exited = threading.Event()
+    notified = []
+    drain = DrainController(registry, lifecycle, exit=exit or exited.set, notify=notified.append, timeout=timeout,
+                            grace=2.0, flush=0.0, poll=0.02)
+    return drain, registry, lifecycle, opened, exited, notified
+
+
+def test_drain_stops_sessions_at_the_deadline():
+    drain, registry, lifecycle, opened, exited, notified = make_drain(timeout=0.2)
+    registry.bind_socket('sid-1', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        assert wait_until(lambda: lifecycle.state('session-a') == OPEN)
+
+        assert drain.start('test')
+        assert not drain.accepting()
+        assert not drain.start('again')
+        assert drain.status()['phase'] == 'waiting'
+
+        assert exited.wait(3)
+        assert notified == ['session-a']
+        assert lifecycle.state('session-a') == CLOSED
+        assert not opened[0].is_open
+        assert drain.status()['phase'] == 'done' and drain.status()['forced_stops'] == 1
+    finally:
+        lifecycle.shutdown()
+
+
+def test_drain_exits_early_when_sessions_finish():
+    drain, registry, lifecycle, opened, exited, notified = make_drain(timeout=10)
+    registry.bind_socket('sid-1', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        assert wait_until(lambda: lifecycle.state('session-a') == OPEN)
+        drain.start('test')
+        lifecycle.stop('session-a', 'sid-1')
+
+        assert exited.wait(3)
+        assert notified == []
+        assert drain.status()['forced_stops'] == 0
+    finally:
+        lifecycle.shutdown()
+
+
+def test_late_final_transcript_is_delivered_before_exit():
+    delivered = []
+    at_exit = []
+    exited = threading.Event()
+
+    def exit():
+        at_exit.extend(delivered)
+        exited.set()
+
+    # The final transcript of the audio sent so far only comes after the finish
+    drain, registry, lifecycle, opened, _, _ = make_drain(timeout=0.1, latency=0.3, delivered=delivered, exit=exit)
+    registry.bind_socket('sid-1', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        assert wait_until(lambda: lifecycle.state('session-a') == OPEN)
+        opened[0].send(b'\0' * 500)
+        drain.start('test')
+
+        assert exited.wait(3)
+        assert [result.is_final for result in at_exit] == [True]
+    finally:
+        lifecycle.shutdown()
@@ -0,0 +1,65 @@
+from idle_reaper import IdleReaper
+from relay_metrics import RelayMetrics
+
+
+def test_reaps_only_idle_sessions():
+    activity = {'a': 100.0, 'b': 100.0, 'c': 100.0}
+    reaped = []
+
+    def on_idle(session_id, idle_seconds):
+        reaped.append(session_id)
+        del activity[session_id]
+        return True
+
+    reaper = IdleReaper(activity.get, on_idle, timeout=60)
+    for session_id in activity:
+        reaper.track(session_id, now=100.0)
+
+    # Activity never touches the reaper, the deadline is corrected when it comes due
+    activity['b'] = 150.0
+    assert reaper.reap(now=170.0) == 2
+    assert sorted(reaped) == ['a', 'c']
+    assert reaper.stats()['last_reaped'] == 2
+    assert len(reaper) == 1
+
+    assert reaper.reap(now=205.0) == 0
+    assert reaper.reap(now=215.0) == 1
+    assert reaped[-1] == 'b'
+    assert reaper.stats()['reaped'] == 3 and len(reaper) == 0
+
+
+def test_session_with_sockets_is_checked_again_later():
+    activity = {'a': 0.0}
+    calls = []
+
+    def on_idle(session_id, idle_seconds):
+        calls.append(idle_seconds)
+        return False
+
+    reaper = IdleReaper(activity.get, on_idle, timeout=10)
+    reaper.track('a', now=0.0)
+
+    assert reaper.reap(now=11.0) == 0
+    assert calls == [11.0]
+    # Not retried before another timeout has passed
+    assert reaper.reap(now=15.0) == 0
+    assert reaper.reap(now=21.5) == 0
+    assert calls == [11.0, 21.5]
+
+
+def test_reap_counts_are_exported_as_metrics():
+    activity = {'a': 0.0, 'b': 0.0, 'c': 50.0}
+    reaper = IdleReaper(activity.get, lambda session_id, idle_seconds: activity.pop(session_id) is not None, timeout=60)
+    for session_id in activity:
+        reaper.track(session_id, now=0.0)
+    metrics = RelayMetrics()
+    metrics.collector(reaper.gauges)
+
+    reaper.reap(now=70.0)
+    reaper.reap(now=115.0)
+    lines = metrics.render().splitlines()
+    assert '# TYPE relay_idle_reaped_last_tick gauge' in lines
+    assert 'relay_idle_reaped_sessions 3' in lines
+    assert 'relay_idle_reaped_last_tick 1' in lines
+    assert 'relay_idle_reaped_max_tick 2' in lines
+    assert 'relay_idle_sessions_tracked 0' in lines
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+import socketio
+
+from session_affinity import owner_index
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def free_port_range(count):
+    while True:
+        base = free_port()
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as sock:
+                    sock.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+
+
+def wait_for_port(port, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def session_owned_by(worker, workers):
+    index = 0
+    while owner_index(f'multi-{index}', workers) != worker:
+        index += 1
+    return f'multi-{index}'
+
+
+async def watch_session(base_url, port, session_id, audio_seconds, bytes_per_second):
+    producer = socketio.AsyncClient(reconnection=False)
+    viewer = socketio.AsyncClient(reconnection=False)
+    intruder = socketio.AsyncClient(reconnection=False)
+    ready = asyncio.Event()
+    seen = asyncio.Event()
+    viewed = []
+    errors = []
+    producer.on('deepgram_ready', lambda data: ready.set())
+
+    def on_update(data):
+        viewed.append(data)
+        seen.set()
+
+    viewer.on('transcription_update', on_update)
+    intruder.on('connection_error', lambda data: errors.append(data))
+
+    query = f'?userId={session_id}'
+    await producer.connect(f'{base_url}:{port}{query}', transports=['websocket'])
+    await viewer.connect(f'{base_url}:{port + 1}{query}', transports=['websocket'])
+    await intruder.connect(f'{base_url}:{port + 1}{query}', transports=['websocket'])
+    try:
+        # Starting the session on a worker that does not own it is refused
+        await intruder.emit('toggle_transcription', {'action': 'start'})
+        await producer.emit('toggle_transcription', {'action': 'start'})
+        await asyncio.wait_for(ready.wait(), 10)
+        for _ in range(int(audio_seconds * 4)):
+            await producer.emit('audio_stream', b'\0' * (bytes_per_second // 4))
+            await asyncio.sleep(0.05)
+        await asyncio.wait_for(seen.wait(), 10)
+    finally:
+        for client in (producer, viewer, intruder):
+            await client.disconnect()
+    return viewed, errors
+
+
+@pytest.mark.parametrize('mode', ['threading', 'asyncio'])
+def test_transcripts_reach_viewers_on_other_workers(mode):
+    port = free_port_range(2)
+    queue_port = free_port()
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=mode, TRANSCRIPTION_BACKEND='fake', FAKE_ENGINE_BYTES_PER_SECOND='4000',
+               FAKE_ENGINE_RTF='0.1', FAKE_ENGINE_LATENCY='0.05', DRAIN_TIMEOUT='2')
+    process = subprocess.Popen(
+        [sys.executable, 'run_workers.py', '--workers', '2', '--port', str(port),
+         '--queue', f'ipc://127.0.0.1:{queue_port}'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        assert wait_for_port(port) and wait_for_port(port + 1), "Workers did not start"
+        session_id = session_owned_by(0, 2)
+
+        # Any worker can tell where the session lives
+        with urllib.request.urlopen(f'http://127.0.0.1:{port + 1}/affinity?userId={session_id}') as response:
+            assert json.load(response) == {'url': f'http://127.0.0.1:{port}', 'worker': 0}
+
+        viewed, errors = asyncio.run(watch_session('http://127.0.0.1', port, session_id, 2, 4000))
+        assert viewed and viewed[0]['transcription']
+        assert errors and errors[0]['url'] == f'http://127.0.0.1:{port}'
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,155 @@
+import datetime
+import threading
+
+from bson.objectid import ObjectId
+
+from notebook_cache import LocalCache, NotebookCache, RedisCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """The redis.Redis commands RedisCache uses, with Redis 7 SET semantics"""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append('GET')
+        return self.data.get(key, (None,))[0]
+
+    def set(self, key, value, ex=None, nx=False, get=False):
+        self.commands.append('SET')
+        current = self.data.get(key, (None,))[0]
+        if not (nx and current is not None):
+            self.data[key] = (value, ex)
+        return current if get else True
+
+    def info(self, section):
+        return {'evicted_keys': 0, 'expired_keys': 0}
+
+
+def test_reads_are_cached_until_the_user_writes():
+    cache = NotebookCache(LocalCache())
+    note = {'_id': ObjectId(), 'title': 'Note', 'updatedAt': datetime.datetime(2025, 4, 13, 8, 30)}
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [dict(note)]
+
+    assert cache.read('notebooks', 'u1', 'all', load) == [note]
+    cached = cache.read('notebooks', 'u1', 'all', load)
+    # Values come back with their BSON types, as a fresh copy
+    assert cached == [note] and cached[0] is not note and len(loads) == 1
+
+    # Another user's write leaves the entry alone, the owner's does not
+    cache.invalidate('notebooks', 'u2')
+    cache.read('notebooks', 'u1', 'all', load)
+    assert len(loads) == 1
+    cache.invalidate('notebooks', 'u1')
+    cache.read('notebooks', 'u1', 'all', load)
+    assert len(loads) == 2
+
+    # Missing notes are not cached
+    assert cache.read('notebooks', 'u1', 'note:x', lambda: None) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (2, 3, 2)
+
+
+def test_local_cache_evicts_by_age_count_and_size():
+    clock = Clock()
+    cache = LocalCache(max_entries=3, max_bytes=100, clock=clock)
+    cache.set('a', b'1', ttl=10)
+    clock.now = 11
+    assert cache.get('a') is None and cache.stats()['expirations'] == 1
+
+    for key in ('a', 'b', 'c'):
+        cache.set(key, b'1')
+    cache.get('a')
+    cache.set('d', b'1')
+    # 'b' was the least recently used
+    assert cache.get('b') is None and cache.get('a') == b'1'
+
+    cache.set('big', b'x' * 90)
+    assert cache.stats()['bytes'] <= 100
+    assert cache.get('big') == b'x' * 90
+    assert cache.stats()['evictions'] >= 2
+    # Values larger than the whole cache are not stored
+    cache.set('huge', b'x' * 200)
+    assert cache.get('huge') is None
+
+
+def test_generation_is_a_stable_validator_until_a_write():
+    clock = Clock()
+    cache = NotebookCache(LocalCache(clock=clock), ttl=60)
+    etag = cache.generation('notebooks', 'u1')
+    cache.read('notebooks', 'u1', 'all', lambda: [])
+    assert cache.generation('notebooks', 'u1') == etag
+    assert cache.generation('notebooks', 'u2') != etag
+
+    cache.invalidate('notebooks', 'u1')
+    changed = cache.generation('notebooks', 'u1')
+    assert changed != etag
+    # The token expires with the entries it labels
+    clock.now = 61
+    assert cache.generation('notebooks', 'u1') not in (etag, changed)
+
+
+def test_redis_add_is_a_single_command():
+    client = FakeRedis()
+    cache = RedisCache(None, client=client)
+    assert cache.add('k', b'first', ttl=60.0) == b'first'
+    assert cache.add('k', b'second', ttl=60.0) == b'first'
+    # No separate read after the SET, which another worker's add or an expiry could race
+    assert client.commands == ['SET', 'SET']
+    assert client.data['k'] == (b'first', 60)
+
+
+def test_redis_cache_is_shared_between_workers():
+    client = FakeRedis()
+    workers = [NotebookCache(RedisCache(None, client=client)) for _ in range(2)]
+    note = {'_id': ObjectId(), 'updatedAt': datetime.datetime(2025, 4, 13, 8, 30)}
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [note]
+
+    assert workers[0].generation('notebooks', 'u1') == workers[1].generation('notebooks', 'u1')
+    workers[0].read('notebooks', 'u1', 'all', load)
+    assert workers[1].read('notebooks', 'u1', 'all', load) == [note] and len(loads) == 1
+
+    # A write on one worker is seen by the other
+    before = workers[1].generation('notebooks', 'u1')
+    workers[0].invalidate('notebooks', 'u1')
+    assert workers[1].generation('notebooks', 'u1') != before
+    workers[1].read('notebooks', 'u1', 'all', load)
+    assert len(loads) == 2
+    assert workers[1].stats()['hits'] == 1
+
+
+def test_counters_are_exact_under_concurrent_reads():
+    cache = NotebookCache(LocalCache())
+
+    def read():
+        for index in range(500):
+            cache.read('notebooks', 'u1', f'note:{index % 10}', lambda: [index])
+            if index % 100 == 0:
+                cache.invalidate('notebooks', 'u1')
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 500
+    assert stats['invalidations'] == 8 * 5
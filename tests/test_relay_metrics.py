@@ -0,0 +1,72 @@
+import threading
+
+from relay_metrics import RelayMetrics
+from replay_window import ReplayWindow
+
+
+def test_counts_from_all_threads_are_summed():
+    metrics = RelayMetrics()
+    metrics.counter('packets_total', 'Packets')
+    metrics.histogram('send_seconds', 'Send time', buckets=(0.01, 0.1))
+
+    def record():
+        for _ in range(1000):
+            metrics.inc('packets_total')
+        metrics.observe('send_seconds', 0.05)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.inc('packets_total', 5)
+    metrics.observe('send_seconds', 1.0)
+
+    # Counts of finished threads are kept in the totals
+    for _ in range(2):
+        lines = metrics.render().splitlines()
+        assert 'relay_packets_total 4005' in lines
+        assert 'relay_send_seconds_bucket{le="0.01"} 0' in lines
+        assert 'relay_send_seconds_bucket{le="0.1"} 4' in lines
+        assert 'relay_send_seconds_bucket{le="+Inf"} 5' in lines
+        assert 'relay_send_seconds_count 5' in lines
+        assert '# TYPE relay_send_seconds histogram' in lines
+
+
+def test_short_lived_threads_do_not_grow_memory():
+    # Threading-mode Socket.IO runs every event on a new thread
+    metrics = RelayMetrics(stripes=4)
+    metrics.counter('packets_total', 'Packets')
+    metrics.histogram('send_seconds', 'Send time', buckets=(0.01,))
+    for _ in range(500):
+        thread = threading.Thread(target=lambda: (metrics.inc('packets_total'), metrics.observe('send_seconds', 0.001)))
+        thread.start()
+        thread.join()
+
+    # Nothing scraped in between, yet the stripes are all there is
+    assert len(metrics._shards) == 4
+    assert sum(len(shard.counters) for shard in metrics._shards) <= 4
+    total = metrics.snapshot()
+    assert total.counters['packets_total'] == 500
+    assert total.histograms['send_seconds'][0] == 500
+
+
+def test_collectors_export_gauges():
+    metrics = RelayMetrics(prefix='test')
+    metrics.collector(lambda: [
+        ('active_sessions', 'Sessions', 3),
+        ('queue_depth', 'Depth per session', {'a': 1, 'b"c': 2}, 'session'),
+    ])
+    lines = metrics.render().splitlines()
+    assert '# TYPE test_active_sessions gauge' in lines
+    assert 'test_active_sessions 3' in lines
+    assert 'test_queue_depth{session="a"} 1' in lines
+    assert 'test_queue_depth{session="b\\"c"} 2' in lines
+
+
+def test_replay_window_reports_when_audio_was_sent():
+    window = ReplayWindow(bytes_per_second=1000)
+    window.append(b'\0' * 500, now=10.0)
+    window.append(b'\0' * 500, now=10.5)
+    assert window.arrival_time(0.2) == 10.0
+    assert window.arrival_time(0.9) == 10.5
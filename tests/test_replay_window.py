@@ -0,0 +1,57 @@
+from replay_window import ReplayWindow
+
+
+def test_tail_starts_after_covered_audio():
+    # 1000 bytes per second of raw PCM: offsets are exact
+    window = ReplayWindow(max_seconds=10, bytes_per_second=1000)
+    for index in range(6):
+        window.append(bytes([index]) * 500)
+    window.cover(1.0)
+
+    start, packets = window.tail()
+    assert start == 1.0
+    assert [packet[0] for packet in packets] == [2, 3, 4, 5]
+
+    # Results for the replayed audio that were already delivered are dropped
+    assert window.is_duplicate(1.0)
+    assert not window.is_duplicate(1.5)
+    assert window.stats()['duplicates_dropped'] == 1
+
+
+def test_container_header_is_replayed_first():
+    window = ReplayWindow(max_seconds=1.0)
+    window.append(b'header', now=100.0)
+    for index in range(1, 6):
+        window.append(b'chunk%d' % index, now=100.0 + index * 0.5)
+    window.cover(1.2)
+
+    start, packets = window.tail()
+    # Packets older than max_seconds are gone, but the header is kept
+    assert start == 1.5
+    assert packets == [b'header', b'chunk3', b'chunk4', b'chunk5']
+
+    window.reset()
+    assert window.tail() == (0.0, [])
+
+
+def test_reset_switches_the_stream_encoding():
+    # 16 kHz PCM, placed by byte count
+    window = ReplayWindow(max_seconds=10, bytes_per_second=32000)
+    window.append(b'\0' * 32000, now=100.0)
+    window.cover(1.0)
+
+    # The next recording sends containerized audio: placed by arrival time
+    window.reset(None)
+    window.append(b'header', now=200.0)
+    window.append(b'chunk', now=203.0)
+    # The chunk sits 3 s into the stream, past the header
+    assert window.arrival_time(1.0) == 200.0
+    assert window.arrival_time(3.0) == 203.0
+    assert window.tail() == (0.0, [b'header', b'chunk'])
+
+    # And back to PCM at another rate
+    window.reset(16000)
+    window.append(b'\0' * 8000, now=300.0)
+    window.append(b'\0' * 8000, now=300.1)
+    assert window.end == 1.0
+    assert window.tail() == (0.0, [b'\0' * 8000, b'\0' * 8000])
@@ -0,0 +1,123 @@
+import threading
+
+from admission import AdmissionController
+from conftest import wait_until
+from session_lifecycle import SessionLifecycle
+from session_registry import CLOSED, CONNECTING, IDLE, OPEN, SessionRegistry
+from transcription_backends import FakeBackend, FakeEngine
+
+
+def make_lifecycle(engine, gate=None):
+    registry = SessionRegistry()
+    backend = FakeBackend(engine)
+    opened = []
+    emitted = []
+
+    def connect(session_id):
+        if gate is not None:
+            gate.wait(2)
+        connection = backend.create_connection(session_id)
+        connection.bind(on_close=lambda: lifecycle.connection_closed(session_id, connection))
+        if not connection.start():
+            return None
+        opened.append(connection)
+        return connection
+
+    lifecycle = SessionLifecycle(registry, connect, lambda event, data, sid: emitted.append((event, data, sid)))
+    return lifecycle, registry, opened, emitted
+
+
+def test_concurrent_starts_share_one_setup():
+    gate = threading.Event()
+    lifecycle, registry, opened, emitted = make_lifecycle(FakeEngine(), gate)
+    registry.bind_socket('sid-1', 'session-a')
+    registry.bind_socket('sid-2', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        lifecycle.start('session-a', 'sid-2')
+        assert lifecycle.state('session-a') == CONNECTING
+
+        gate.set()
+        assert wait_until(lambda: len(emitted) == 2)
+        assert len(opened) == 1
+        assert lifecycle.state('session-a') == OPEN
+        assert sorted(sid for event, _, sid in emitted if event == 'deepgram_ready') == ['sid-1', 'sid-2']
+    finally:
+        lifecycle.shutdown()
+
+
+def test_stop_during_setup_discards_stale_connection():
+    gate = threading.Event()
+    lifecycle, registry, opened, emitted = make_lifecycle(FakeEngine(), gate)
+    registry.bind_socket('sid-1', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        lifecycle.stop('session-a', 'sid-1')
+        assert lifecycle.state('session-a') == CLOSED
+        assert emitted == [('deepgram_stopped', {'status': 'stopped'}, 'sid-1')]
+
+        gate.set()
+        assert wait_until(lambda: opened and not opened[0].is_open), "Stale connection was not finished"
+        assert registry.get_state('session-a') == (CLOSED, None)
+        assert len(emitted) == 1
+    finally:
+        lifecycle.shutdown()
+
+
+def test_failed_setup_returns_to_idle():
+    lifecycle, registry, opened, emitted = make_lifecycle(FakeEngine(start_failure_rate=1.0))
+    registry.bind_socket('sid-1', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1', failure_event='connection_lost')
+        assert wait_until(lambda: emitted)
+        assert emitted[0][0] == 'connection_lost'
+        assert lifecycle.state('session-a') == IDLE
+        # The one-shot auto-create can fire again
+        assert registry.warn_once('session-a')
+    finally:
+        lifecycle.shutdown()
+
+
+def test_dropped_connection_is_replaced():
+    lifecycle, registry, opened, emitted = make_lifecycle(FakeEngine(drop_after=1.0))
+    lifecycle.reconnect_attempts = 3
+    lifecycle.backoff_base = 0.01
+    reconnects = []
+    lifecycle.on_reconnect = lambda session_id, old, new, gap: reconnects.append((old, new, gap))
+    registry.bind_socket('sid-1', 'session-a')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        assert wait_until(lambda: lifecycle.state('session-a') == OPEN)
+        first = opened[0]
+        # A second of audio makes the fake engine drop the stream
+        first.send(b'\0' * 4000)
+
+        assert wait_until(lambda: reconnects)
+        old, new, gap = reconnects[0]
+        assert old is first and new is opened[1]
+        assert gap >= 0
+        assert registry.get_state('session-a') == (OPEN, new)
+        # The client only saw the original deepgram_ready
+        assert [event for event, _, _ in emitted] == ['deepgram_ready']
+    finally:
+        lifecycle.shutdown()
+
+
+def test_starts_over_the_cap_wait_for_a_slot():
+    lifecycle, registry, opened, emitted = make_lifecycle(FakeEngine())
+    lifecycle.admission = AdmissionController(max_connections=1)
+    registry.bind_socket('sid-1', 'session-a')
+    registry.bind_socket('sid-2', 'session-b')
+    try:
+        lifecycle.start('session-a', 'sid-1')
+        lifecycle.start('session-b', 'sid-2')
+        assert wait_until(lambda: lifecycle.state('session-a') == OPEN)
+        assert lifecycle.state('session-b') == CONNECTING
+
+        # Finishing session-a's connection hands its slot to session-b
+        lifecycle.stop('session-a')
+        assert wait_until(lambda: lifecycle.state('session-b') == OPEN)
+        assert len(opened) == 2
+        assert lifecycle.admission.stats()['active'] == 1
+    finally:
+        lifecycle.shutdown()
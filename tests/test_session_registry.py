@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from session_registry import SessionRegistry, SessionRegistryFull
+
+
+def test_reverse_index_tracks_sockets():
+    registry = SessionRegistry(stripes=4)
+    registry.bind_socket('sid-1', 'session-a')
+    registry.bind_socket('sid-2', 'session-a')
+    registry.bind_socket('sid-3', 'session-b')
+
+    assert set(registry.sockets_for_session('session-a')) == {'sid-1', 'sid-2'}
+    assert registry.session_for_socket('sid-3') == 'session-b'
+
+    # Rebinding a socket moves it to the new session
+    registry.bind_socket('sid-2', 'session-b')
+    assert registry.sockets_for_session('session-a') == ('sid-1',)
+    assert set(registry.sockets_for_session('session-b')) == {'sid-2', 'sid-3'}
+
+    assert registry.unbind_socket('sid-1') == ('session-a', 0)
+    assert registry.unbind_socket('unknown') == (None, 0)
+
+
+def test_empty_records_are_dropped():
+    registry = SessionRegistry(stripes=4)
+    registry.bind_socket('sid-1', 'session-a')
+    registry.set_connection('session-a', object())
+    registry.unbind_socket('sid-1')
+
+    # Connection keeps the record alive until it is popped
+    assert registry.stats()['sessions'] == 1
+    assert registry.pop_connection('session-a') is not None
+    assert registry.stats()['sessions'] == 0
+    assert registry.stats()['sockets'] == 0
+
+
+def test_max_sessions_bound():
+    registry = SessionRegistry(stripes=4, max_sessions=2)
+    registry.bind_socket('sid-1', 'session-a')
+    registry.bind_socket('sid-2', 'session-b')
+    with pytest.raises(SessionRegistryFull):
+        registry.bind_socket('sid-3', 'session-c')
+
+    # Existing sessions can still take more sockets
+    registry.bind_socket('sid-3', 'session-a')
+    assert len(registry.sockets_for_session('session-a')) == 2
+
+
+def test_inactive_sessions_and_warn_once():
+    registry = SessionRegistry(stripes=4)
+    registry.set_connection('session-a', object())
+    registry.set_connection('session-b', object())
+    registry.touch('session-a', now=100.0)
+    registry.touch('session-b', now=190.0)
+
+    assert registry.inactive_sessions(60, now=200.0) == [('session-a', 100.0)]
+
+    assert registry.warn_once('session-a') is True
+    assert registry.warn_once('session-a') is False
+
+
+def test_concurrent_binds():
+    registry = SessionRegistry(stripes=8)
+
+    def worker(n):
+        for i in range(200):
+            registry.bind_socket(f'sid-{n}-{i}', f'session-{i % 10}')
+        for i in range(200):
+            registry.unbind_socket(f'sid-{n}-{i}')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert registry.stats()['sessions'] == 0
+    assert registry.stats()['sockets'] == 0
@@ -0,0 +1,56 @@
+import json
+import logging
+import threading
+
+from structured_logging import EventSampler, JsonFormatter, RateLimitFilter, SessionFilter, bind_session
+
+
+def make_record(msg, *args, **extra):
+    record = logging.LogRecord('relay', logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampler_lets_one_in_n_through():
+    sampler = EventSampler({'audio_packet': 50, 'muted': 0})
+    assert sum(sampler.due('audio_packet') for _ in range(500)) == 10
+    assert not any(sampler.due('muted') for _ in range(10))
+    assert all(sampler.due('unsampled') for _ in range(10))
+
+
+def test_rate_limit_is_per_template_and_session():
+    limit = RateLimitFilter(rate=0.001, burst=2)
+    assert [limit.filter(make_record("Error for %s", 'a', session_id='a')) for _ in range(4)] == [True, True, False, False]
+    # Another session, or another message, has its own budget
+    assert limit.filter(make_record("Error for %s", 'b', session_id='b'))
+    assert limit.filter(make_record("Other error", session_id='a'))
+    assert limit.suppressed == 2
+
+    # Errors always get through
+    error = make_record("Error for %s", 'a', session_id='a')
+    error.levelno = logging.ERROR
+    assert all(limit.filter(error) for _ in range(4))
+    assert limit.suppressed == 2
+
+
+def test_json_records_carry_the_bound_session():
+    records = []
+
+    def handler():
+        bind_session('s1')
+        record = make_record("Transcript: %.5s...", 'hello world', bytes=12)
+        SessionFilter().filter(record)
+        records.append(record)
+
+    thread = threading.Thread(target=handler)
+    thread.start()
+    thread.join()
+    entry = json.loads(JsonFormatter().format(records[0]))
+    assert entry['message'] == 'Transcript: hello...'
+    assert entry['session_id'] == 's1' and entry['bytes'] == 12
+    assert entry['level'] == 'INFO' and entry['logger'] == 'relay'
+
+    # Nothing is bound on this thread
+    record = make_record("No session")
+    SessionFilter().filter(record)
+    assert not hasattr(record, 'session_id')
@@ -0,0 +1,26 @@
+import time
+
+from transcript_batcher import TranscriptBatcher
+
+
+def test_batcher_groups_events_within_window():
+    singles, batches = [], []
+    batcher = TranscriptBatcher(singles.append, batches.append, window=0.05)
+    for i in range(3):
+        batcher.add({'transcription': str(i)})
+    assert singles == [] and batches == []
+    time.sleep(0.15)
+    assert batches == [[{'transcription': '0'}, {'transcription': '1'}, {'transcription': '2'}]]
+
+    # A lone event goes out as a plain update, close() flushes it early
+    batcher.add({'transcription': '3'})
+    batcher.close()
+    assert singles == [{'transcription': '3'}]
+    assert batcher.stats() == {'events': 4, 'messages': 2}
+
+
+def test_batcher_without_window_sends_immediately():
+    singles, batches = [], []
+    batcher = TranscriptBatcher(singles.append, batches.append)
+    batcher.add({'transcription': 'a'})
+    assert singles == [{'transcription': 'a'}] and batches == []
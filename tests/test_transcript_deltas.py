@@ -0,0 +1,51 @@
+import time
+
+from transcript_deltas import TranscriptDeltas
+from transcription_backends import TranscriptResult
+
+
+def apply(state, payload):
+    """Client side: apply a delta to (committed, hypothesis)"""
+    committed, hypothesis = state
+    hypothesis = hypothesis[:payload['offset']] + payload['transcription']
+    if payload['is_final']:
+        return (committed + ' ' + hypothesis).strip(), ''
+    return committed, hypothesis
+
+
+def test_deltas_replace_from_offset_and_finals_commit():
+    sent = []
+    deltas = TranscriptDeltas(sent.append, min_interval=0.0)
+    deltas.push(TranscriptResult('hello', is_final=False))
+    deltas.push(TranscriptResult('hello wor', is_final=False))
+    deltas.push(TranscriptResult('hello world', is_final=False))
+    deltas.push(TranscriptResult('hello world', is_final=False))  # Unchanged, not re-sent
+    deltas.push(TranscriptResult('hello, world.', is_final=True))
+    deltas.push(TranscriptResult('next', is_final=False))
+
+    assert [(p['offset'], p['transcription'], p['is_final']) for p in sent] == [
+        (0, 'hello', False), (5, ' wor', False), (9, 'ld', False), (5, ', world.', True), (0, 'next', False),
+    ]
+    state = ('', '')
+    for payload in sent:
+        state = apply(state, payload)
+    assert state == ('hello, world.', 'next')
+
+
+def test_interims_are_rate_limited_and_final_supersedes_pending():
+    sent = []
+    deltas = TranscriptDeltas(sent.append, min_interval=0.1)
+    deltas.push(TranscriptResult('a', is_final=False))
+    deltas.push(TranscriptResult('ab', is_final=False))
+    deltas.push(TranscriptResult('abc', is_final=False))
+    assert len(sent) == 1
+    time.sleep(0.3)
+    # The newest pending interim went out when the interval was up
+    assert [p['transcription'] for p in sent] == ['a', 'bc']
+
+    deltas.push(TranscriptResult('abcd', is_final=False))
+    deltas.push(TranscriptResult('abcde', is_final=False))  # Held back
+    deltas.push(TranscriptResult('abcdef', is_final=True))
+    time.sleep(0.2)
+    assert [(p['offset'], p['transcription'], p['is_final']) for p in sent[2:]] == [(3, 'd', False), (4, 'ef', True)]
+    assert deltas.stats() == {'interim_received': 5, 'interim_sent': 3, 'finals_sent': 1}
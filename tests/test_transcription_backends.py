@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+import pytest
+
+from transcription_backends import (
+    AsyncTranscriptionConnection, FakeBackend, FakeConnection, FakeEngine, LoopBackend, TranscriptResult
+)
+
+
+def collect(connection):
+    events = []
+    closed = threading.Event()
+    connection.bind(
+        on_open=lambda: events.append(('open',)),
+        on_transcript=lambda result: events.append(('transcript', result)),
+        on_error=lambda error: events.append(('error', error)),
+        on_close=lambda: (events.append(('close',)), closed.set()),
+    )
+    return events, closed
+
+
+def test_fake_engine_emits_canned_transcripts():
+    engine = FakeEngine(real_time_factor=0.0, latency=0.01, segment_seconds=1.0,
+                        bytes_per_second=1000, transcripts=['hello world', 'second line'])
+    connection = FakeBackend(engine).create_connection('session-a')
+    events, closed = collect(connection)
+
+    assert connection.start() is True
+    for _ in range(5):
+        connection.send(b'\0' * 500)  # 2.5 seconds of audio
+    assert connection.finish() is True
+    assert closed.wait(2), "Fake connection never closed"
+
+    transcripts = [event[1] for event in events if event[0] == 'transcript']
+    assert [t.text for t in transcripts] == ['hello world', 'second line', 'hello world']
+    assert [t.start for t in transcripts] == [0.0, 1.0, 2.0]
+    assert transcripts[-1].duration == 0.5
+    assert events[0] == ('open',)
+    assert events[-1] == ('close',)
+
+
+def test_fake_engine_failure_injection():
+    engine = FakeEngine(start_failure_rate=1.0)
+    assert FakeBackend(engine).create_connection('session-a').start() is False
+
+    engine = FakeEngine(real_time_factor=0.0, latency=0.0, bytes_per_second=1000, drop_after=1.0)
+    connection = FakeBackend(engine).create_connection('session-b')
+    events, closed = collect(connection)
+    connection.start()
+    connection.send(b'\0' * 1000)
+    assert closed.wait(2), "Injected drop did not close the connection"
+    assert connection.send(b'\0' * 10) is False
+
+
+def test_fake_engine_is_deterministic_per_session():
+    engine = FakeEngine(seed=7)
+    texts_a = [engine.text_for(i, engine.rng_for('session-a')) for i in range(3)]
+    texts_b = [engine.text_for(i, engine.rng_for('session-a')) for i in range(3)]
+    assert texts_a == texts_b
+
+
+class EchoAsyncConnection(AsyncTranscriptionConnection):
+    """Async connection that reports each chunk it is sent as a transcript, from the loop"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.loop = None
+
+    def bind(self, on_open=None, on_transcript=None, on_metadata=None, on_error=None, on_close=None):
+        self.handlers = dict(open=on_open, transcript=on_transcript, close=on_close)
+
+    async def start(self, options=None):
+        self.loop = asyncio.get_running_loop()
+        await self.handlers['open']()
+        return True
+
+    async def send(self, data):
+        await self.handlers['transcript'](TranscriptResult(data.decode()))
+        return True
+
+    async def keep_alive(self):
+        return True
+
+    async def finish(self):
+        await self.handlers['close']()
+        return True
+
+
+class EchoBackend(FakeBackend):
+    def create_async_connection(self, session_id):
+        return EchoAsyncConnection()
+
+
+def test_loop_backend_runs_async_connections_on_its_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        connection = LoopBackend(EchoBackend(), loop).create_connection('session-a')
+        events, closed = collect(connection)
+
+        assert connection.start() is True
+        assert connection.send(b'hello') is True
+        assert connection.finish() is True
+        assert closed.wait(2)
+        assert connection.connection.loop is loop
+        assert [event[0] for event in events] == ['open', 'transcript', 'close']
+        assert events[1][1].text == 'hello'
+
+        # Blocking on the loop's own thread would deadlock it
+        async def send_from_loop():
+            with pytest.raises(RuntimeError):
+                connection.send(b'late')
+        asyncio.run_coroutine_threadsafe(send_from_loop(), loop).result(2)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(2)
+        loop.close()
+
+
+def test_loop_backend_uses_thread_based_connections_as_they_are():
+    connection = LoopBackend(FakeBackend()).create_connection('session-a')
+    assert isinstance(connection, FakeConnection)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from voice_activity import EnergyVAD
+
+RATE = 16000
+
+
+def pcm(seconds, amplitude, freq=440.0):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * freq * t)).astype('<i2').tobytes()
+
+
+def packets(data, packet_ms=250):
+    size = RATE * 2 * packet_ms // 1000
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_vad_suppresses_silence_but_keeps_preroll_and_hangover():
+    vad = EnergyVAD(sample_rate=RATE, frame_ms=20, threshold_db=-45, preroll_ms=100, hangover_ms=200)
+    speech = pcm(0.5, 0.1)
+    stream = pcm(1.0, 0.0001) + speech + pcm(1.0, 0.0001)
+
+    forwarded = b''.join(vad.process(packet) for packet in packets(stream))
+
+    frame = RATE * 2 * 20 // 1000
+    assert len(forwarded) == len(speech) + 5 * frame + 10 * frame  # preroll + speech + hangover
+    assert speech in forwarded
+    stats = vad.stats()
+    assert stats['total_bytes'] == len(stream)
+    # The last 100ms of silence is still held as pre-roll
+    assert stats['suppressed_bytes'] == len(stream) - len(forwarded) - 5 * frame
+    assert stats['suppressed_fraction'] == 0.64
+
+
+def test_vad_forwards_speech_packets_untouched_and_requests_keepalives():
+    vad = EnergyVAD(sample_rate=RATE, hangover_ms=0, keepalive_interval=5.0)
+    packet = pcm(0.24, 0.1)  # A whole number of 20ms frames
+    assert vad.process(packet) is packet
+
+    silence = pcm(0.24, 0.0)
+    for _ in range(10):
+        assert vad.process(silence) == b''
+    assert not vad.keepalive_due()
+    assert vad.keepalive_due(now=vad._last_upstream + 5.0)
+    assert not vad.keepalive_due(now=vad._last_upstream + 1.0)